@@ -1,10 +1,25 @@
 # meal_plan/ai_recommender.py
+import contextvars
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import joblib
 import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
-import pulp
+from django.conf import settings
+
+from .catalog_store import open_store, store_version
+from .derived_columns import MEAL_TYPES, meal_type_codes, meal_type_names, parse_servings_array
+from .dietary_index import DietaryIndex, recipe_bits
+from .ingredient_index import INGREDIENT_COLUMN, IngredientIndex, normalize_ingredient, tokenize_ingredients
+from .instrumentation import span
+from .recipe_catalog import RecipeCatalog, is_catalog
+from .plan_solver import MEAL_SLOTS, solve_meal_plan
+from .recommendation_cache import RECOMMENDATION_CACHE, recommendation_key
+from .recommender_service import remote_rank
+from .retrieval import top_k_scores
 
 # ------------------- Dietary Restriction Ingredient Avoidance List -------------------
 
@@ -68,97 +83,213 @@ DIETARY_RESTRICTIONS = {
         "pork", "bacon","shellfish", "bacon", "non-kosher", "meat and dairy","shrimp", "lobster","cheese_with_rennet"
     ],
 }
-def classify_meal_by_calories(cal):
+AI_DATA_PATH = os.path.join(os.path.dirname(__file__), "ai_data.pkl")
+CATALOG_DIR = os.path.join(os.path.dirname(__file__), "recipe_index")
+
+_CATALOG = None
+_CATALOG_LOCK = threading.Lock()
+_CATALOG_CHECKED = 0.0
+# catalog a request started with, see pinned_catalog()
+_PINNED_CATALOG = contextvars.ContextVar("pinned_catalog", default=None)
+
+
+def prepare_recipe_frame(df, tfidf_matrix):
     """
-    Simple nutrition-based meal classification based on calories.
-    Adjust thresholds as needed.
+    Clean the raw recipe table once, at artifact build time:
+    Django-friendly column names, no Food.com placeholder recipes and a
+    MealType column. TF-IDF rows are dropped together with their recipes
+    so row ``i`` of the matrix always describes row ``i`` of the frame.
     """
-    try:
-        cal = float(cal)
-    except:
-        return "Unknown"
-
-    if cal < 200:
-        return "Snack"
-    elif cal < 400:
-        return "Breakfast"
-    elif cal < 700:
-        return "Lunch"
+    df = df.copy()
+    # ✅ Rename columns so Django templates can access them easily
+    df.columns = [c.replace(" ", "_") for c in df.columns]
+
+    # 🔥 Remove all bad recipes with 'Food.com' placeholder instructions
+    if "RecipeInstructions_cleaned" in df.columns:
+        keep = ~(
+            df["RecipeInstructions_cleaned"]
+            .astype(str)
+            .str.lower()
+            .str.contains("food.com", na=False)
+        ).to_numpy()
+        df = df[keep]
+        tfidf_matrix = tfidf_matrix[np.flatnonzero(keep)]
+        print("🚫 Removed Food.com placeholder recipes. Remaining:", len(df))
     else:
-        return "Dinner"
+        print("⚠️ No RecipeInstructions column — skipping filter.")
 
+    # Add meal type classification column
+    df["MealType"] = meal_type_names(meal_type_codes(df["Calories"].to_numpy()))
+    return df.reset_index(drop=True), tfidf_matrix
 
-AI_DATA_PATH = os.path.join(os.path.dirname(__file__), "ai_data.pkl")
 
-try:
-    ART = joblib.load(AI_DATA_PATH)
-    VECTORIZER = ART["vectorizer"]
-    TFIDF_MATRIX = ART["tfidf_matrix"]
-    DF_RECIPES = ART["df"]
+def load_legacy_catalog(path=AI_DATA_PATH):
+    """Build an in-memory catalog from the old single-pickle ai_data.pkl."""
+    art = joblib.load(path)
+    df, matrix = prepare_recipe_frame(art["df"], art["tfidf_matrix"])
+    return RecipeCatalog.from_frame(art["vectorizer"], matrix, df)
 
-    # ✅ Rename columns so Django templates can access them easily
-    DF_RECIPES.columns = [c.replace(" ", "_") for c in DF_RECIPES.columns]
-    print("🧾 Columns in DF_RECIPES:", DF_RECIPES.columns.tolist())
 
-    # 🔥 Remove all bad recipes with 'Food.com' placeholder instructions
-    if "RecipeInstructions_cleaned" in DF_RECIPES.columns:
-        DF_RECIPES = DF_RECIPES[
-            ~DF_RECIPES["RecipeInstructions_cleaned"]
-                .astype(str)
-                .str.lower()
-                .str.contains("food.com", na=False)
-        ].copy()
-        print("🚫 Removed Food.com placeholder recipes. Remaining:", len(DF_RECIPES))
-        # Add meal type classification column
-        if DF_RECIPES is not None:
-            DF_RECIPES["MealType"] = DF_RECIPES["Calories"].apply(classify_meal_by_calories)
+def catalog_dir():
+    return getattr(settings, "RECIPE_CATALOG_DIR", None) or CATALOG_DIR
 
+
+def load_catalog(previous=None, path=None):
+    catalog_dir_ = path or catalog_dir()
+    if is_catalog(catalog_dir_):
+        # base + any delta segments added by `manage.py add_recipes`
+        catalog = open_store(catalog_dir_, previous=previous)
+    elif os.path.exists(AI_DATA_PATH):
+        print("⚠️ No recipe_index found, loading ai_data.pkl into memory. "
+              "Run `manage.py export_recipe_catalog` to build it.")
+        catalog = load_legacy_catalog(AI_DATA_PATH)
     else:
-        print("⚠️ No RecipeInstructions column — skipping filter.")
+        raise FileNotFoundError(catalog_dir_)
+    catalog.load_dietary(DIETARY_RESTRICTIONS)
+    catalog.load_derived()
+    if getattr(settings, "RECIPE_RETRIEVAL", "sparse") == "lsa":
+        # warns and keeps sparse TF-IDF search when the vectors are missing or out of date
+        catalog.load_lsa()
+    catalog.load_ann(getattr(settings, "RECIPE_ANN_NPROBE", 0))
+    return catalog
 
-    print("✅ AI model loaded successfully.")
-except Exception as e:
-    print("⚠️ Failed to load ai_data.pkl:", e)
-    DF_RECIPES = None
+
+def get_catalog():
+    """
+    The recipe catalog, opened on first use instead of at import time.
+    Returns None if no catalog could be loaded.
+    """
+    global _CATALOG
+    pinned = _PINNED_CATALOG.get()
+    if pinned is not None:
+        return pinned
+    if _CATALOG is None:
+        with _CATALOG_LOCK:
+            if _CATALOG is None:
+                try:
+                    _CATALOG = load_catalog()
+                    print("✅ AI model loaded successfully.", len(_CATALOG), "recipes")
+                except Exception as e:
+                    print("⚠️ Failed to load recipe catalog:", e)
+                    return None
+    else:
+        _refresh_catalog()
+    return _CATALOG
+
+
+def _refresh_catalog():
+    """
+    Swap in a newer catalog version (new delta segments or a compaction)
+    at most every RECIPE_CATALOG_POLL_SECONDS. The new version is loaded
+    by one thread while the others keep serving the current one, and is
+    published with a single reference assignment.
+    """
+    global _CATALOG, _CATALOG_CHECKED
+    interval = getattr(settings, "RECIPE_CATALOG_POLL_SECONDS", 30)
+    if not interval or time.monotonic() - _CATALOG_CHECKED < interval:
+        return
+    if not _CATALOG_LOCK.acquire(blocking=False):
+        return
+    try:
+        _CATALOG_CHECKED = time.monotonic()
+        current = _CATALOG
+        version = store_version(catalog_dir())
+        if version is None or version == current.version:
+            return
+        _CATALOG = load_catalog(previous=current)
+        RECOMMENDATION_CACHE.clear()
+        print(f"🔄 Recipe catalog updated to version {version}:", len(_CATALOG), "recipes")
+    except Exception as e:
+        print("⚠️ Failed to reload recipe catalog, keeping the current one:", e)
+    finally:
+        _CATALOG_LOCK.release()
+
+
+@contextmanager
+def pinned_catalog(catalog=None):
+    """
+    Serve everything inside the block from one catalog version, or from
+    ``catalog`` when given (e.g. a synthetic benchmark catalog).
+    """
+    if catalog is None and _PINNED_CATALOG.get() is not None:
+        yield _PINNED_CATALOG.get()
+        return
+    if catalog is None:
+        catalog = get_catalog()
+    token = _PINNED_CATALOG.set(catalog)
+    try:
+        yield catalog
+    finally:
+        _PINNED_CATALOG.reset(token)
+
+
+def __getattr__(name):
+    # Old module-level globals, now resolved lazily from the catalog.
+    if name in ("VECTORIZER", "TFIDF_MATRIX", "DF_RECIPES"):
+        catalog = get_catalog()
+        if catalog is None:
+            return None
+        if name == "VECTORIZER":
+            return catalog.vectorizer
+        if name == "TFIDF_MATRIX":
+            return catalog.matrix
+        # without the long text columns; catalog.details(recipe_id) has those
+        return catalog.compact_frame()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-def recommend_by_pantry(pantry_list, top_k=10):
-    if DF_RECIPES is None:
+def recommend_by_pantry(pantry_list, top_k=10, allowed=None):
+    return recommend_by_pantry_batch([pantry_list], top_k=top_k, allowed=allowed)[0]
+
+
+def recommend_by_pantry_batch(pantry_lists, top_k=10, allowed=None):
+    """
+    One ranked DataFrame per pantry list, scored in a single sparse product.
+    ``allowed`` optionally restricts results to a boolean mask of recipe ids.
+    """
+    catalog = get_catalog()
+    if catalog is None:
         raise ValueError("ai_data.pkl not found or invalid.")
-    pantry_text = " ".join([p.lower() for p in pantry_list])
-    q_vec = VECTORIZER.transform([pantry_text])
-    sims = cosine_similarity(q_vec, TFIDF_MATRIX).flatten()
-    idx = np.argsort(-sims)[:top_k]
-    results = DF_RECIPES.iloc[idx].copy()
-    results["match_score"] = sims[idx]
-    return results.reset_index(drop=True)
+    results = []
+    for ids, scores in catalog.retriever.search_batch(pantry_lists, top_k=top_k, allowed=allowed):
+        recs = catalog.rows(ids)
+        recs["match_score"] = scores
+        results.append(recs)
+    return results
+
+
+def profile_allowed_mask(user):
+    """
+    Catalog-wide mask of recipes compatible with the user's diet and
+    allergies (None when the profile excludes nothing), so restrictions
+    can be applied before retrieval.
+    """
+    profile = getattr(user, "profile", None)
+    catalog = get_catalog()
+    if not profile or catalog is None:
+        return None
+    return catalog.dietary.allowed_mask(profile.dietary_pref, profile.allergy_info)
 
 
 def personalize_results(df_results, user):
     profile = getattr(user, "profile", None)
     if not profile:
         return df_results
-    res = df_results.copy()
-
-    if profile.allergy_info:
-        allergies = [a.strip().lower() for a in profile.allergy_info.split(",")]
-        res = res[~res["RecipeIngredientParts_cleaned"].str.lower().apply(
-            lambda s: any(a in s for a in allergies)
-        )]
-
-
-    # --- 2️⃣ Dietary Restriction Filtering (by ingredient exclusion) ---
-    dietary_pref = (profile.dietary_pref or "").strip().lower()
-    if dietary_pref and dietary_pref != "none":
-        avoid_list = DIETARY_RESTRICTIONS.get(dietary_pref, [])
-        if avoid_list:
-            avoid_pattern = "|".join([f"\\b{a}\\b" for a in avoid_list])
-            res = res[~res["RecipeIngredientParts_cleaned"].str.lower().str.contains(avoid_pattern, na=False)]
 
+    # --- 1️⃣ Allergies + 2️⃣ Dietary Restrictions (precomputed per recipe) ---
+    if "recipe_id" in df_results.columns and get_catalog() is not None:
+        dietary = get_catalog().dietary
+        recipe_ids = df_results["recipe_id"].to_numpy()
+    else:
+        index = IngredientIndex.from_values(df_results["RecipeIngredientParts_cleaned"])
+        dietary = DietaryIndex(DIETARY_RESTRICTIONS, recipe_bits(index, DIETARY_RESTRICTIONS), index)
+        recipe_ids = np.arange(len(df_results))
+    res = df_results[dietary.allowed(recipe_ids, profile.dietary_pref, profile.allergy_info)]
 
-    if profile.goal.lower() == "weight loss":
+    goal = (profile.goal or "").lower()
+    if goal == "weight loss":
         res = res.sort_values(["match_score", "Calories"], ascending=[False, True])
-    elif profile.goal.lower() == "weight gain":
+    elif goal == "weight gain":
         res = res.sort_values(["match_score", "Calories"], ascending=[False, False])
     else:
         res = res.sort_values("match_score", ascending=False)
@@ -170,53 +301,99 @@ def personalize_results(df_results, user):
 def filter_recipes_by_pantry_ingredients(df, pantry_list, saved_recipe_names=None, max_extra=3):
     """
     Filter recipes by pantry ingredients + exclude user-saved recipes.
+    Uses the catalog's ingredient index when rows carry a recipe_id.
     """
-    pantry_set = set(p.lower() for p in pantry_list)
-    saved_recipe_names = set(n.lower() for n in saved_recipe_names) if saved_recipe_names else set()
+    if "recipe_id" in df.columns and get_catalog() is not None:
+        index = get_catalog().ingredients
+        recipe_ids = df["recipe_id"].to_numpy()
+    else:
+        index = IngredientIndex.from_values(df["RecipeIngredientParts_cleaned"])
+        recipe_ids = np.arange(len(df))
+
+    keep = np.isin(recipe_ids, index.match(pantry_list, max_extra=max_extra))
 
-    filtered_rows = []
+    # Exclude recipes user already generated/saved
+    if saved_recipe_names:
+        saved_recipe_names = set(n.lower() for n in saved_recipe_names)
+        keep &= ~df["Name"].str.lower().isin(saved_recipe_names).to_numpy()
 
-    for idx, row in df.iterrows():
+    return df[keep].copy()
 
-        # Exclude recipes user already generated/saved
-        if row["Name"].lower() in saved_recipe_names:
-            continue
 
-        recipe_ings = row["RecipeIngredientParts_cleaned"]
-        if not isinstance(recipe_ings, str):
-            continue
+def strict_match_ids(catalog, pantry_list, max_extra=3, top_k=50, allowed=None):
+    ids = catalog.ingredients.match(pantry_list, max_extra=max_extra)
+    if allowed is not None:
+        ids = ids[allowed[ids]]
+    return top_k_scores(ids, catalog.retriever.score(pantry_list, ids), top_k)
 
-        recipe_set = set(i.strip().lower() for i in recipe_ings.split(",") if i.strip())
 
-        # require all pantry ingredients
-        if not pantry_set.issubset(recipe_set):
-            continue
+def strict_pantry_matches(pantry_list, max_extra=3, top_k=50, allowed=None):
+    """
+    Strict ingredient matching over the whole catalog (not just a TF-IDF
+    shortlist), ranked by pantry similarity.
+    """
+    catalog = get_catalog()
+    if catalog is None:
+        raise ValueError("ai_data.pkl not found or invalid.")
+    ids, scores = strict_match_ids(catalog, pantry_list, max_extra, top_k, allowed)
+    results = catalog.rows(ids)
+    results["match_score"] = scores
+    return results
+
 
-        # allow only a few extra ingredients
-        extra_count = len(recipe_set - pantry_set)
-        if extra_count <= max_extra:
-            filtered_rows.append(idx)
+def rank_pantry(catalog, mode, pantry_list, top_k, max_extra=3, dietary_pref=None, allergy_info=None):
+    """
+    Ranked (ids, scores) for one pantry within the diet/allergy mask:
+    "match" = strict ingredient matches, "search" = similarity only.
+    """
+    allowed = catalog.dietary.allowed_mask(dietary_pref, allergy_info)
+    if mode == "match":
+        return strict_match_ids(catalog, pantry_list, max_extra, top_k, allowed)
+    return catalog.retriever.search(pantry_list, top_k=top_k, allowed=allowed)
 
-    return df.loc[filtered_rows].copy()
+
+def pantry_ranking(user, pantry_list, mode, top_k, max_extra=3):
+    """
+    Ranked (ids, scores) for the user's pantry (see rank_pantry), with
+    diet and allergy restrictions applied before ranking. Asks the
+    recommender server when RECOMMENDER_SOCKET is set, else (or when it
+    is down) ranks in-process.
+    """
+    catalog = get_catalog()
+    if catalog is None:
+        raise ValueError("ai_data.pkl not found or invalid.")
+    profile = getattr(user, "profile", None)
+    diet = profile.dietary_pref if profile else None
+    allergy = profile.allergy_info if profile else None
+    with span("rank", mode=mode) as stage:
+        found = remote_rank(mode, pantry_list, top_k, max_extra, diet, allergy,
+                            n_rows=len(catalog), version=catalog.version)
+        stage.set(backend="local" if found is None else "remote")
+        if found is None:
+            found = rank_pantry(catalog, mode, pantry_list, top_k, max_extra, diet, allergy)
+    return found
+
+
+def pantry_recommendations(user, pantry_list, mode, top_k, max_extra=3):
+    """pantry_ranking as recipe rows."""
+    ids, scores = pantry_ranking(user, pantry_list, mode, top_k, max_extra)
+    return candidate_frame(get_catalog(), ids, scores)
 
 def filter_by_serving_size(df, serving_size, tolerance=1):
     """
     Keep recipes whose serving size is within (serving_size ± tolerance).
-    Uses 'RecipeServings' column from your dataset.
+    Uses the 'Servings' column parsed by build_recipe_index when present,
+    otherwise parses 'RecipeServings' from your dataset.
     """
-    if "RecipeServings" not in df.columns:
+    if "Servings" in df.columns:
+        servings = df["Servings"]
+    elif "RecipeServings" in df.columns:
+        servings = parse_servings_array(df["RecipeServings"].to_numpy(dtype=object))
+    else:
         return df   # skip if column missing
 
     df = df.copy()
-
-    # Convert servings into float safely
-    def parse_serv(v):
-        try:
-            return float(v)
-        except:
-            return None
-
-    df["Servings_clean"] = df["RecipeServings"].apply(parse_serv)
+    df["Servings_clean"] = servings
 
     lower = serving_size - tolerance
     upper = serving_size + tolerance
@@ -224,37 +401,228 @@ def filter_by_serving_size(df, serving_size, tolerance=1):
     return df[df["Servings_clean"].between(lower, upper, inclusive="both")]
 
 
-def generate_ai_meal(user, pantry_items, top_k=10,exclude_names=None,serving_size=None,meal_type=None):
-    exclude_names = set(n.lower() for n in exclude_names) if exclude_names else set()
-    pantry_names = [p.ingredient_name for p in pantry_items]
-    recs = recommend_by_pantry(pantry_names, top_k=50)
-    # Step 2: Strict ingredient matching (your new logic)
-    recs = filter_recipes_by_pantry_ingredients(recs, pantry_names, max_extra=3)
+# ------------------- Row-id pipeline -------------------
+# generate_* keep candidates as (ids, scores) arrays through every filter,
+# reading single catalog columns for those ids; DataFrame rows are built
+# once, for the recipes actually returned (candidate_frame).
+
+def exclude_saved_ids(catalog, ids, scores, exclude_names):
+    """Drop candidates whose name is in ``exclude_names`` (a set of lower-cased names)."""
+    if not exclude_names or not len(ids):
+        return ids, scores
+    keep = np.array([n is None or n.lower() not in exclude_names for n in catalog.take("Name", ids)], dtype=bool)
+    return ids[keep], scores[keep]
 
-    # Step 3: NEW – Remove recipes already saved by the user
-    if exclude_names:
-        recs = recs[~recs["Name"].str.lower().isin(exclude_names)]
-        
 
-    # If too few recipes remain, fall back to similarity only
-    if len(recs) < top_k:
-        recs = recommend_by_pantry(pantry_names, top_k)
+def personalize_ids(catalog, ids, scores, user):
+    """personalize_results for candidate ids: diet/allergy filter, then goal-aware order."""
+    profile = getattr(user, "profile", None)
+    if not profile:
+        return ids, scores
+    keep = catalog.dietary.allowed(ids, profile.dietary_pref, profile.allergy_info)
+    ids, scores = ids[keep], scores[keep]
+
+    goal = (profile.goal or "").lower()
+    if goal in ("weight loss", "weight gain"):
+        calories = np.asarray(catalog.take("Calories", ids), dtype=np.float64)
+        # best match first, ties broken by calories (NaN last)
+        order = np.lexsort((calories if goal == "weight loss" else -calories, -scores))
+    else:
+        order = np.argsort(-scores, kind="stable")
+    return ids[order], scores[order]
+
 
-        # remove saved recipes again
-        if exclude_names:
-            recs = recs[~recs["Name"].str.lower().isin(exclude_names)]
+def recipe_servings(catalog, ids):
+    """Numeric serving sizes of ``ids`` (NaN when unknown), or None if the catalog has none."""
+    if not catalog.derived.has_servings:
+        return None
+    return catalog.derived.servings_of(ids)
 
 
-    recs = personalize_results(recs, user)
-    # ---- SERVING SIZE FILTERING ----
+def serving_size_ids(catalog, ids, scores, serving_size, tolerance=1):
+    """
+    filter_by_serving_size for candidate ids. Also returns the kept
+    serving sizes (None when the catalog has no servings column).
+    """
+    if not catalog.derived.has_servings:
+        return ids, scores, None
+    # catalog-wide mask from the sorted servings index, kept per catalog version
+    keep = catalog.derived.serving_size_mask(serving_size, tolerance)[ids]
+    ids, scores = ids[keep], scores[keep]
+    return ids, scores, recipe_servings(catalog, ids)
+
+
+def candidate_frame(catalog, ids, scores, servings=None, meal_types=None):
+    """Recipe rows for the returned candidates, with the columns the views use."""
+    if meal_types is None:
+        meal_types = catalog.derived.meal_types(ids)
+    extra = {"MealType": meal_types, "match_score": scores}
+    if servings is not None:
+        extra["Servings_clean"] = servings
+    return catalog.rows(ids, extra=extra)
+
+
+def _ranked_candidates(user, pantry_names, top_k, fallback_top_k, min_count, exclude_names):
+    """Strict matches, or similarity search when fewer than ``min_count`` are left; saved recipes dropped."""
+    catalog = get_catalog()
+    with span("match") as stage:
+        ids, scores = pantry_ranking(user, pantry_names, "match", top_k=top_k)
+        ids, scores = exclude_saved_ids(catalog, ids, scores, exclude_names)
+        stage.set(candidates=len(ids))
+    if len(ids) < min_count:
+        with span("search_fallback") as stage:
+            ids, scores = pantry_ranking(user, pantry_names, "search", top_k=fallback_top_k)
+            ids, scores = exclude_saved_ids(catalog, ids, scores, exclude_names)
+            stage.set(candidates=len(ids))
+    return ids, scores
+
+
+def _personalized_candidates(user, ids, scores, serving_size):
+    catalog = get_catalog()
+    with span("personalize") as stage:
+        ids, scores = personalize_ids(catalog, ids, scores, user)
+        stage.set(candidates=len(ids))
+    servings = None
     if serving_size:
-        recs = filter_by_serving_size(recs, serving_size, tolerance=4)
+        with span("serving_size") as stage:
+            ids, scores, servings = serving_size_ids(catalog, ids, scores, serving_size, tolerance=4)
+            stage.set(candidates=len(ids))
+    return ids, scores, servings
+
+
+def generate_ai_meal(user, pantry_items, top_k=10,exclude_names=None,serving_size=None,meal_type=None):
+    """
+    Cached front of the recommendation pipeline: identical pantry
+    selections for an unchanged profile are served from
+    RECOMMENDATION_CACHE (invalidated by meal_plan.signals).
+    """
+    pantry_names = [p.ingredient_name for p in pantry_items]
+    key = recommendation_key(
+        "ai_meal", user, pantry_names, serving_size, exclude_names,
+        top_k=top_k, meal_type=meal_type,
+    )
+    with span("generate_ai_meal", top_k=top_k) as trace:
+        recs = RECOMMENDATION_CACHE.get(key)
+        trace.set(cache="miss" if recs is None else "hit")
+        if recs is None:
+            with pinned_catalog():
+                recs = _generate_ai_meal(user, pantry_names, top_k, exclude_names, serving_size, meal_type)
+            RECOMMENDATION_CACHE.set(key, recs, user_id=getattr(user, "pk", None))
+        trace.set(results=len(recs))
+        return recs.copy()
+
+
+def _generate_ai_meal(user, pantry_names, top_k=10, exclude_names=None, serving_size=None, meal_type=None):
+    exclude_names = set(n.lower() for n in exclude_names) if exclude_names else set()
+    # Step 1+2: Strict ingredient matching over the whole catalog
+    # (diet + allergy restrictions are applied up front, before ranking),
+    # Step 3: minus recipes already saved by the user; if too few remain,
+    # fall back to similarity only
+    ids, scores = _ranked_candidates(user, pantry_names, 50, top_k, top_k, exclude_names)
+    ids, scores, servings = _personalized_candidates(user, ids, scores, serving_size)
+    if meal_type in MEAL_TYPES:
+        # before the top_k cut, so up to top_k recipes of that type come back
+        with span("meal_type", meal_type=meal_type):
+            keep = get_catalog().derived.meal_type_mask(meal_type)[ids]
+            ids, scores = ids[keep], scores[keep]
+            servings = None if servings is None else servings[keep]
+
+    # only the returned recipes become DataFrame rows
+    ids, scores = ids[:top_k], scores[:top_k]
+    with span("rows", rows=len(ids)):
+        return candidate_frame(get_catalog(), ids, scores, None if servings is None else servings[:top_k])
+
+
+def daily_calorie_target(user):
+    """Mifflin-St Jeor BMR, shifted by 400 kcal for weight loss/gain goals."""
+    try:
+        weight = float(user.profile.weight_kg or 70)
+        height = float(user.profile.height_cm or 170)
+        age = float(user.profile.age or 25)
+        goal = user.profile.goal.lower()
+        bmr = 10 * weight + 6.25 * height - 5 * age + 5
+        if goal == "weight loss":
+            return bmr - 400
+        elif goal == "weight gain":
+            return bmr + 400
+        return bmr
+    except Exception:
+        return 2000
+
+
+class CandidatePool:
+    """
+    Ranked, personalized plan candidates as recipe ids plus the column
+    arrays the planners need. Rows are materialized only for the recipes
+    a plan picks (see :meth:`frame`). Pools are cached: treat as read-only.
+    """
 
-    # Add automatic meal classification
-    recs["MealType"] = recs["Calories"].apply(classify_meal_by_calories)   
-    
-    return recs.head(top_k)
+    def __init__(self, catalog, ids, scores, servings=None):
+        self.catalog = catalog
+        self.ids = ids
+        self.scores = scores
+        self.servings = servings
+        self.calories = np.asarray(catalog.take("Calories", ids), dtype=np.float64)
+        self.meal_types = catalog.derived.meal_types(ids)
+        self._names = None
+        self._ingredients = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def names(self):
+        """Lower-cased recipe names."""
+        if self._names is None:
+            names = self.catalog.take("Name", self.ids)
+            self._names = np.array([(n or "").lower() for n in names], dtype=object)
+        return self._names
+
+    @property
+    def ingredients(self):
+        """Normalized ingredient set of every candidate."""
+        if self._ingredients is None:
+            values = self.catalog.take(INGREDIENT_COLUMN, self.ids)
+            self._ingredients = [set(tokenize_ingredients(v)) for v in values]
+        return self._ingredients
+
+    def frame(self, positions=()):
+        """Recipe rows for the candidates at ``positions``."""
+        positions = np.asarray(positions, dtype=np.int64)
+        servings = None if self.servings is None else self.servings[positions]
+        return candidate_frame(self.catalog, self.ids[positions], self.scores[positions], servings,
+                               self.meal_types[positions])
+
+
+def plan_candidates(user, pantry_names, exclude_names=None, serving_size=None, min_count=3):
+    """
+    Ranked, personalized CandidatePool the planner chooses from. Cached
+    like generate_ai_meal so single-meal regeneration can reuse it.
+    """
+    key = recommendation_key(
+        "plan_candidates", user, pantry_names, serving_size, exclude_names, min_count=min_count,
+    )
+    with span("candidates") as stage:
+        pool = RECOMMENDATION_CACHE.get(key)
+        stage.set(cache="miss" if pool is None else "hit")
+        if pool is None:
+            with pinned_catalog():
+                pool = _plan_candidates(user, pantry_names, exclude_names, serving_size, min_count)
+            RECOMMENDATION_CACHE.set(key, pool, user_id=getattr(user, "pk", None))
+        stage.set(candidates=len(pool))
+        return pool
+
+
+def _plan_candidates(user, pantry_names, exclude_names=None, serving_size=None, min_count=3):
+    exclude_names = set(n.lower() for n in exclude_names) if exclude_names else set()
+
+    # Pantry → similarity search
+    ids, scores = _ranked_candidates(user, pantry_names, 80, 80, min_count, exclude_names)
+    ids, scores, servings = _personalized_candidates(user, ids, scores, serving_size)
 
+    catalog = get_catalog()
+    keep = np.asarray(catalog.take("Calories", ids), dtype=np.float64) > 0
+    return CandidatePool(catalog, ids[keep], scores[keep], None if servings is None else servings[keep])
 
 
 def generate_meal_plan(
@@ -265,73 +633,168 @@ def generate_meal_plan(
     exclude_names=None,
     serving_size=None):
 
-    exclude_names = set(n.lower() for n in exclude_names) if exclude_names else set()
     pantry_names = [p.ingredient_name for p in pantry_items]
+    if days > 1:
+        return generate_weekly_plan(user, pantry_items, days, meals_per_day, exclude_names, serving_size)
+    with span("generate_meal_plan", meals=meals_per_day):
+        return _generate_meal_plan(user, pantry_names, days, meals_per_day, exclude_names, serving_size)
 
-    # Pantry → similarity search
-    recs = recommend_by_pantry(pantry_names, top_k=80)
-    recs = filter_recipes_by_pantry_ingredients(recs, pantry_names, max_extra=3)
-    if exclude_names:
-        recs = recs[~recs["Name"].str.lower().isin(exclude_names)]
-    if len(recs) < meals_per_day * days:
-        recs = recommend_by_pantry(pantry_names, top_k=80)
-        if exclude_names:
-            recs = recs[~recs["Name"].str.lower().isin(exclude_names)]
-
-    print(recs.columns)
-    recs = personalize_results(recs, user)
-    if serving_size:
-        recs = filter_by_serving_size(recs, serving_size, tolerance=4)
 
-    recs["MealType"] = recs["Calories"].apply(classify_meal_by_calories)
+def _generate_meal_plan(user, pantry_names, days, meals_per_day, exclude_names, serving_size):
+    pool = plan_candidates(user, pantry_names, exclude_names, serving_size, min_count=meals_per_day * days)
 
-    df = recs.copy()
-    df = df[df["Calories"] > 0].copy()
-
-    # Calorie target calculation
-    try:
-        weight = float(user.profile.weight_kg or 70)
-        height = float(user.profile.height_cm or 170)
-        age = float(user.profile.age or 25)
-        goal = user.profile.goal.lower()
-        bmr = 10 * weight + 6.25 * height - 5 * age + 5
-        if goal == "weight loss":
-            target = bmr - 400
-        elif goal == "weight gain":
-            target = bmr + 400
-        else:
-            target = bmr
-    except Exception:
-        target = 2000
+    target = daily_calorie_target(user)
 
     # -------- Optimization --------
-    n = len(df)
-    prob = pulp.LpProblem("MealPlan", pulp.LpMinimize)
+    # exact count of meals, at least one of each meal type per day
+    count = meals_per_day * days
+    min_per_type = {meal: days for meal in MEAL_SLOTS}
+    if count < len(min_per_type) * days:
+        # e.g. a single meal: the per-type minimums can't all be met
+        min_per_type = {}
+    chosen = solve_meal_plan(pool.calories, pool.meal_types, target * days, count, min_per_type)
+
+    plan = pool.frame(chosen or [])
+    plan["TotalCalories"] = plan["Calories"].sum()
 
-    x = [pulp.LpVariable(f"x_{i}", cat="Binary") for i in range(n)]
-    cal = df["Calories"].values
-    total_cal = pulp.lpSum(x[i] * cal[i] for i in range(n))
+    return plan
 
-    # linear deviation objective (instead of quadratic)
-    deviation = pulp.LpVariable("deviation", lowBound=0)
-    prob += deviation  # minimize deviation
 
-    # absolute deviation constraints
-    prob += total_cal - deviation <= target * days
-    prob += total_cal + deviation >= target * days
+def _warm_start(pool, previous, available):
+    """For each meal of the previous day, the closest-calorie available candidate of the same type."""
+    start = []
+    for i in previous:
+        same_type = available[pool.meal_types[available] == pool.meal_types[i]]
+        same_type = np.setdiff1d(same_type, start)
+        if len(same_type):
+            start.append(int(same_type[np.argmin(np.abs(pool.calories[same_type] - pool.calories[i]))]))
+    return start
 
-    # exact count of meals
-    prob += pulp.lpSum(x) == meals_per_day * days
 
-    # meal-type constraints (at least one of each per day)
-    prob += pulp.lpSum(x[i] for i in range(n) if df.iloc[i]["MealType"] == "Breakfast") >= days
-    prob += pulp.lpSum(x[i] for i in range(n) if df.iloc[i]["MealType"] == "Lunch") >= days
-    prob += pulp.lpSum(x[i] for i in range(n) if df.iloc[i]["MealType"] == "Dinner") >= days
-    
-    prob.solve(pulp.PULP_CBC_CMD(msg=False))
-    chosen = [i for i in range(n) if pulp.value(x[i]) == 1]
+def generate_weekly_plan(
+    user,
+    pantry_items,
+    days=7,
+    meals_per_day=3,
+    exclude_names=None,
+    serving_size=None,
+    no_repeat_days=None,
+    reuse_weight=None,
+    time_budget=None):
+    """
+    Multi-day plan solved one day at a time instead of as one ILP.
+
+    Every day hits its own calorie target with one meal of each type.
+    A recipe can't come back within ``no_repeat_days`` days (relaxed only
+    if the pool runs dry), and each ingredient that is neither in the
+    pantry nor already used earlier in the week costs ``reuse_weight``
+    kcal of deviation, so later days favour ingredients already bought.
+    Each day gets an equal share of ``time_budget`` seconds, and CBC (when
+    a day is too big for the in-process solver) is warm-started from the
+    previous day's plan.
+    """
+    if no_repeat_days is None:
+        no_repeat_days = getattr(settings, "MEAL_PLAN_NO_REPEAT_DAYS", 3)
+    if reuse_weight is None:
+        reuse_weight = getattr(settings, "MEAL_PLAN_INGREDIENT_REUSE_WEIGHT", 25)
+    if time_budget is None:
+        time_budget = getattr(settings, "MEAL_PLAN_WEEK_TIME_BUDGET", 10)
+    deadline = time.monotonic() + time_budget
 
-    plan = df.iloc[chosen].copy()
+    pantry_names = [p.ingredient_name for p in pantry_items]
+    with span("generate_weekly_plan", days=days, meals=meals_per_day):
+        return _generate_weekly_plan(user, pantry_names, days, meals_per_day, exclude_names, serving_size,
+                                     no_repeat_days, reuse_weight, deadline)
+
+
+def _generate_weekly_plan(user, pantry_names, days, meals_per_day, exclude_names, serving_size,
+                          no_repeat_days, reuse_weight, deadline):
+    pool = plan_candidates(user, pantry_names, exclude_names, serving_size, min_count=meals_per_day * days)
+    calories = pool.calories
+    meal_types = pool.meal_types
+    ingredients = pool.ingredients
+    known = {normalize_ingredient(p) for p in pantry_names}
+    target = daily_calorie_target(user)
+
+    last_used = {}     # candidate position -> last day it was planned
+    day_plans = []
+    previous = None
+    for day in range(days):
+        new_ingredients = np.array([len(ings - known) for ings in ingredients], dtype=np.float64)
+        fresh = np.array([day - last_used.get(i, -no_repeat_days - 1) > no_repeat_days for i in range(len(pool))], dtype=bool)
+        min_per_type = {meal: 1 for meal in MEAL_SLOTS} if meals_per_day >= len(MEAL_SLOTS) else {}
+        time_limit = max(deadline - time.monotonic(), 0.05) / (days - day)
+
+        chosen = None
+        # relax the repeat window first, then the meal-type minimums
+        for available, minimums in ((fresh, min_per_type), (np.ones(len(pool), bool), min_per_type),
+                                    (np.ones(len(pool), bool), {})):
+            positions = np.flatnonzero(available)
+            warm = None
+            if previous is not None:
+                warm = [int(np.searchsorted(positions, i)) for i in _warm_start(pool, previous, positions)]
+            picked = solve_meal_plan(
+                calories[positions], meal_types[positions], target, meals_per_day, minimums,
+                time_limit=time_limit, penalty=reuse_weight * new_ingredients[positions], warm_start=warm,
+            )
+            if picked:
+                chosen = positions[picked]
+                break
+        if chosen is None:
+            break
+
+        plan = pool.frame(chosen)
+        plan["day"] = day + 1
+        plan["DayTotalCalories"] = plan["Calories"].sum()
+        day_plans.append(plan)
+        previous = chosen
+        for i in chosen:
+            last_used[int(i)] = day
+            known |= ingredients[i]
+
+    if not day_plans:
+        return pool.frame()
+    plan = pd.concat(day_plans, ignore_index=True)
     plan["TotalCalories"] = plan["Calories"].sum()
+    return plan
+
 
-    return plan.reset_index(drop=True)
+def regenerate_plan_meal(user, pantry_items, current_plan, meal_type, exclude_names=None, serving_size=None):
+    """
+    Replace the ``meal_type`` meal of a day plan without re-planning.
+
+    ``current_plan`` is the list of meal dicts kept in the session (Name,
+    MealType and Calories). The other meals stay pinned; the replacement
+    is the candidate of the requested type, not already in the plan, that
+    brings the day's total closest to the calorie target. Candidates come
+    from the cached plan pool. Returns a one-row DataFrame (empty if no
+    candidate of that type is left).
+    """
+    pantry_names = [p.ingredient_name for p in pantry_items]
+    with span("regenerate_plan_meal", meal_type=meal_type):
+        pool = plan_candidates(user, pantry_names, exclude_names, serving_size, min_count=len(current_plan) or 3)
+
+        calories_by_name = dict(zip(pool.names, pool.calories))
+        pinned = 0.0
+        in_plan = set()
+        for meal in current_plan:
+            name = (meal.get("Name") or "").lower()
+            in_plan.add(name)
+            if meal.get("MealType") == meal_type:
+                continue
+            calories = meal.get("Calories", calories_by_name.get(name))
+            try:
+                pinned += float(calories)
+            except (TypeError, ValueError):
+                pass
+
+        positions = np.flatnonzero(
+            (pool.meal_types == meal_type) & ~np.isin(pool.names, list(in_plan))
+        )
+        if not len(positions):
+            return pool.frame()
+
+        deviation = np.abs(pinned + pool.calories[positions] - daily_calorie_target(user))
+        best = pool.frame([positions[int(np.argmin(deviation))]])
+        best["TotalCalories"] = pinned + best["Calories"]
+        return best
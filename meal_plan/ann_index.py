@@ -0,0 +1,135 @@
+# meal_plan/ann_index.py
+"""
+Optional approximate nearest-neighbour index for pantry retrieval.
+
+An IVF ("inverted file") coarse quantizer over LSA-reduced TF-IDF rows:
+
+    components.npy    TruncatedSVD basis (n_components x n_features)
+    centroids.npy     unit-length k-means centroids in LSA space
+    list_indptr.npy   recipe ids grouped by nearest centroid, CSR-style
+    list_ids.npy
+    meta.json
+
+A query is projected into LSA space, the ``nprobe`` closest centroids
+are picked and only the recipes in those lists are scored, exactly, on
+the original TF-IDF rows. ``nprobe`` trades recall for latency: probing
+every list is the exact search again. Built offline by
+``manage.py build_ann_index`` into ``<catalog>/ann``.
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+ANN_DIR = "ann"
+META_FILE = "meta.json"
+
+
+def project(rows, components):
+    """L2-normalized LSA vectors (float32) of sparse TF-IDF rows."""
+    dense = np.asarray(rows @ components.T, dtype=np.float32)
+    # plain NumPy: sklearn's normalize() input validation costs more than
+    # the projection itself for a single query
+    norms = np.linalg.norm(dense, axis=1, keepdims=True)
+    return np.divide(dense, norms, out=dense, where=norms > 0)
+
+
+def build_ann_index(path, matrix, n_components=128, n_lists=None, sample_size=100_000,
+                    chunk_rows=50_000, seed=0):
+    """
+    Fit the LSA basis and the centroids on a sample of ``matrix`` rows and
+    assign every row to its closest list. ``n_lists`` defaults to about
+    4 * sqrt(n_rows). The directory at ``path`` is replaced atomically.
+    """
+    n_rows, n_features = matrix.shape
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n_rows, min(n_rows, sample_size), replace=False))
+    train = matrix[sample]
+
+    n_components = max(1, min(n_components, n_features - 1, len(sample) - 1))
+    svd = TruncatedSVD(n_components=n_components, random_state=seed).fit(train)
+    components = svd.components_.astype(np.float32)
+
+    n_lists = int(n_lists or max(1, round(4 * np.sqrt(n_rows))))
+    n_lists = min(n_lists, len(sample))
+    kmeans = MiniBatchKMeans(n_clusters=n_lists, batch_size=4096, n_init=3, random_state=seed)
+    kmeans.fit(project(train, components))
+    centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+
+    assignments = np.empty(n_rows, dtype=np.int32)
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        vectors = project(matrix[start:stop], components)
+        assignments[start:stop] = np.argmax(vectors @ centroids.T, axis=1)
+
+    order = np.argsort(assignments, kind="stable")
+    list_indptr = np.zeros(n_lists + 1, dtype=np.int64)
+    np.cumsum(np.bincount(assignments, minlength=n_lists), out=list_indptr[1:])
+    id_dtype = np.int32 if n_rows < np.iinfo(np.int32).max else np.int64
+
+    path = os.path.abspath(path)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "components.npy"), components)
+    np.save(os.path.join(tmp_path, "centroids.npy"), centroids)
+    np.save(os.path.join(tmp_path, "list_indptr.npy"), list_indptr)
+    np.save(os.path.join(tmp_path, "list_ids.npy"), order.astype(id_dtype))
+    with open(os.path.join(tmp_path, META_FILE), "w") as fh:
+        json.dump({
+            "n_rows": n_rows,
+            "n_features": n_features,
+            "n_components": n_components,
+            "n_lists": n_lists,
+            "explained_variance": float(svd.explained_variance_ratio_.sum()),
+        }, fh, indent=2)
+
+    old = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class IVFIndex:
+
+    def __init__(self, components, centroids, list_indptr, list_ids, meta=None):
+        self.components = components
+        self.centroids = centroids
+        self.list_indptr = list_indptr
+        self.list_ids = list_ids
+        self.meta = meta or {}
+
+    @classmethod
+    def open(cls, path, load_array):
+        with open(os.path.join(path, META_FILE)) as fh:
+            meta = json.load(fh)
+        return cls(
+            np.load(os.path.join(path, "components.npy")),
+            np.load(os.path.join(path, "centroids.npy")),
+            load_array(os.path.join(path, "list_indptr.npy")),
+            load_array(os.path.join(path, "list_ids.npy")),
+            meta,
+        )
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def probe(self, queries, nprobe):
+        """Candidate recipe ids (sorted) for each row of the sparse ``queries``."""
+        nprobe = max(1, min(int(nprobe), self.n_lists))
+        sims = project(queries, self.components) @ self.centroids.T
+        if nprobe < self.n_lists:
+            lists = np.argpartition(-sims, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            lists = np.broadcast_to(np.arange(self.n_lists), sims.shape)
+        candidates = []
+        for row in lists:
+            parts = [self.list_ids[self.list_indptr[l]:self.list_indptr[l + 1]] for l in row]
+            candidates.append(np.sort(np.concatenate(parts)).astype(np.int64))
+        return candidates
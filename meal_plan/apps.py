@@ -5,5 +5,10 @@ class MealPlanConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'meal_plan'
 
-def ready(self):
-    import meal_plan.signals
\ No newline at end of file
+    def ready(self):
+        import meal_plan.signals
+        from meal_plan.instrumentation import configure_sinks
+        configure_sinks()
+        from meal_plan.warmup import should_warm_up_on_start, start_warmup
+        if should_warm_up_on_start():
+            start_warmup()
@@ -0,0 +1,436 @@
+# meal_plan/catalog_store.py
+"""
+Versioned recipe catalog: a base catalog plus appended delta segments.
+
+    <catalog>/                  the base segment (a normal catalog directory)
+    <catalog>/manifest.json     {"version": 7, "base": 5, "deltas": ["delta-000006", ...]}
+    <catalog>/deltas/<name>/    one catalog directory per appended batch
+
+A catalog without manifest.json is version 0 with no deltas. New recipes
+are vectorized with the base catalog's fitted vectorizer and written as
+a delta segment; the manifest is then replaced atomically, so readers
+see either the old or the new segment list. Segments never change once
+written, and recipe ids are the concatenation of base and delta rows in
+manifest order, so ids stay valid across versions. Compaction rewrites
+base + deltas as a new base (same row order) and bumps ``base``; the
+base's optional ANN and LSA indexes are rebuilt over the merged rows
+before it is swapped in.
+"""
+import json
+import os
+import time
+from contextlib import contextmanager
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .ann_index import ANN_DIR, build_ann_index
+from .lsa_index import LSA_DIR, build_lsa_index
+from .recipe_catalog import META_FILE, VECTORIZER_FILE, ArtifactWriter, RecipeCatalog, is_catalog
+from .retrieval import per_query, top_k_scores
+
+MANIFEST_FILE = "manifest.json"
+DELTA_DIR = "deltas"
+
+
+# ------------------- Manifest -------------------
+
+def read_manifest(path):
+    try:
+        with open(os.path.join(path, MANIFEST_FILE)) as fh:
+            return json.load(fh)
+    except FileNotFoundError:
+        if not is_catalog(path):
+            raise
+        return {"version": 0, "base": 0, "deltas": []}
+
+
+def write_manifest(path, manifest):
+    tmp = os.path.join(path, f"{MANIFEST_FILE}.tmp-{os.getpid()}")
+    with open(tmp, "w") as fh:
+        json.dump(manifest, fh, indent=2)
+    os.replace(tmp, os.path.join(path, MANIFEST_FILE))
+
+
+def rebuilt_manifest(path):
+    """
+    Manifest for a full rebuild replacing the catalog at ``path``: a new
+    version and base, so running workers notice the swap.
+    """
+    version = (store_version(path) or 0) + 1
+    return {MANIFEST_FILE: {"version": version, "base": version, "deltas": []}}
+
+
+def store_version(path):
+    """Current manifest version, or None while the catalog is unreadable (e.g. mid-compaction)."""
+    try:
+        return read_manifest(path)["version"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+@contextmanager
+def writer_lock(path, timeout=600):
+    """Only one process may append or compact at a time (portable lock file)."""
+    lock = f"{os.path.abspath(path)}.lock"
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{lock} is held by another writer")
+            time.sleep(0.5)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        yield
+    finally:
+        os.close(fd)
+        os.remove(lock)
+
+
+# ------------------- Reading -------------------
+
+def open_store(path, previous=None):
+    """
+    The catalog at ``path`` with its deltas. Segments already open in
+    ``previous`` (an earlier version) are reused instead of reopened.
+    """
+    manifest = read_manifest(path)
+    reuse = dict(getattr(previous, "segment_map", {}))
+    names = [f"base-{manifest['base']}"] + list(manifest["deltas"])
+    segments = []
+    for name in names:
+        segment = reuse.get(name)
+        if segment is None:
+            seg_path = path if name == names[0] else os.path.join(path, DELTA_DIR, name)
+            segment = RecipeCatalog.open(seg_path)
+        segments.append(segment)
+
+    if len(segments) == 1:
+        catalog = segments[0]
+        catalog.segment_map = {names[0]: catalog}
+    else:
+        catalog = SegmentedCatalog(segments, names, path=path)
+    catalog.version = manifest["version"]
+    return catalog
+
+
+class SegmentedCatalog:
+    """
+    Several RecipeCatalog segments behind the RecipeCatalog interface the
+    recommender uses. Global recipe id = segment offset + local id.
+    """
+
+    def __init__(self, segments, names, path=None):
+        self.segments = list(segments)
+        self.segment_map = dict(zip(names, self.segments))
+        self.offsets = np.zeros(len(segments) + 1, dtype=np.int64)
+        np.cumsum([len(s) for s in segments], out=self.offsets[1:])
+        self.n_rows = int(self.offsets[-1])
+        self.vectorizer = segments[0].vectorizer
+        self.path = path
+        self.version = None
+        self.retriever = _SegmentedRetriever(self)
+        self.ingredients = _SegmentedIngredients(self)
+        self.dietary = None
+        self.derived = None
+        self._compact_frame = None
+
+    def __len__(self):
+        return self.n_rows
+
+    def split(self, ids):
+        """(segment, positions in ``ids``, local ids) for every segment hit by ``ids``."""
+        ids = np.asarray(ids, dtype=np.int64)
+        which = np.searchsorted(self.offsets, ids, side="right") - 1
+        for k in np.unique(which):
+            positions = np.flatnonzero(which == k)
+            yield self.segments[k], positions, ids[positions] - self.offsets[k]
+
+    @property
+    def matrix(self):
+        return sparse.vstack([s.matrix for s in self.segments], format="csr")
+
+    def load_dietary(self, restrictions):
+        for segment in self.segments:
+            if segment.dietary is None:
+                segment.load_dietary(restrictions)
+        self.dietary = _SegmentedDietary(self)
+        return self.dietary
+
+    def load_derived(self):
+        for segment in self.segments:
+            if segment.derived is None:
+                segment.load_derived()
+        self.derived = _SegmentedDerived(self)
+        return self.derived
+
+    def load_ann(self, nprobe):
+        # deltas are small and always searched exactly
+        return self.segments[0].load_ann(nprobe)
+
+    def load_lsa(self):
+        # like ANN, only the base segment has LSA vectors
+        return self.segments[0].load_lsa()
+
+    def column(self, name):
+        return self.take(name, np.arange(self.n_rows))
+
+    def has_column(self, name):
+        return self.segments[0].has_column(name)
+
+    def take(self, name, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        out = None
+        for segment, positions, local in self.split(ids):
+            values = segment.take(name, local)
+            if out is None:
+                out = np.empty(len(ids), dtype=values.dtype)
+            out[positions] = values
+        return out if out is not None else self.segments[0].take(name, ids)
+
+    def rows(self, ids, columns=None, extra=None):
+        ids = np.asarray(ids, dtype=np.int64)
+        parts = []
+        for segment, positions, local in self.split(ids):
+            frame = segment.rows(local, columns)
+            frame.index = positions
+            parts.append(frame)
+        if not parts:
+            return self.segments[0].rows(ids, columns, extra)
+        frame = pd.concat(parts).sort_index().reset_index(drop=True)
+        return frame.assign(recipe_id=ids, **(extra or {}))
+
+    def details(self, recipe_id):
+        (segment, _, local), = self.split([recipe_id])
+        return segment.details(int(local[0]))
+
+    def compact_frame(self, cache=True):
+        if self._compact_frame is None:
+            parts = [s.compact_frame(cache=False) for s in self.segments]
+            frame = pd.concat(parts, ignore_index=True)
+            # segments have their own category lists; concat falls back to objects
+            for name, dtype in parts[0].dtypes.items():
+                if isinstance(dtype, pd.CategoricalDtype):
+                    frame[name] = frame[name].astype("category")
+            frame["recipe_id"] = np.arange(self.n_rows)
+            if not cache:
+                return frame
+            self._compact_frame = frame
+        return self._compact_frame
+
+    def to_frame(self):
+        return self.rows(np.arange(self.n_rows))
+
+
+class _SegmentedRetriever:
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.vectorizer = catalog.vectorizer
+
+    def encode(self, pantry_lists):
+        return self.catalog.segments[0].retriever.encode(pantry_lists)
+
+    def search_batch(self, pantry_lists, top_k=10, allowed=None, nprobe=None):
+        if not len(pantry_lists):
+            return []
+        queries = self.encode(pantry_lists)
+        per_segment = []
+        for segment, start, stop in zip(self.catalog.segments, self.catalog.offsets, self.catalog.offsets[1:]):
+            if isinstance(allowed, list):
+                mask = [None if m is None else m[start:stop] for m in allowed]
+            else:
+                mask = None if allowed is None else allowed[start:stop]
+            found = segment.retriever.search_queries(queries, top_k=top_k, allowed=mask, nprobe=nprobe)
+            per_segment.append([(ids + start, scores) for ids, scores in found])
+        results = []
+        for row in range(len(pantry_lists)):
+            ids = np.concatenate([found[row][0] for found in per_segment])
+            scores = np.concatenate([found[row][1] for found in per_segment])
+            results.append(top_k_scores(ids, scores, per_query(top_k, row)))
+        return results
+
+    def search(self, pantry_list, top_k=10, allowed=None, nprobe=None):
+        return self.search_batch([pantry_list], top_k=top_k, allowed=allowed, nprobe=nprobe)[0]
+
+    def score(self, pantry_list, ids):
+        query = self.encode([pantry_list])
+        out = np.zeros(len(ids), dtype=np.float32)
+        for segment, positions, local in self.catalog.split(ids):
+            out[positions] = segment.retriever.score_query(query, local)
+        return out
+
+
+class _SegmentedIngredients:
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __len__(self):
+        return self.catalog.n_rows
+
+    def ingredients(self, recipe_id):
+        (segment, _, local), = self.catalog.split([recipe_id])
+        return segment.ingredients.ingredients(int(local[0]))
+
+    def match(self, pantry_list, max_extra=3):
+        return np.concatenate([
+            segment.ingredients.match(pantry_list, max_extra=max_extra) + start
+            for segment, start in zip(self.catalog.segments, self.catalog.offsets)
+        ])
+
+
+class _SegmentedDietary:
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def allowed(self, ids, dietary_pref=None, allergy_info=None):
+        keep = np.ones(len(ids), dtype=bool)
+        for segment, positions, local in self.catalog.split(ids):
+            keep[positions] = segment.dietary.allowed(local, dietary_pref, allergy_info)
+        return keep
+
+    def allowed_mask(self, dietary_pref=None, allergy_info=None):
+        masks = [s.dietary.allowed_mask(dietary_pref, allergy_info) for s in self.catalog.segments]
+        if all(m is None for m in masks):
+            return None
+        return np.concatenate([
+            np.ones(len(s), dtype=bool) if m is None else m
+            for s, m in zip(self.catalog.segments, masks)
+        ])
+
+
+class _SegmentedDerived:
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    @property
+    def has_servings(self):
+        return self.catalog.segments[0].derived.has_servings
+
+    def _gather(self, method, ids, dtype):
+        out = np.empty(len(ids), dtype=dtype)
+        for segment, positions, local in self.catalog.split(ids):
+            out[positions] = getattr(segment.derived, method)(local)
+        return out
+
+    def meal_types(self, ids):
+        return self._gather("meal_types", ids, object)
+
+    def servings_of(self, ids):
+        return self._gather("servings_of", ids, np.float64)
+
+    def _concat(self, method, *args):
+        return np.concatenate([
+            getattr(segment.derived, method)(*args) + start
+            for segment, start in zip(self.catalog.segments, self.catalog.offsets)
+        ])
+
+    def range_ids(self, field, lower=-np.inf, upper=np.inf, upper_inclusive=True):
+        # field order within each segment, segments one after the other
+        return self._concat("range_ids", field, lower, upper, upper_inclusive)
+
+    def range_mask(self, field, lower=-np.inf, upper=np.inf, upper_inclusive=True):
+        return np.concatenate([s.derived.range_mask(field, lower, upper, upper_inclusive)
+                               for s in self.catalog.segments])
+
+    def serving_size_ids(self, serving_size, tolerance=1):
+        return self._concat("serving_size_ids", serving_size, tolerance)
+
+    def meal_type_ids(self, meal_type):
+        return self._concat("meal_type_ids", meal_type)
+
+    # segments keep their own masks, so a new version only builds the new segment's part
+    def serving_size_mask(self, serving_size, tolerance=1):
+        return np.concatenate([s.derived.serving_size_mask(serving_size, tolerance)
+                               for s in self.catalog.segments])
+
+    def meal_type_mask(self, meal_type):
+        return np.concatenate([s.derived.meal_type_mask(meal_type) for s in self.catalog.segments])
+
+
+# ------------------- Writing -------------------
+
+def _base_schema(path):
+    with open(os.path.join(path, META_FILE)) as fh:
+        return json.load(fh)["columns"]
+
+
+def load_vectorizer(path):
+    return joblib.load(os.path.join(path, VECTORIZER_FILE))
+
+
+def append_segment(path, df, matrix, restrictions=None):
+    """
+    Add prepared recipes (``matrix`` from the base vectorizer) as a new
+    delta segment. Returns the new catalog version.
+    """
+    if not len(df):
+        raise ValueError("No recipes to add.")
+    with writer_lock(path):
+        manifest = read_manifest(path)
+        version = manifest["version"] + 1
+        name = f"delta-{version:06d}"
+        writer = ArtifactWriter(
+            os.path.join(path, DELTA_DIR, name), load_vectorizer(path),
+            schema=_base_schema(path), restrictions=restrictions,
+        )
+        writer.append(df, matrix)
+        writer.close()
+        write_manifest(path, {"version": version, "base": manifest["base"], "deltas": manifest["deltas"] + [name]})
+    return version
+
+
+def search_indexes(path):
+    """{directory: meta} of the optional search indexes (ANN, LSA) built for the catalog at ``path``."""
+    found = {}
+    for name in (ANN_DIR, LSA_DIR):
+        try:
+            with open(os.path.join(path, name, META_FILE)) as fh:
+                found[name] = json.load(fh)
+        except (OSError, ValueError):
+            pass
+    return found
+
+
+def _rebuild_search_indexes(indexes):
+    """before_swap hook: rebuild ``indexes`` ({directory: old meta}) over the new base."""
+    def rebuild(tmp_path):
+        matrix = RecipeCatalog.open(tmp_path).matrix
+        if ANN_DIR in indexes:
+            build_ann_index(os.path.join(tmp_path, ANN_DIR), matrix,
+                            n_components=indexes[ANN_DIR]["n_components"])
+        if LSA_DIR in indexes:
+            build_lsa_index(os.path.join(tmp_path, LSA_DIR), matrix,
+                            n_components=indexes[LSA_DIR]["n_components"])
+    return rebuild
+
+
+def compact(path, restrictions=None, chunk_size=50_000):
+    """
+    Merge the deltas into a new base catalog (same recipe ids). The ANN
+    and LSA indexes of the old base, if any, are rebuilt over all rows
+    with the same dimensions. Returns the new version, or None if there
+    was nothing to merge.
+    """
+    with writer_lock(path):
+        manifest = read_manifest(path)
+        if not manifest["deltas"]:
+            return None
+        catalog = open_store(path)
+        writer = ArtifactWriter(path, catalog.vectorizer, schema=_base_schema(path), restrictions=restrictions)
+        for segment in catalog.segments:
+            for start in range(0, len(segment), chunk_size):
+                ids = np.arange(start, min(start + chunk_size, len(segment)))
+                rows = segment.rows(ids).drop(columns="recipe_id")
+                writer.append(rows, segment.matrix[ids])
+        extra_files = rebuilt_manifest(path)
+        writer.close(extra_files=extra_files, before_swap=_rebuild_search_indexes(search_indexes(path)))
+    return extra_files[MANIFEST_FILE]["version"]
@@ -0,0 +1,287 @@
+# meal_plan/derived_columns.py
+"""
+Typed recipe fields derived once per catalog instead of on every request.
+
+    derived/meal_type.npy           uint8 index into MEAL_TYPES
+    derived/servings.npy            float32 serving size (NaN when unknown)
+    derived/<field>.order.npy       recipe ids sorted by calories / servings, NaN last
+    derived/<field>.sorted.npy      the field's values in that order
+    derived/meta.json               signature of the rules below
+
+Per-candidate lookups are a gather from the typed arrays. Range filters
+over the whole catalog (serving size ± tolerance; a meal type, which is
+a calorie band) are two ``np.searchsorted`` calls on the sorted values;
+the pipeline keeps the resulting masks (a few per catalog version), so
+filtering a request's candidates is a single boolean gather.
+Catalogs written before these files existed get them computed in memory
+when opened.
+"""
+import bisect
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+DERIVED_DIR = "derived"
+META_FILE = "meta.json"
+
+MEAL_TYPES = ("Snack", "Breakfast", "Lunch", "Dinner", "Unknown")
+UNKNOWN = MEAL_TYPES.index("Unknown")
+# exclusive upper calorie bound of Snack, Breakfast and Lunch; the rest is Dinner
+CALORIE_BOUNDS = (200, 400, 700)
+# rows decoded at a time when servings have to be parsed from text
+_PARSE_CHUNK = 100_000
+
+# catalog-wide filter masks kept per catalog (one byte per recipe each)
+_MASK_CACHE_SIZE = 8
+
+_MEAL_TYPE_NAMES = np.array(MEAL_TYPES, dtype=object)
+
+
+def rules_signature():
+    payload = json.dumps({"meal_types": MEAL_TYPES, "calorie_bounds": CALORIE_BOUNDS}).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+# ------------------- Derivation rules -------------------
+
+def classify_meal_by_calories(cal):
+    """
+    Simple nutrition-based meal classification based on calories.
+    Adjust thresholds in CALORIE_BOUNDS.
+    """
+    try:
+        cal = float(cal)
+    except (TypeError, ValueError):
+        return "Unknown"
+    return MEAL_TYPES[bisect.bisect_right(CALORIE_BOUNDS, cal)]
+
+
+def meal_type_codes(calories):
+    """classify_meal_by_calories over an array, as uint8 codes into MEAL_TYPES."""
+    values = np.asarray(calories)
+    if values.dtype.kind in "biuf":
+        # NaN sorts last, so it lands in Dinner like float("nan") does above
+        return np.searchsorted(CALORIE_BOUNDS, values.astype(np.float64), side="right").astype(np.uint8)
+    return np.array([MEAL_TYPES.index(classify_meal_by_calories(c)) for c in values], dtype=np.uint8)
+
+
+def meal_type_names(codes):
+    return _MEAL_TYPE_NAMES[np.asarray(codes, dtype=np.intp)]
+
+
+# Convert servings into float safely
+def parse_servings(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_servings_array(values):
+    """parse_servings over an array -> float64, NaN when unknown."""
+    values = np.asarray(values)
+    if values.dtype.kind in "biuf":
+        return values.astype(np.float64)
+    series = pd.Series(values, dtype=object)
+    out = pd.to_numeric(series, errors="coerce").to_numpy(dtype=np.float64, copy=True)
+    # the few strings float() reads but pandas doesn't (e.g. "1_000")
+    retry = np.flatnonzero(np.isnan(out) & series.notna().to_numpy())
+    if len(retry):
+        out[retry] = np.array([parse_servings(v) for v in values[retry]], dtype=np.float64)
+    return out
+
+
+# ------------------- Building -------------------
+
+def servings_source(has_column):
+    """Catalog column the servings are read from (the parsed one when the build added it)."""
+    for name in ("Servings", "RecipeServings"):
+        if has_column(name):
+            return name
+    return None
+
+
+def derive(n_rows, has_column, take):
+    """
+    (meal_type codes, float32 servings, servings source) for a catalog of
+    ``n_rows`` recipes, reading columns through ``take(name, ids)``.
+    """
+    meal_type = np.full(n_rows, UNKNOWN, dtype=np.uint8)
+    servings = np.full(n_rows, np.nan, dtype=np.float32)
+    source = servings_source(has_column)
+    for start in range(0, n_rows, _PARSE_CHUNK):
+        ids = np.arange(start, min(start + _PARSE_CHUNK, n_rows))
+        if has_column("Calories"):
+            meal_type[ids] = meal_type_codes(take("Calories", ids))
+        if source is not None:
+            servings[ids] = parse_servings_array(take(source, ids))
+    return meal_type, servings, source
+
+
+def _calories(n_rows, take):
+    values = np.asarray(take("Calories", np.arange(n_rows)))
+    if values.dtype.kind in "biuf":
+        return values.astype(np.float64)
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").to_numpy(dtype=np.float64)
+
+
+def sort_index(values):
+    """(ids in ascending order of ``values``, NaN last; the values in that order)."""
+    order = np.argsort(values, kind="stable")
+    if len(values) < np.iinfo(np.int32).max:
+        order = order.astype(np.int32)
+    return order, values[order]
+
+
+def save_derived(path, n_rows, has_column, take):
+    os.makedirs(path, exist_ok=True)
+    meal_type, servings, source = derive(n_rows, has_column, take)
+    np.save(os.path.join(path, "meal_type.npy"), meal_type)
+    np.save(os.path.join(path, "servings.npy"), servings)
+    fields = {"servings": servings}
+    if has_column("Calories"):
+        fields["calories"] = _calories(n_rows, take)
+    for field, values in fields.items():
+        order, ordered = sort_index(values)
+        np.save(os.path.join(path, f"{field}.order.npy"), order)
+        np.save(os.path.join(path, f"{field}.sorted.npy"), ordered)
+    with open(os.path.join(path, META_FILE), "w") as fh:
+        json.dump({
+            "n_rows": n_rows,
+            "signature": rules_signature(),
+            "servings_source": source,
+            "sorted": sorted(fields),
+        }, fh)
+
+
+# ------------------- Reading -------------------
+
+class MaskCache:
+    """Small LRU of catalog-wide boolean masks, built on first use."""
+
+    def __init__(self, size=_MASK_CACHE_SIZE):
+        self.size = size
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        with self._lock:
+            mask = self._masks.get(key)
+            if mask is not None:
+                self._masks.move_to_end(key)
+                return mask
+        mask = build()
+        mask.flags.writeable = False
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > self.size:
+                self._masks.popitem(last=False)
+        return mask
+
+
+class DerivedColumns:
+
+    def __init__(self, meal_type, servings, servings_source=None, sorted_index=None, values=None):
+        self.meal_type = meal_type
+        self.servings = servings
+        self.servings_source = servings_source
+        self._sorted = dict(sorted_index or {})     # field -> (order, sorted values)
+        self._values = values or {}                 # field -> callable, for indexes built lazily
+        self._masks = MaskCache()
+
+    @classmethod
+    def load(cls, path, catalog, load_array):
+        """Use the arrays stored with the catalog unless they are missing or the rules changed since."""
+        try:
+            with open(os.path.join(path, META_FILE)) as fh:
+                meta = json.load(fh)
+            if meta["signature"] == rules_signature() and meta["n_rows"] == len(catalog):
+                sorted_index = {
+                    field: (load_array(os.path.join(path, f"{field}.order.npy")),
+                            load_array(os.path.join(path, f"{field}.sorted.npy")))
+                    for field in meta["sorted"]
+                }
+                return cls(load_array(os.path.join(path, "meal_type.npy")),
+                           load_array(os.path.join(path, "servings.npy")),
+                           meta["servings_source"], sorted_index)
+        except (OSError, KeyError, ValueError):
+            pass
+        return cls.compute(catalog)
+
+    @classmethod
+    def compute(cls, catalog):
+        """Derive in memory (legacy pickle, older catalogs); sorted indexes are built on first use."""
+        meal_type, servings, source = derive(len(catalog), catalog.has_column, catalog.take)
+        values = {"servings": lambda: servings}
+        if catalog.has_column("Calories"):
+            values["calories"] = lambda: _calories(len(catalog), catalog.take)
+        return cls(meal_type, servings, source, values=values)
+
+    @property
+    def has_servings(self):
+        return self.servings_source is not None
+
+    def meal_types(self, ids):
+        """MealType names of ``ids``."""
+        return meal_type_names(self.meal_type[np.asarray(ids, dtype=np.int64)])
+
+    def servings_of(self, ids):
+        """Serving sizes of ``ids`` as float64, NaN when unknown."""
+        return np.asarray(self.servings[np.asarray(ids, dtype=np.int64)], dtype=np.float64)
+
+    def _index(self, field):
+        if field not in self._sorted:
+            if field not in self._values:
+                raise KeyError(f"No sorted index on {field!r}.")
+            self._sorted[field] = sort_index(self._values[field]())
+        return self._sorted[field]
+
+    def range_ids(self, field, lower=-np.inf, upper=np.inf, upper_inclusive=True):
+        """Recipe ids with ``lower <= field <= upper`` (``< upper`` if not inclusive), in field order."""
+        order, ordered = self._index(field)
+        start = np.searchsorted(ordered, lower, side="left")
+        stop = np.searchsorted(ordered, upper, side="right" if upper_inclusive else "left")
+        return np.asarray(order[start:max(start, stop)], dtype=np.int64)
+
+    def range_mask(self, field, lower=-np.inf, upper=np.inf, upper_inclusive=True):
+        """Same as :meth:`range_ids` as a boolean mask over the catalog."""
+        mask = np.zeros(len(self.meal_type), dtype=bool)
+        mask[self.range_ids(field, lower, upper, upper_inclusive)] = True
+        return mask
+
+    def serving_size_ids(self, serving_size, tolerance=1):
+        """Recipes serving ``serving_size ± tolerance`` (filter_by_serving_size over the catalog)."""
+        return self.range_ids("servings", serving_size - tolerance, serving_size + tolerance)
+
+    def serving_size_mask(self, serving_size, tolerance=1):
+        """serving_size_ids as a read-only mask over the catalog, kept for reuse."""
+        return self._masks.get(
+            ("servings", float(serving_size), float(tolerance)),
+            lambda: self.range_mask("servings", serving_size - tolerance, serving_size + tolerance),
+        )
+
+    def meal_type_mask(self, meal_type):
+        """meal_type_ids as a read-only mask over the catalog, kept for reuse."""
+        def build():
+            mask = np.zeros(len(self.meal_type), dtype=bool)
+            mask[self.meal_type_ids(meal_type)] = True
+            return mask
+        return self._masks.get(("meal_type", meal_type), build)
+
+    def meal_type_ids(self, meal_type):
+        """Recipes classified as ``meal_type``: a calorie band, or the unparseable ones for Unknown."""
+        code = MEAL_TYPES.index(meal_type)
+        if code == UNKNOWN or ("calories" not in self._sorted and "calories" not in self._values):
+            return np.flatnonzero(self.meal_type == code).astype(np.int64)
+        lower = CALORIE_BOUNDS[code - 1] if code else -np.inf
+        if code == len(CALORIE_BOUNDS):
+            # Dinner also takes the recipes without calories (NaN, sorted last)
+            order, ordered = self._index("calories")
+            ids = np.asarray(order[np.searchsorted(ordered, lower, side="left"):], dtype=np.int64)
+            return ids[self.meal_type[ids] == code]
+        return self.range_ids("calories", lower, CALORIE_BOUNDS[code], upper_inclusive=False)
@@ -0,0 +1,126 @@
+# meal_plan/dietary_index.py
+"""
+Per-recipe dietary-restriction bitmasks and an allergen lookup.
+
+Bit ``k`` of ``bits[recipe_id]`` is set when the recipe contains a word
+from the k-th ``DIETARY_RESTRICTIONS`` avoid list (same ``\\b word \\b``
+rule personalize_results used to apply with a regex on every request).
+The masks are computed from the ingredient vocabulary, so the regex runs
+once per distinct ingredient instead of once per recipe per request.
+"""
+import hashlib
+import json
+import os
+import re
+
+import numpy as np
+
+from .ingredient_index import normalize_ingredient
+
+BITS_FILE = "bits.npy"
+META_FILE = "meta.json"
+
+
+def restriction_signature(restrictions):
+    payload = json.dumps(restrictions, sort_keys=True).encode("utf-8")
+    return hashlib.sha1(payload).hexdigest()
+
+
+def _bit_dtype(n_keys):
+    if n_keys > 64:
+        raise ValueError("At most 64 dietary restrictions fit in a recipe bitmask.")
+    return np.uint32 if n_keys <= 32 else np.uint64
+
+
+def token_bits(vocab, restrictions):
+    """Restriction bitmask of every ingredient in the vocabulary."""
+    dtype = _bit_dtype(len(restrictions))
+    bits = np.zeros(len(vocab), dtype=dtype)
+    for k, avoid_list in enumerate(restrictions.values()):
+        if not avoid_list:
+            continue
+        pattern = re.compile("|".join([f"\\b{a}\\b" for a in avoid_list]))
+        hits = [i for i, token in enumerate(vocab) if pattern.search(token)]
+        bits[hits] |= dtype(1 << k)
+    return bits
+
+
+def recipe_bits(ingredient_index, restrictions):
+    """OR of the ingredient bitmasks of every recipe."""
+    per_token = token_bits(ingredient_index.vocab, restrictions)
+    indptr = np.asarray(ingredient_index.indptr)
+    bits = np.zeros(len(indptr) - 1, dtype=per_token.dtype)
+    if len(ingredient_index.indices):
+        values = per_token[np.asarray(ingredient_index.indices)]
+        nonempty = np.flatnonzero(np.diff(indptr) > 0)
+        bits[nonempty] = np.bitwise_or.reduceat(values, indptr[nonempty])
+    return bits
+
+
+def save_dietary_bits(path, ingredient_index, restrictions):
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, BITS_FILE), recipe_bits(ingredient_index, restrictions))
+    with open(os.path.join(path, META_FILE), "w") as fh:
+        json.dump({"keys": list(restrictions), "signature": restriction_signature(restrictions)}, fh)
+
+
+class DietaryIndex:
+
+    def __init__(self, restrictions, bits, ingredient_index):
+        self.keys = list(restrictions)
+        self.key_bits = {key: 1 << k for k, key in enumerate(self.keys)}
+        self.bits = bits
+        self.ingredients = ingredient_index
+        self._allergen_tokens = {}
+
+    @classmethod
+    def load(cls, path, restrictions, ingredient_index, load_array):
+        """Use the bits stored with the catalog unless the restriction lists changed since."""
+        try:
+            with open(os.path.join(path, META_FILE)) as fh:
+                meta = json.load(fh)
+            if meta["signature"] == restriction_signature(restrictions):
+                return cls(restrictions, load_array(os.path.join(path, BITS_FILE)), ingredient_index)
+        except (OSError, KeyError, ValueError):
+            pass
+        return cls(restrictions, recipe_bits(ingredient_index, restrictions), ingredient_index)
+
+    def diet_bit(self, dietary_pref):
+        key = (dietary_pref or "").strip().lower()
+        return self.key_bits.get(key, 0)
+
+    def allergen_tokens(self, term):
+        """Ingredient ids whose name contains ``term`` (substring, like before)."""
+        term = normalize_ingredient(term)
+        if term not in self._allergen_tokens:
+            self._allergen_tokens[term] = [i for i, token in enumerate(self.ingredients.vocab) if term in token]
+        return self._allergen_tokens[term]
+
+    def allergen_recipe_ids(self, allergy_info):
+        """Recipe ids containing any comma-separated term of ``allergy_info``."""
+        terms = [normalize_ingredient(a) for a in (allergy_info or "").split(",")]
+        token_ids = {t for term in terms if term for t in self.allergen_tokens(term)}
+        if not token_ids:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate([self.ingredients.postings(t) for t in token_ids])).astype(np.int64)
+
+    def allowed(self, ids, dietary_pref=None, allergy_info=None):
+        """Boolean mask over ``ids``: compatible with the diet and allergy-free."""
+        ids = np.asarray(ids, dtype=np.int64)
+        keep = np.ones(len(ids), dtype=bool)
+        bit = self.diet_bit(dietary_pref)
+        if bit:
+            keep &= (self.bits[ids] & bit) == 0
+        if allergy_info:
+            keep &= ~np.isin(ids, self.allergen_recipe_ids(allergy_info))
+        return keep
+
+    def allowed_mask(self, dietary_pref=None, allergy_info=None):
+        """Same as :meth:`allowed` over the whole catalog, or None if nothing is excluded."""
+        bit = self.diet_bit(dietary_pref)
+        banned = self.allergen_recipe_ids(allergy_info) if allergy_info else []
+        if not bit and not len(banned):
+            return None
+        mask = (self.bits & bit) == 0 if bit else np.ones(len(self.bits), dtype=bool)
+        mask[banned] = False
+        return mask
@@ -0,0 +1,138 @@
+# meal_plan/image_cache.py
+"""
+Generated recipe images, stored once per prompt.
+
+An image depends only on the recipe name, its ingredients and the
+generation parameters, so each one is saved under MEDIA_ROOT as
+
+    image_cache/<first 2 hex>/<sha256 of the normalized prompt + parameters>.jpg
+
+The image worker looks a job up here before running diffusion, and
+jobs that hit the cache are done as soon as they are queued. A saved
+Recipe points its ``image`` at the cached file instead of writing a
+copy. The directory is kept under settings.IMAGE_CACHE_MAX_MB by
+deleting the least recently used files (mtime is bumped on every hit);
+files a Recipe still points at are never evicted, and neither are the
+images of jobs finished within settings.IMAGE_CACHE_JOB_GRACE_SECONDS
+(a page may still be polling for them, or about to save the recipe).
+"""
+import hashlib
+import json
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+CACHE_DIR = "image_cache"
+EXTENSION = ".jpg"
+
+
+def _clean(text):
+    return re.sub(r"\s+", " ", str(text or "")).strip().lower()
+
+
+def normalize_prompt(recipe_name, ingredients):
+    """Name and ingredients as compared by the cache: case, spacing and ingredient order ignored."""
+    if isinstance(ingredients, str):
+        ingredients = ingredients.split(",")
+    return {
+        "name": _clean(recipe_name),
+        "ingredients": sorted({_clean(i) for i in ingredients or () if _clean(i)}),
+    }
+
+
+def image_key(recipe_name, ingredients, **params):
+    """sha256 hex of the normalized prompt plus every generation parameter that changes the image."""
+    payload = {"prompt": normalize_prompt(recipe_name, ingredients), "params": params}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def cache_name(key):
+    """Storage name (relative to MEDIA_ROOT) of the image cached under ``key``."""
+    return f"{CACHE_DIR}/{key[:2]}/{key}{EXTENSION}"
+
+
+def _path(name):
+    return os.path.join(settings.MEDIA_ROOT, name)
+
+
+def lookup(key):
+    """Storage name of the cached image, or None. A hit counts as a use for eviction."""
+    name = cache_name(key)
+    try:
+        os.utime(_path(name))
+    except OSError:
+        return None
+    return name
+
+
+def store(key, data):
+    """Save JPEG bytes under ``key`` (atomically) and trim the cache; returns the storage name."""
+    name = cache_name(key)
+    path = _path(name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp_path, path)
+    evict(keep={name})
+    return name
+
+
+def _referenced():
+    from .models import ImageJob, Recipe
+
+    prefix = f"{CACHE_DIR}/"
+    grace = timedelta(seconds=getattr(settings, "IMAGE_CACHE_JOB_GRACE_SECONDS", 3600))
+    recent_jobs = ImageJob.objects.filter(
+        status=ImageJob.DONE, finished_at__gte=timezone.now() - grace, image__startswith=prefix,
+    )
+    return (set(Recipe.objects.filter(image__startswith=prefix).values_list("image", flat=True))
+            | set(recent_jobs.values_list("image", flat=True)))
+
+
+def cache_usage():
+    """[(mtime, size, storage name)] of every cached image, oldest first."""
+    root = _path(CACHE_DIR)
+    entries = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if not filename.endswith(EXTENSION):
+                continue
+            path = os.path.join(dirpath, filename)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            name = os.path.relpath(path, settings.MEDIA_ROOT).replace(os.sep, "/")
+            entries.append((stat.st_mtime, stat.st_size, name))
+    entries.sort()
+    return entries
+
+
+def evict(max_bytes=None, keep=()):
+    """
+    Delete least recently used images until the cache fits ``max_bytes``
+    (default settings.IMAGE_CACHE_MAX_MB). Returns the bytes freed.
+    """
+    if max_bytes is None:
+        max_bytes = int(getattr(settings, "IMAGE_CACHE_MAX_MB", 2048) * 2 ** 20)
+    entries = cache_usage()
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return 0
+    keep = set(keep) | _referenced()
+    freed = 0
+    for _, size, name in entries:
+        if total - freed <= max_bytes:
+            break
+        if name in keep:
+            continue
+        try:
+            os.remove(_path(name))
+        except OSError:
+            continue
+        freed += size
+    return freed
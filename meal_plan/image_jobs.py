@@ -0,0 +1,292 @@
+# meal_plan/image_jobs.py
+"""
+Recipe images generated outside the request.
+
+The dashboard only queues an ImageJob and renders the recipe with a
+placeholder; ``manage.py run_image_worker`` is the one long-lived
+process that loads the Stable Diffusion pipeline, takes pending jobs
+oldest first (several per pipeline call) and stores each finished
+image under MEDIA_ROOT. The page polls ``image-jobs/<id>/`` until the
+job is done.
+
+Images are looked up in the image_cache first: a job whose prompt was
+rendered before is done as soon as it is queued, and finished jobs and
+saved recipes share the one cached file. A job stores the image profile
+it was queued under, so its cache key and its render agree even when
+IMAGE_PROFILE changes in between.
+
+The queue is the ImageJob table itself (no broker). A job is claimed
+with SELECT ... FOR UPDATE SKIP LOCKED where the database supports it,
+and by a conditional status update everywhere, so a second worker never
+picks up the same job. Each worker also keeps an ImageWorker row up to
+date (loading / ready, every IMAGE_WORKER_HEARTBEAT_SECONDS), which is
+how the web workers' ``ready/`` endpoint sees it.
+"""
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import image_cache
+from .image_profiles import IMAGE_FIELDS, active_profile
+from .models import ImageJob, ImageWorker
+
+
+def generation_params(steps, profile=None):
+    """Everything besides the prompt that changes the generated image (part of the cache key)."""
+    from .utils import MODEL_ID
+
+    profile = active_profile(profile)
+    params = {field: profile[field] for field in IMAGE_FIELDS}
+    return {**params, "model": MODEL_ID, "steps": steps or profile["steps"]}
+
+
+def job_cache_key(job):
+    # jobs queued before profiles were stored fall back to the active one
+    return image_cache.image_key(job.recipe_name, job.ingredients,
+                                 **generation_params(job.steps, job.profile or None))
+
+
+def job_profile(profile=None):
+    """
+    The resolved profile new jobs are stored with. "auto" depends on the
+    machine, so it is resolved the way a live image worker resolved it
+    (the web process may have no GPU) and only locally when none is up.
+    """
+    name = profile or getattr(settings, "IMAGE_PROFILE", "auto")
+    if name == "auto":
+        name = worker_readiness().get("profile") or None
+    return active_profile(name)
+
+
+def enqueue_recipe_image(user, recipe_name, ingredients, steps=None, profile=None):
+    """
+    Queue one image (already done when it is cached); returns the ImageJob
+    to poll. The job keeps the name of the image profile (see job_profile)
+    it is cached and rendered with; ``steps`` defaults to that profile's.
+    """
+    profile = job_profile(profile)
+    job = ImageJob(
+        user=user,
+        recipe_name=recipe_name or "",
+        ingredients=ingredients or "",
+        profile=profile["name"],
+        steps=steps or profile["steps"],
+    )
+    cached = image_cache.lookup(job_cache_key(job))
+    if cached:
+        job.image.name = cached
+        job.status = ImageJob.DONE
+        job.finished_at = timezone.now()
+    job.save()
+    return job
+
+
+def enqueue_recipe_images(user, pairs, steps=None):
+    """enqueue_recipe_image for several (name, ingredients) pairs, visible to the worker together."""
+    profile = job_profile()
+    with transaction.atomic():
+        return [enqueue_recipe_image(user, name, ingredients, steps, profile) for name, ingredients in pairs]
+
+
+def _has_file(job):
+    # a cached image can have been evicted since the job finished
+    return bool(job.image) and job.image.storage.exists(job.image.name)
+
+
+def _requeue_evicted(job):
+    # an older job whose image was evicted since: render it again rather than poll forever
+    if (ImageJob.objects
+            .filter(pk=job.pk, status=ImageJob.DONE)
+            .update(status=ImageJob.PENDING, image="", started_at=None, finished_at=None)):
+        job.status, job.image.name, job.started_at, job.finished_at = ImageJob.PENDING, "", None, None
+
+
+def job_status(job):
+    """What the poll endpoint returns for ``job`` (a done job whose image is gone is queued again)."""
+    if job.status == ImageJob.DONE and not _has_file(job):
+        _requeue_evicted(job)
+    return {
+        "id": job.id,
+        "status": job.status,
+        "image_url": job.image.url if job.status == ImageJob.DONE else "",
+        "error": job.error if job.status == ImageJob.FAILED else "",
+    }
+
+
+def attach_job_image(recipe, job_id, user):
+    """Point a saved Recipe at a finished job's image. False when there is none (yet)."""
+    try:
+        job = ImageJob.objects.get(id=int(job_id), user=user)
+    except (TypeError, ValueError, ImageJob.DoesNotExist):
+        return False
+    if job.status != ImageJob.DONE or not _has_file(job):
+        return False
+    # the recipe points at the same file; image_cache never evicts it while it does
+    recipe.image.name = job.image.name
+    recipe.save(update_fields=["image"])
+    return True
+
+
+# ------------------- Worker side -------------------
+
+def claim_next_jobs(limit=1):
+    """Mark up to ``limit`` of the oldest pending jobs as running and return them ([] when the queue is empty)."""
+    while True:
+        with transaction.atomic():
+            jobs = list(
+                ImageJob.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=ImageJob.PENDING)
+                .order_by("created_at", "pk")[:max(1, limit)]
+            )
+            if not jobs:
+                return []
+            started = timezone.now()
+            claimed = []
+            for job in jobs:
+                # SQLite has no row locks: the status check makes the claim safe there too
+                if (ImageJob.objects
+                        .filter(pk=job.pk, status=ImageJob.PENDING)
+                        .update(status=ImageJob.RUNNING, started_at=started)):
+                    job.status, job.started_at = ImageJob.RUNNING, started
+                    claimed.append(job)
+        if claimed:
+            return claimed
+
+
+def _finish(job, name=None, error=None):
+    if error is None:
+        job.image.name = name
+        job.status, job.error = ImageJob.DONE, ""
+    else:
+        job.status, job.error = ImageJob.FAILED, error
+    job.finished_at = timezone.now()
+    # only while the claim is still ours: a job requeued as stale may have been claimed again
+    (ImageJob.objects
+        .filter(pk=job.pk, status=ImageJob.RUNNING, started_at=job.started_at)
+        .update(image=job.image.name or "", status=job.status, error=job.error, finished_at=job.finished_at))
+
+
+def run_jobs(jobs, generate=None):
+    """
+    Generate the images of claimed jobs and store the outcome on each.
+    Cached prompts are skipped, and the rest go through
+    ``generate(pairs, steps=..., profile=...)`` (utils.generate_recipe_images)
+    as one batch per stored profile and step count, so each image matches
+    its cache key; identical prompts are rendered once.
+    """
+    if generate is None:
+        from .utils import generate_recipe_images as generate
+    misses = {}     # (profile, steps) -> {cache key: [jobs]}
+    for job in jobs:
+        key = job_cache_key(job)
+        name = image_cache.lookup(key)
+        if name is not None:
+            _finish(job, name)
+        else:
+            misses.setdefault((job.profile or None, job.steps), {}).setdefault(key, []).append(job)
+    for (profile, steps), by_key in misses.items():
+        error = "No image generated"
+        try:
+            firsts = [waiting[0] for waiting in by_key.values()]
+            images = generate([(job.recipe_name, job.ingredients) for job in firsts], steps=steps, profile=profile)
+            for key, image in zip(by_key, images):
+                buffer = BytesIO()
+                image.save(buffer, format="JPEG")
+                name = image_cache.store(key, buffer.getvalue())
+                for job in by_key[key]:
+                    _finish(job, name)
+        except Exception as e:
+            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+        for waiting in by_key.values():
+            for job in waiting:
+                if job.status == ImageJob.RUNNING:
+                    _finish(job, error=error)
+    return jobs
+
+
+def requeue_interrupted(stale_seconds=None):
+    """
+    Put jobs a stopped worker left running back in the queue; returns how
+    many. Only jobs claimed more than ``stale_seconds`` ago (default
+    settings.IMAGE_JOB_STALE_SECONDS) count as left behind, so the jobs
+    other live workers are rendering stay theirs.
+    """
+    if stale_seconds is None:
+        stale_seconds = getattr(settings, "IMAGE_JOB_STALE_SECONDS", 900)
+    cutoff = timezone.now() - timedelta(seconds=stale_seconds)
+    return (
+        ImageJob.objects
+        .filter(status=ImageJob.RUNNING, started_at__lt=cutoff)
+        .update(status=ImageJob.PENDING, started_at=None)
+    )
+
+
+# ------------------- Worker heartbeat -------------------
+
+def worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def record_worker(name, **fields):
+    """Create or update the ImageWorker row ``name`` with ``fields``, and bump its heartbeat."""
+    ImageWorker.objects.update_or_create(name=name, defaults={**fields, "heartbeat_at": timezone.now()})
+
+
+def start_heartbeat(name, interval=None):
+    """
+    Bump the worker's heartbeat every ``interval`` seconds (default
+    settings.IMAGE_WORKER_HEARTBEAT_SECONDS) from a daemon thread, so it
+    keeps beating through long batches. Returns an Event that stops it.
+    """
+    if interval is None:
+        interval = getattr(settings, "IMAGE_WORKER_HEARTBEAT_SECONDS", 30)
+    stop = threading.Event()
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    ImageWorker.objects.filter(name=name).update(heartbeat_at=timezone.now())
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            connection.close()
+
+    threading.Thread(target=beat, name="image-worker-heartbeat", daemon=True).start()
+    return stop
+
+
+def worker_readiness(max_age=None):
+    """
+    What ``ready/`` reports for the image workers: "ready" when at least
+    one has a heartbeat newer than ``max_age`` seconds (default three
+    heartbeat intervals), else the freshest one's status, or "missing".
+    """
+    if max_age is None:
+        max_age = 3 * getattr(settings, "IMAGE_WORKER_HEARTBEAT_SECONDS", 30)
+    alive = list(
+        ImageWorker.objects
+        .filter(heartbeat_at__gte=timezone.now() - timedelta(seconds=max_age))
+        .order_by("-heartbeat_at")
+    )
+    ready = [w for w in alive if w.status == ImageWorker.READY]
+    worker = (ready or alive or [None])[0]
+    if worker is None:
+        return {"status": "missing", "seconds": None, "error": "", "workers": 0}
+    return {
+        "status": worker.status,
+        "seconds": worker.load_seconds,
+        "error": worker.error,
+        "workers": len(ready),
+        "profile": worker.profile,
+        "heartbeat_at": worker.heartbeat_at.isoformat(),
+    }
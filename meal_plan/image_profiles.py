@@ -0,0 +1,84 @@
+# meal_plan/image_profiles.py
+"""
+Inference profiles for the recipe image pipeline.
+
+A profile fixes everything about how an image is generated:
+
+    device              "auto" (CUDA, then Apple MPS, else CPU), "cuda", "mps" or "cpu"
+    dtype               "float16" or "float32"; always float32 on CPU
+    scheduler           "default" (the model's own) or "dpm" (DPMSolver++, good in 10-25 steps)
+    steps               denoising steps per image
+    width, height       output size in pixels (multiples of 8)
+    guidance_scale      classifier-free guidance
+    attention_slicing   compute attention in slices: less peak memory, a little slower
+
+settings.IMAGE_PROFILE picks one by name ("auto": "quality" with a GPU,
+"cpu_fast" without) and settings.IMAGE_PROFILES can add or override
+profiles. settings.IMAGE_TORCH_THREADS sets torch's intra-op threads.
+``manage.py benchmark_image_profiles`` records latency and memory per
+profile on the current machine.
+"""
+from django.conf import settings
+
+PROFILES = {
+    "quality": {
+        "device": "auto", "dtype": "float16", "scheduler": "default", "steps": 50,
+        "width": 512, "height": 512, "guidance_scale": 7.5, "attention_slicing": False,
+    },
+    "gpu_fast": {
+        "device": "auto", "dtype": "float16", "scheduler": "dpm", "steps": 20,
+        "width": 512, "height": 512, "guidance_scale": 7.5, "attention_slicing": False,
+    },
+    "cpu_fast": {
+        "device": "cpu", "dtype": "float32", "scheduler": "dpm", "steps": 12,
+        "width": 384, "height": 384, "guidance_scale": 7.0, "attention_slicing": True,
+    },
+    "cpu_draft": {
+        "device": "cpu", "dtype": "float32", "scheduler": "dpm", "steps": 8,
+        "width": 256, "height": 256, "guidance_scale": 7.0, "attention_slicing": True,
+    },
+}
+
+# profile fields that change the pixels, and so belong in the image cache key
+IMAGE_FIELDS = ("dtype", "scheduler", "steps", "width", "height", "guidance_scale")
+
+
+def detect_device():
+    try:
+        import torch
+    except ImportError:
+        return "cpu"
+    if torch.cuda.is_available():
+        return "cuda"
+    mps = getattr(torch.backends, "mps", None)
+    if mps is not None and mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def all_profiles():
+    return {**PROFILES, **getattr(settings, "IMAGE_PROFILES", {})}
+
+
+def active_profile(profile=None):
+    """
+    The profile called ``profile`` (default settings.IMAGE_PROFILE) with
+    its device resolved, as a dict that also carries "name" and "threads".
+    A dict that is already resolved is returned as is.
+    """
+    if isinstance(profile, dict):
+        return profile
+    profiles = all_profiles()
+    name = profile or getattr(settings, "IMAGE_PROFILE", "auto")
+    if name == "auto":
+        name = "quality" if detect_device() == "cuda" else "cpu_fast"
+    if name not in profiles:
+        raise ValueError(f"Unknown image profile {name!r}; choose from {', '.join(sorted(profiles))}")
+    resolved = {**PROFILES["quality"], **profiles[name], "name": name}
+    if resolved["device"] == "auto":
+        resolved["device"] = detect_device()
+    if resolved["device"] == "cpu":
+        # half precision is unsupported or very slow on CPU
+        resolved["dtype"] = "float32"
+    resolved["threads"] = int(getattr(settings, "IMAGE_TORCH_THREADS", 0) or 0)
+    return resolved
@@ -0,0 +1,149 @@
+# meal_plan/ingredient_index.py
+"""
+Inverted ingredient index over the recipe catalog.
+
+Every recipe's ``RecipeIngredientParts_cleaned`` string is split once, at
+catalog build time, into ids of a shared ingredient vocabulary:
+
+    indptr / indices            recipe -> sorted ingredient ids (CSR)
+    post_indptr / post_indices  ingredient -> sorted recipe ids (CSR)
+
+"Contains every pantry item and at most ``max_extra`` other ingredients"
+then becomes an intersection of posting lists plus a length check, which
+is fast enough to run over the whole catalog on every request.
+"""
+import json
+import os
+
+import numpy as np
+
+INGREDIENT_COLUMN = "RecipeIngredientParts_cleaned"
+VOCAB_FILE = "vocab.json"
+
+
+def normalize_ingredient(name):
+    return str(name).strip().lower()
+
+
+def tokenize_ingredients(value):
+    """Same rule the strict pantry filter always used: comma split, strip, lower."""
+    if not isinstance(value, str):
+        return []
+    return list(dict.fromkeys(t for t in (normalize_ingredient(i) for i in value.split(",")) if t))
+
+
+class IngredientIndexBuilder:
+    """Collects recipe -> ingredient ids chunk by chunk."""
+
+    def __init__(self):
+        self.token_ids = {}
+
+    def add(self, values):
+        lengths = np.zeros(len(values), dtype=np.int64)
+        ids = []
+        for pos, value in enumerate(values):
+            row = sorted(self.token_ids.setdefault(t, len(self.token_ids)) for t in tokenize_ingredients(value))
+            lengths[pos] = len(row)
+            ids.extend(row)
+        return lengths, np.asarray(ids, dtype=np.int32)
+
+    @property
+    def vocab(self):
+        return list(self.token_ids)
+
+
+def build_postings(indptr, indices, n_cols, chunk_rows=100_000):
+    """
+    Row pointers of the transpose of a CSR structure (ingredient ->
+    recipe postings, or term -> recipe for TF-IDF). Works in row chunks,
+    so arrays may be memory-mapped and larger than RAM.
+    """
+    counts = np.zeros(n_cols, dtype=np.int64)
+    n_rows = len(indptr) - 1
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        counts += np.bincount(indices[indptr[start]:indptr[stop]], minlength=n_cols)
+    post_indptr = np.zeros(n_cols + 1, dtype=np.int64)
+    np.cumsum(counts, out=post_indptr[1:])
+    return post_indptr
+
+
+def fill_postings(indptr, indices, post_indptr, out, data=None, out_data=None, chunk_rows=100_000):
+    """Fill the transposed indices (and values, if given) row chunk by row chunk."""
+    cursor = post_indptr[:-1].copy()
+    n_rows = len(indptr) - 1
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        lo, hi = indptr[start], indptr[stop]
+        cols = np.asarray(indices[lo:hi])
+        rows = np.repeat(np.arange(start, stop, dtype=np.int32), np.diff(indptr[start:stop + 1]))
+        order = np.argsort(cols, kind="stable")
+        cols, rows = cols[order], rows[order]
+        # rank of each entry inside its column group
+        first = np.searchsorted(cols, cols, side="left")
+        dest = cursor[cols] + (np.arange(len(cols)) - first)
+        out[dest] = rows
+        if data is not None:
+            out_data[dest] = np.asarray(data[lo:hi])[order]
+        np.add.at(cursor, cols, 1)
+    return out
+
+
+class IngredientIndex:
+
+    def __init__(self, vocab, indptr, indices, post_indptr, post_indices):
+        self.vocab = vocab
+        self.token_to_id = {t: i for i, t in enumerate(vocab)}
+        self.indptr = indptr
+        self.indices = indices
+        self.post_indptr = post_indptr
+        self.post_indices = post_indices
+        self.row_lengths = np.diff(indptr)
+
+    @classmethod
+    def from_values(cls, values):
+        builder = IngredientIndexBuilder()
+        lengths, indices = builder.add(list(values))
+        indptr = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=indptr[1:])
+        post_indptr = build_postings(indptr, indices, len(builder.vocab))
+        post_indices = fill_postings(indptr, indices, post_indptr, np.empty(len(indices), dtype=np.int32))
+        return cls(builder.vocab, indptr, indices, post_indptr, post_indices)
+
+    @classmethod
+    def open(cls, path, load_array):
+        with open(os.path.join(path, VOCAB_FILE)) as fh:
+            vocab = json.load(fh)
+        arrays = [load_array(os.path.join(path, f"{name}.npy"))
+                  for name in ("indptr", "indices", "post_indptr", "post_indices")]
+        return cls(vocab, *arrays)
+
+    def __len__(self):
+        return len(self.row_lengths)
+
+    def postings(self, token_id):
+        return self.post_indices[self.post_indptr[token_id]:self.post_indptr[token_id + 1]]
+
+    def ingredients(self, recipe_id):
+        return [self.vocab[t] for t in self.indices[self.indptr[recipe_id]:self.indptr[recipe_id + 1]]]
+
+    def match(self, pantry_list, max_extra=3):
+        """
+        Recipe ids (sorted) that contain every pantry ingredient and at
+        most ``max_extra`` ingredients that are not in the pantry.
+        """
+        pantry = {normalize_ingredient(p) for p in pantry_list if normalize_ingredient(p)}
+        token_ids = [self.token_to_id.get(p) for p in pantry]
+        if None in token_ids:
+            return np.empty(0, dtype=np.int64)
+
+        if token_ids:
+            lists = sorted((self.postings(t) for t in token_ids), key=len)
+            ids = np.asarray(lists[0], dtype=np.int64)
+            for other in lists[1:]:
+                ids = ids[np.isin(ids, other, assume_unique=True)]
+        else:
+            ids = np.flatnonzero(self.row_lengths > 0)
+
+        # every pantry item is in the recipe, so extras = size - |pantry|
+        return ids[self.row_lengths[ids] - len(token_ids) <= max_extra]
@@ -0,0 +1,230 @@
+# meal_plan/instrumentation.py
+"""
+Stage timing for the recommendation and meal-plan pipelines.
+
+    with span("generate_ai_meal") as trace:
+        with span("retrieve", mode="match") as s:
+            recs = ...
+            s.set(candidates=len(recs))
+
+Spans nest (per thread / asyncio task): a finished top-level span is
+handed, with its children, to every configured sink. Sinks come from
+settings.MEAL_PLAN_METRICS_SINKS (dotted class paths) or ``add_sink``:
+
+    LoggingSink     one log line per trace, optionally only slow ones
+    HistogramSink   in-process latency percentiles per stage path
+                    (served as JSON by the recommender metrics view)
+
+With no sink configured ``span`` returns a shared no-op object, so an
+instrumented stage costs one function call.
+"""
+import contextvars
+import logging
+import math
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_SINKS = []
+_CURRENT = contextvars.ContextVar("meal_plan_span", default=None)
+
+
+# ------------------- Spans -------------------
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "path", "fields", "children", "duration", "_start", "_token")
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.path = name
+        self.fields = fields
+        self.children = []
+        self.duration = 0.0
+
+    def set(self, **fields):
+        """Attach counts or labels (e.g. ``candidates=len(df)``) to the stage."""
+        self.fields.update(fields)
+
+    def __enter__(self):
+        parent = _CURRENT.get()
+        if parent is not None:
+            self.path = f"{parent.path}.{self.name}"
+            parent.children.append(self)
+        self._token = _CURRENT.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._start
+        _CURRENT.reset(self._token)
+        if exc_type is not None:
+            self.fields["error"] = exc_type.__name__
+        if self.path == self.name:
+            _emit(self)
+        return False
+
+    def walk(self):
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+
+def span(name, **fields):
+    """Time a pipeline stage; a no-op unless a sink is configured."""
+    if not _SINKS:
+        return NOOP_SPAN
+    return Span(name, fields)
+
+
+def enabled():
+    return bool(_SINKS)
+
+
+def _emit(trace):
+    for sink in list(_SINKS):
+        try:
+            sink.record(trace)
+        except Exception:
+            logger.exception("Metrics sink %r failed", sink)
+
+
+# ------------------- Sinks -------------------
+
+def _format_fields(fields):
+    return " ".join(f"{k}={v}" for k, v in fields.items())
+
+
+class LoggingSink:
+    """Logs each trace (stage tree with ms and fields) slower than ``slow_ms``."""
+
+    def __init__(self, slow_ms=None, level=logging.INFO):
+        if slow_ms is None:
+            slow_ms = getattr(settings, "MEAL_PLAN_METRICS_SLOW_MS", 0)
+        self.slow_ms = slow_ms
+        self.level = level
+
+    def record(self, trace):
+        if trace.duration * 1000 < self.slow_ms:
+            return
+        lines = [f"{trace.name} {trace.duration * 1000:.1f}ms {_format_fields(trace.fields)}".rstrip()]
+        for stage in trace.walk():
+            if stage is not trace:
+                depth = stage.path.count(".")
+                lines.append(f"{'  ' * depth}{stage.name} {stage.duration * 1000:.1f}ms "
+                             f"{_format_fields(stage.fields)}".rstrip())
+        logger.log(self.level, "\n".join(lines))
+
+
+class _Stage:
+    __slots__ = ("count", "total", "samples", "numeric")
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=window)
+        self.numeric = {}       # field -> [count, sum]
+
+
+class HistogramSink:
+    """
+    Per stage path: call count, total/mean time and percentiles over the
+    last ``window`` calls, plus the mean of every numeric field (e.g.
+    candidate counts).
+    """
+
+    def __init__(self, window=1024):
+        self.window = window
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, trace):
+        with self._lock:
+            for stage in trace.walk():
+                entry = self._stages.get(stage.path)
+                if entry is None:
+                    entry = self._stages[stage.path] = _Stage(self.window)
+                entry.count += 1
+                entry.total += stage.duration
+                entry.samples.append(stage.duration)
+                for key, value in stage.fields.items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        acc = entry.numeric.setdefault(key, [0, 0.0])
+                        acc[0] += 1
+                        acc[1] += value
+
+    @staticmethod
+    def _percentile(ordered, q):
+        # nearest-rank percentile of a sorted, non-empty list
+        return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+    def snapshot(self):
+        with self._lock:
+            stages = {path: (e.count, e.total, sorted(e.samples), dict(e.numeric))
+                      for path, e in self._stages.items()}
+        report = {}
+        for path, (count, total, ordered, numeric) in sorted(stages.items()):
+            report[path] = {
+                "count": count,
+                "mean_ms": round(total / count * 1000, 3),
+                "p50_ms": round(self._percentile(ordered, 0.50) * 1000, 3),
+                "p95_ms": round(self._percentile(ordered, 0.95) * 1000, 3),
+                "p99_ms": round(self._percentile(ordered, 0.99) * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+                **{f"mean_{k}": round(s / n, 2) for k, (n, s) in numeric.items()},
+            }
+        return report
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+
+
+# ------------------- Configuration -------------------
+
+def add_sink(sink):
+    if sink not in _SINKS:
+        _SINKS.append(sink)
+    return sink
+
+
+def remove_sink(sink):
+    if sink in _SINKS:
+        _SINKS.remove(sink)
+
+
+def configure_sinks(paths=None):
+    """(Re)create the sinks named in settings.MEAL_PLAN_METRICS_SINKS."""
+    if paths is None:
+        paths = getattr(settings, "MEAL_PLAN_METRICS_SINKS", [])
+    sinks = [import_string(p.strip())() for p in paths if p.strip()]
+    _SINKS[:] = sinks
+    return sinks
+
+
+def metrics_snapshot():
+    """Snapshots of every sink that keeps aggregates (see HistogramSink)."""
+    return {
+        type(sink).__name__: sink.snapshot()
+        for sink in _SINKS if hasattr(sink, "snapshot")
+    }
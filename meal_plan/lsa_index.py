@@ -0,0 +1,120 @@
+# meal_plan/lsa_index.py
+"""
+Optional dense retrieval: every TF-IDF row projected offline onto a
+TruncatedSVD (LSA) basis of a few hundred dimensions.
+
+    components.npy    LSA basis (n_components x n_features), float32
+    vectors.npy       L2-normalized LSA vector of every recipe (n_rows x n_components), float32
+    meta.json
+
+A query is projected the same way and scored against every recipe with
+one float32 matrix product, so latency depends on the catalog size and
+dimension only, not on how common the pantry terms are. Scores are
+cosines in LSA space, which approximate the TF-IDF ranking; see
+``manage.py evaluate_lsa`` for the overlap with exact sparse top-k.
+Built by ``manage.py build_lsa_index`` into ``<catalog>/lsa`` and used
+when settings.RECIPE_RETRIEVAL is "lsa".
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+
+from .ann_index import project
+from .retrieval import SparseRetriever, per_query, top_k_scores
+
+LSA_DIR = "lsa"
+META_FILE = "meta.json"
+# scores held in memory at once (queries x recipes) when searching in batches
+_BLOCK_SCORES = 8_000_000
+
+
+def build_lsa_index(path, matrix, n_components=256, sample_size=100_000, chunk_rows=50_000, seed=0):
+    """
+    Fit the LSA basis on a sample of ``matrix`` rows and project every
+    row. The directory at ``path`` is replaced atomically.
+    """
+    n_rows, n_features = matrix.shape
+    rng = np.random.default_rng(seed)
+    sample = np.sort(rng.choice(n_rows, min(n_rows, sample_size), replace=False))
+    n_components = max(1, min(n_components, n_features - 1, len(sample) - 1))
+    svd = TruncatedSVD(n_components=n_components, random_state=seed).fit(matrix[sample])
+    components = svd.components_.astype(np.float32)
+
+    path = os.path.abspath(path)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, "components.npy"), components)
+    vectors = np.lib.format.open_memmap(os.path.join(tmp_path, "vectors.npy"), mode="w+",
+                                        dtype=np.float32, shape=(n_rows, n_components))
+    for start in range(0, n_rows, chunk_rows):
+        stop = min(start + chunk_rows, n_rows)
+        vectors[start:stop] = project(matrix[start:stop], components)
+    vectors.flush()
+    del vectors
+    with open(os.path.join(tmp_path, META_FILE), "w") as fh:
+        json.dump({
+            "n_rows": n_rows,
+            "n_features": n_features,
+            "n_components": n_components,
+            "explained_variance": float(svd.explained_variance_ratio_.sum()),
+        }, fh, indent=2)
+
+    old = f"{path}.old-{os.getpid()}"
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+class LSARetriever(SparseRetriever):
+    """
+    SparseRetriever whose similarity search runs on the dense LSA vectors.
+    :meth:`score` (strict-match ranking of known ids) stays exact TF-IDF.
+    """
+
+    def __init__(self, vectorizer, matrix, matrix_t, components, vectors, meta=None):
+        super().__init__(vectorizer, matrix, matrix_t)
+        self.components = components
+        self.vectors = vectors
+        self.meta = meta or {}
+
+    @classmethod
+    def open(cls, path, catalog, load_array):
+        with open(os.path.join(path, META_FILE)) as fh:
+            meta = json.load(fh)
+        return cls(
+            catalog.vectorizer, catalog.matrix, catalog.matrix_t,
+            np.load(os.path.join(path, "components.npy")),
+            load_array(os.path.join(path, "vectors.npy")),
+            meta,
+        )
+
+    @property
+    def nbytes(self):
+        return self.components.nbytes + self.vectors.nbytes
+
+    def search_queries(self, queries, top_k=10, allowed=None, nprobe=None):
+        """:meth:`SparseRetriever.search_queries` in LSA space (``nprobe`` does not apply)."""
+        dense = project(queries, self.components)
+        block = max(1, _BLOCK_SCORES // max(1, len(self.vectors)))
+        results = []
+        for start in range(0, len(dense), block):
+            scores = dense[start:start + block] @ self.vectors.T
+            for row, row_scores in enumerate(scores, start):
+                mask = per_query(allowed, row)
+                if mask is not None:
+                    row_scores[~mask] = -np.inf
+                k = per_query(top_k, row)
+                # every recipe has a score here: select the k best first,
+                # then drop the excluded ones (only there when fewer than k are allowed)
+                if 0 < k < len(row_scores):
+                    ids = np.argpartition(-row_scores, k - 1)[:k]
+                else:
+                    ids = np.arange(len(row_scores))
+                ids = ids[np.isfinite(row_scores[ids])]
+                results.append(top_k_scores(ids, row_scores[ids], k))
+        return results
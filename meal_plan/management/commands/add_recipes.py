@@ -0,0 +1,48 @@
+import os
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.ai_recommender import DIETARY_RESTRICTIONS, catalog_dir, prepare_recipe_frame
+from meal_plan.catalog_store import append_segment, load_vectorizer
+from meal_plan.ingredient_index import INGREDIENT_COLUMN
+from meal_plan.recipe_catalog import is_catalog
+from meal_plan.retrieval import recipe_text
+
+
+def read_recipes(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return pd.read_csv(path)
+    if ext in (".pkl", ".pickle"):
+        return pd.read_pickle(path)
+    if ext == ".json":
+        return pd.read_json(path)
+    raise CommandError(f"Unsupported recipe file: {path} (use .csv, .pkl or .json)")
+
+
+class Command(BaseCommand):
+    help = (
+        "Append new recipes to the catalog as a delta segment, vectorized with the "
+        "existing vectorizer. Running workers pick the new version up without a restart."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("source", help="Recipes with the same columns as the catalog (.csv, .pkl or .json)")
+        parser.add_argument("--catalog", default=None, help="Catalog directory (default: RECIPE_CATALOG_DIR)")
+
+    def handle(self, *args, **options):
+        path = options["catalog"] or catalog_dir()
+        if not is_catalog(path):
+            raise CommandError(f"{path} is not a recipe catalog; run export_recipe_catalog first")
+        df = read_recipes(options["source"])
+        df.columns = [c.replace(" ", "_") for c in df.columns]
+        if INGREDIENT_COLUMN not in df.columns or "Calories" not in df.columns:
+            raise CommandError(f"Recipes need at least {INGREDIENT_COLUMN} and Calories columns")
+
+        matrix = load_vectorizer(path).transform(df[INGREDIENT_COLUMN].map(recipe_text))
+        df, matrix = prepare_recipe_frame(df, matrix)
+        if not len(df):
+            raise CommandError("No recipes left to add.")
+        version = append_segment(path, df, matrix, restrictions=DIETARY_RESTRICTIONS)
+        self.stdout.write(self.style.SUCCESS(f"Added {len(df)} recipes as catalog version {version}"))
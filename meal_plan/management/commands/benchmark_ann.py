@@ -0,0 +1,88 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.ai_recommender import get_catalog
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) * 1000 if values else 0.0
+
+
+def catalog_pantries(catalog, count, seed):
+    """Pantries made of 2-5 ingredients of random catalog recipes."""
+    rng = np.random.default_rng(seed)
+    out = []
+    for _ in range(count * 20):
+        names = catalog.ingredients.ingredients(int(rng.integers(len(catalog))))
+        if len(names) >= 2:
+            size = min(len(names), int(rng.integers(2, 6)))
+            out.append([str(n) for n in rng.choice(names, size=size, replace=False)])
+        if len(out) == count:
+            break
+    return out
+
+
+def recall(approx, exact):
+    """Recall@k of ``approx`` against ``exact``, lists of (ids, scores) per query."""
+    # Only recipes sharing an ingredient with the pantry (score > 0) count:
+    # exact search pads short result lists with zero-score recipes, which
+    # any other zero-score recipe would match. ANN scores are exact re-rank
+    # scores, so a result is found when it ties the k-th positive exact
+    # score (tie order is arbitrary). Queries without one are skipped.
+    hits = total = 0
+    for (_, scores), (_, exact_scores) in zip(approx, exact):
+        relevant = int(np.sum(exact_scores > 0))
+        if relevant:
+            kth = exact_scores[relevant - 1]
+            hits += min(relevant, int(np.sum((scores > 0) & (scores >= kth - 1e-6))))
+            total += relevant
+    return hits / total if total else 1.0
+
+
+class Command(BaseCommand):
+    help = "Recall@k and latency of the IVF retrieval index against exact search."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--top-k", type=int, default=10)
+        parser.add_argument("--nprobe", default="1,2,4,8,16,32",
+                            help="Comma-separated nprobe values to compare")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        catalog = get_catalog()
+        if catalog is None:
+            raise CommandError("No recipe catalog could be loaded.")
+        retriever = catalog.retriever
+        if retriever.ann is None:
+            ann = catalog.load_ann(nprobe=1)
+            if ann is None:
+                raise CommandError("No ANN index for this catalog; run build_ann_index first.")
+        top_k = options["top_k"]
+        pantries = catalog_pantries(catalog, options["queries"], options["seed"])
+
+        def run(nprobe):
+            results, latencies = [], []
+            for pantry in pantries:
+                start = time.perf_counter()
+                results.append(retriever.search(pantry, top_k=top_k, nprobe=nprobe))
+                latencies.append(time.perf_counter() - start)
+            return results, latencies
+
+        run(0)  # warm the page cache
+        exact, exact_lat = run(0)
+        unmatched = sum(1 for _, exact_scores in exact if not np.any(exact_scores > 0))
+        self.stdout.write(
+            f"{len(catalog)} recipes, {retriever.ann.n_lists} lists, "
+            f"{len(pantries)} queries ({unmatched} without any match, skipped), recall@{top_k}"
+        )
+        self.stdout.write(f"{'nprobe':>8} {'recall':>8} {'p50 ms':>8} {'p95 ms':>8}")
+        self.stdout.write(f"{'exact':>8} {1.0:>8.3f} {_percentile(exact_lat, 50):>8.2f} {_percentile(exact_lat, 95):>8.2f}")
+        for nprobe in [int(n) for n in options["nprobe"].split(",") if n.strip()]:
+            approx, lat = run(nprobe)
+            self.stdout.write(
+                f"{nprobe:>8} {recall(approx, exact):>8.3f} "
+                f"{_percentile(lat, 50):>8.2f} {_percentile(lat, 95):>8.2f}"
+            )
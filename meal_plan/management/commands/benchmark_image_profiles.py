@@ -0,0 +1,114 @@
+import json
+import multiprocessing
+import platform
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.image_profiles import active_profile, all_profiles
+
+PROMPTS = [
+    ("Spinach Omelette", "egg-2, spinach-1, milk-1"),
+    ("Chicken Rice Bowl", "chicken-1, rice-1, onion-1, soy sauce-1"),
+    ("Lentil Soup", "lentil-1, carrot-2, onion-1, garlic-2"),
+    ("Mushroom Pasta", "pasta-1, mushroom-2, cheese-1, butter-1"),
+]
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def _init():
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+
+
+def profile_benchmark(name, batches, batch_size):
+    """Load and time one profile; runs in a fresh process so memory is the profile's own."""
+    from meal_plan.utils import generate_recipe_images, get_pipe, memory_usage
+
+    profile = active_profile(name)
+    started = time.perf_counter()
+    get_pipe(profile)
+    load_s = time.perf_counter() - started
+    pairs = (PROMPTS * batch_size)[:batch_size]
+    generate_recipe_images(pairs[:1], batch_size=1, profile=profile)    # warm-up
+    per_image, per_batch = [], []
+    for _ in range(batches):
+        started = time.perf_counter()
+        generate_recipe_images(pairs, batch_size=batch_size, profile=profile)
+        elapsed = time.perf_counter() - started
+        per_batch.append(elapsed)
+        per_image.append(elapsed / len(pairs))
+    return {
+        "profile": name,
+        "settings": {k: v for k, v in profile.items() if k != "name"},
+        "load_s": round(load_s, 2),
+        "image_s": {"p50": round(_percentile(per_image, 50), 3), "p95": round(_percentile(per_image, 95), 3)},
+        "batch_s": {"p50": round(_percentile(per_batch, 50), 3), "images": len(pairs)},
+        **memory_usage(profile["device"]),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure load time, latency per image and peak memory of each image "
+        "inference profile on this machine (one fresh process per profile)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--profiles", default=None,
+                            help="Comma-separated profile names (default: every profile)")
+        parser.add_argument("--batches", type=int, default=3, help="Timed pipeline calls per profile")
+        parser.add_argument("--batch-size", type=int, default=1,
+                            help="Prompts per call (3 = a day plan)")
+        parser.add_argument("--slo", type=float, default=None,
+                            help="Latency target in seconds per image; marks the profiles that meet it at p95")
+        parser.add_argument("--output", help="Also write the report as JSON here")
+
+    def handle(self, *args, **options):
+        known = all_profiles()
+        names = [n.strip() for n in (options["profiles"] or ",".join(known)).split(",") if n.strip()]
+        unknown = [n for n in names if n not in known]
+        if unknown or not names:
+            raise CommandError(f"Unknown profiles: {', '.join(unknown) or '(none)'}; choose from {', '.join(known)}")
+
+        results = []
+        context = multiprocessing.get_context("spawn")
+        for name in names:
+            self.stdout.write(f"⏳ {name}...")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init) as pool:
+                try:
+                    results.append(pool.submit(
+                        profile_benchmark, name, max(1, options["batches"]), max(1, options["batch_size"])
+                    ).result())
+                except Exception as e:
+                    results.append({"profile": name, "error": f"{type(e).__name__}: {e}"})
+
+        self.stdout.write(f"{'profile':<12} {'device':<6} {'steps':>5} {'size':>9} {'load s':>7} "
+                          f"{'p50 s/img':>10} {'p95 s/img':>10} {'RSS MiB':>8} {'GPU MiB':>8}")
+        for result in results:
+            if "error" in result:
+                self.stdout.write(f"{result['profile']:<12} failed: {result['error']}")
+                continue
+            p = result["settings"]
+            meets = ""
+            if options["slo"] is not None:
+                result["meets_slo"] = result["image_s"]["p95"] <= options["slo"]
+                meets = "  ✅" if result["meets_slo"] else "  ❌"
+            self.stdout.write(
+                f"{result['profile']:<12} {p['device']:<6} {p['steps']:>5} {p['width']:>4}x{p['height']:<4} "
+                f"{result['load_s']:>7.1f} {result['image_s']['p50']:>10.2f} {result['image_s']['p95']:>10.2f} "
+                f"{result['peak_rss_mib']:>8.0f} {result.get('peak_cuda_mib', 0):>8.0f}{meets}"
+            )
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump({"machine": platform.platform(), "processor": platform.processor(),
+                           "batch_size": options["batch_size"], "results": results}, fh, indent=2)
+                fh.write("\n")
@@ -0,0 +1,246 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from meal_plan.ai_recommender import (
+    filter_by_serving_size,
+    filter_recipes_by_pantry_ingredients,
+    generate_ai_meal,
+    generate_meal_plan,
+    load_catalog,
+    personalize_results,
+    pinned_catalog,
+    recommend_by_pantry,
+)
+from meal_plan.models import Profile
+from meal_plan.recommendation_cache import RECOMMENDATION_CACHE
+from meal_plan.synthetic_catalog import is_synthetic_catalog, synthetic_pantry, write_synthetic_catalog
+
+PROFILES = {
+    "none": None,
+    "maintenance": {"goal": "Maintenance"},
+    "vegetarian_loss": {"goal": "Weight Loss", "dietary_pref": "Vegetarian"},
+    "vegan_allergies": {"goal": "Weight Gain", "dietary_pref": "Vegan", "allergy_info": "peanut, shrimp"},
+}
+
+# catalog rows written per chunk while generating
+BUILD_CHUNK = 50_000
+# --compare ignores slowdowns smaller than this (timer noise on sub-ms stages)
+NOISE_MS = 0.1
+
+
+def parse_size(value):
+    """'10000', '10k' or '1M' -> rows."""
+    value = value.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(value[-1:], 1)
+    return int(float(value.rstrip("km")) * scale)
+
+
+def bench_user(profile):
+    if profile is None:
+        return SimpleNamespace(pk=None)
+    return SimpleNamespace(pk=None, profile=Profile(age=35, height_cm=172, weight_kg=75, **profile))
+
+
+def summarize(times):
+    ms = np.asarray(times) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "min_ms": round(float(ms.min()), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=getattr(settings, "BASE_DIR", None),
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the recommender stages on synthetic catalogs (no ai_data.pkl needed) "
+        "and report the results as JSON, for comparing commits."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="10k,100k,1M",
+                            help="Comma-separated catalog sizes (e.g. 10k,100k,1M)")
+        parser.add_argument("--pantry-sizes", default="3,8,15",
+                            help="Comma-separated pantry sizes")
+        parser.add_argument("--profiles", default=",".join(PROFILES),
+                            help=f"Comma-separated subset of: {', '.join(PROFILES)}")
+        parser.add_argument("--queries", type=int, default=20,
+                            help="Random pantries timed per case")
+        parser.add_argument("--shortlist", type=int, default=200,
+                            help="Recipes recommend_by_pantry returns for the filter stages")
+        parser.add_argument("--serving-size", type=int, default=4)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "meal_plan_benchmark"),
+                            help="Where synthetic catalogs are built and kept between runs")
+        parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+        parser.add_argument("--compare", help="Earlier JSON report to compare p50 times against")
+        parser.add_argument("--threshold", type=float, default=1.2,
+                            help="p50 slowdown ratio reported as a regression by --compare")
+
+    def log(self, message):
+        self.stderr.write(message)
+
+    def handle(self, *args, **options):
+        sizes = [parse_size(s) for s in options["sizes"].split(",") if s.strip()]
+        pantry_sizes = [int(s) for s in options["pantry_sizes"].split(",") if s.strip()]
+        profiles = [p.strip() for p in options["profiles"].split(",") if p.strip()]
+        unknown = set(profiles) - set(PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+        if options["queries"] < 1:
+            raise CommandError("--queries must be at least 1.")
+
+        report = {
+            "meta": {
+                "revision": git_revision(),
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": sys.version.split()[0],
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "options": {k: options[k] for k in ("pantry_sizes", "queries", "shortlist", "serving_size", "seed")},
+            },
+            "catalogs": [],
+            "results": [],
+        }
+        # no server round-trips or catalog polling inside the timings
+        with override_settings(RECOMMENDER_SOCKET="", RECIPE_CATALOG_POLL_SECONDS=0):
+            for n_rows in sizes:
+                catalog, info = self.catalog(n_rows, options)
+                report["catalogs"].append(info)
+                with pinned_catalog(catalog):
+                    report["results"].extend(self.run(catalog, pantry_sizes, profiles, options))
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                fh.write(text + "\n")
+            self.log(f"Report written to {options['output']}")
+        else:
+            self.stdout.write(text)
+        if options["compare"]:
+            self.compare(report, options["compare"], options["threshold"])
+
+    def catalog(self, n_rows, options):
+        path = os.path.join(options["workdir"], f"catalog-{n_rows}-seed{options['seed']}")
+        info = {"rows": n_rows, "path": path, "build_s": None}
+        if not is_synthetic_catalog(path, n_rows, options["seed"]):
+            self.log(f"Generating {n_rows} synthetic recipes in {path}")
+            start = time.perf_counter()
+            write_synthetic_catalog(path, n_rows, seed=options["seed"], chunk_size=BUILD_CHUNK)
+            info["build_s"] = round(time.perf_counter() - start, 2)
+        start = time.perf_counter()
+        catalog = load_catalog(path=path)
+        info["open_s"] = round(time.perf_counter() - start, 4)
+        return catalog, info
+
+    def run(self, catalog, pantry_sizes, profiles, options):
+        n_rows = len(catalog)
+        shortlist = options["shortlist"]
+        serving_size = options["serving_size"]
+        results = []
+
+        def record(function, pantry_size, profile, times, rows):
+            results.append({
+                "catalog_rows": n_rows, "function": function, "pantry_size": pantry_size,
+                "profile": profile, "mean_rows": round(float(np.mean(rows)), 1), **summarize(times),
+            })
+
+        def timed(fn):
+            start = time.perf_counter()
+            out = fn()
+            return time.perf_counter() - start, out
+
+        for pantry_size in pantry_sizes:
+            # the same pantries for a given seed and size, whatever else is run
+            rng = np.random.default_rng([options["seed"], pantry_size])
+            pantries = [synthetic_pantry(pantry_size, rng) for _ in range(options["queries"])]
+            self.log(f"{n_rows} recipes, pantry of {pantry_size}")
+            recommend_by_pantry(pantries[0], top_k=shortlist)     # warm the page cache
+
+            # profile-independent stages
+            stage_times = {name: ([], []) for name in
+                           ("recommend_by_pantry", "filter_recipes_by_pantry_ingredients", "filter_by_serving_size")}
+            shortlists = []
+            for pantry in pantries:
+                elapsed, recs = timed(lambda: recommend_by_pantry(pantry, top_k=shortlist))
+                shortlists.append(recs)
+                stage_times["recommend_by_pantry"][0].append(elapsed)
+                stage_times["recommend_by_pantry"][1].append(len(recs))
+                elapsed, out = timed(lambda: filter_recipes_by_pantry_ingredients(recs, pantry, max_extra=3))
+                stage_times["filter_recipes_by_pantry_ingredients"][0].append(elapsed)
+                stage_times["filter_recipes_by_pantry_ingredients"][1].append(len(out))
+                elapsed, out = timed(lambda: filter_by_serving_size(recs, serving_size, tolerance=4))
+                stage_times["filter_by_serving_size"][0].append(elapsed)
+                stage_times["filter_by_serving_size"][1].append(len(out))
+            for name, (times, rows) in stage_times.items():
+                record(name, pantry_size, None, times, rows)
+
+            for profile in profiles:
+                user = bench_user(PROFILES[profile])
+                stage_times = {name: ([], []) for name in
+                               ("personalize_results", "generate_ai_meal", "generate_meal_plan")}
+                for pantry, recs in zip(pantries, shortlists):
+                    items = [SimpleNamespace(ingredient_name=name) for name in pantry]
+                    elapsed, out = timed(lambda: personalize_results(recs, user))
+                    stage_times["personalize_results"][0].append(elapsed)
+                    stage_times["personalize_results"][1].append(len(out))
+                    for name, fn in (
+                        ("generate_ai_meal", lambda: generate_ai_meal(user, items, serving_size=serving_size)),
+                        ("generate_meal_plan", lambda: generate_meal_plan(user, items, serving_size=serving_size)),
+                    ):
+                        RECOMMENDATION_CACHE.clear()     # time the pipeline, not the cache
+                        elapsed, out = timed(fn)
+                        stage_times[name][0].append(elapsed)
+                        stage_times[name][1].append(len(out))
+                for name, (times, rows) in stage_times.items():
+                    record(name, pantry_size, profile, times, rows)
+        return results
+
+    def compare(self, report, baseline_path, threshold):
+        with open(baseline_path) as fh:
+            baseline = json.load(fh)
+
+        def key(r):
+            return r["catalog_rows"], r["function"], r["pantry_size"], r["profile"]
+
+        before = {key(r): r for r in baseline.get("results", [])}
+        regressions = 0
+        self.log(f"p50 vs {baseline_path} (revision {baseline.get('meta', {}).get('revision')}):")
+        for result in report["results"]:
+            old = before.get(key(result))
+            if not old or not old["p50_ms"]:
+                continue
+            ratio = result["p50_ms"] / old["p50_ms"]
+            flag = ""
+            if ratio > threshold and result["p50_ms"] - old["p50_ms"] > NOISE_MS:
+                flag = "  <-- regression"
+                regressions += 1
+            self.log(
+                f"  {result['catalog_rows']:>8} {result['function']:<38} pantry={result['pantry_size']:<3} "
+                f"{result['profile'] or '-':<16} {old['p50_ms']:>9.2f} -> {result['p50_ms']:>9.2f} ms "
+                f"({ratio:.2f}x){flag}"
+            )
+        self.log(f"{regressions} regression(s) above {threshold:.2f}x")
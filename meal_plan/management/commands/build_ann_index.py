@@ -0,0 +1,38 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.ai_recommender import catalog_dir
+from meal_plan.ann_index import ANN_DIR, build_ann_index
+from meal_plan.recipe_catalog import RecipeCatalog, is_catalog
+
+
+class Command(BaseCommand):
+    help = "Build the optional IVF (LSA + k-means) retrieval index next to the recipe catalog."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catalog", default=None, help="Catalog directory (default: RECIPE_CATALOG_DIR)")
+        parser.add_argument("--components", type=int, default=128, help="LSA dimensions")
+        parser.add_argument("--lists", type=int, default=0, help="IVF lists (default: ~4*sqrt(recipes))")
+        parser.add_argument("--sample", type=int, default=100_000, help="Rows used to fit LSA and k-means")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        path = options["catalog"] or catalog_dir()
+        if not is_catalog(path):
+            raise CommandError(f"{path} is not a recipe catalog; run export_recipe_catalog first")
+        catalog = RecipeCatalog.open(path)
+        build_ann_index(
+            os.path.join(path, ANN_DIR),
+            catalog.matrix,
+            n_components=options["components"],
+            n_lists=options["lists"] or None,
+            sample_size=options["sample"],
+            seed=options["seed"],
+        )
+        ann = catalog.load_ann(nprobe=1)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {ann.n_lists} lists over {len(catalog)} recipes "
+            f"({ann.meta['n_components']} LSA dims, "
+            f"{ann.meta['explained_variance']:.0%} variance) to {os.path.join(path, ANN_DIR)}"
+        ))
@@ -0,0 +1,36 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.ai_recommender import catalog_dir
+from meal_plan.lsa_index import LSA_DIR, build_lsa_index
+from meal_plan.recipe_catalog import RecipeCatalog, is_catalog
+
+
+class Command(BaseCommand):
+    help = "Project the recipe catalog onto dense LSA vectors for RECIPE_RETRIEVAL='lsa'."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catalog", default=None, help="Catalog directory (default: RECIPE_CATALOG_DIR)")
+        parser.add_argument("--components", type=int, default=256, help="LSA dimensions")
+        parser.add_argument("--sample", type=int, default=100_000, help="Rows used to fit the LSA basis")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        path = options["catalog"] or catalog_dir()
+        if not is_catalog(path):
+            raise CommandError(f"{path} is not a recipe catalog; run export_recipe_catalog first")
+        catalog = RecipeCatalog.open(path)
+        build_lsa_index(
+            os.path.join(path, LSA_DIR),
+            catalog.matrix,
+            n_components=options["components"],
+            sample_size=options["sample"],
+            seed=options["seed"],
+        )
+        lsa = catalog.load_lsa()
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {lsa.meta['n_components']}-dim LSA vectors for {len(catalog)} recipes "
+            f"({lsa.meta['explained_variance']:.0%} variance, {lsa.nbytes / 2**20:.1f} MiB) "
+            f"to {os.path.join(path, LSA_DIR)}"
+        ))
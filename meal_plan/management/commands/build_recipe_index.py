@@ -0,0 +1,45 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.ai_recommender import catalog_dir
+from meal_plan.catalog_store import rebuilt_manifest
+from meal_plan.recipe_build import build_recipe_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the recipe catalog from the raw recipe CSV in bounded-memory chunks "
+        "(cleaning, MealType, servings, TF-IDF and ingredient index at build time)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("csv", help="Raw recipes CSV (Food.com layout or already *_cleaned columns)")
+        parser.add_argument("--output", default=None, help="Catalog directory (default: RECIPE_CATALOG_DIR)")
+        parser.add_argument("--chunk-size", type=int, default=50_000, help="Rows per chunk; bounds peak memory")
+        parser.add_argument("--min-df", type=int, default=1,
+                            help="Ignore ingredient terms found in fewer recipes than this")
+
+    def handle(self, *args, **options):
+        if not os.path.isfile(options["csv"]):
+            raise CommandError(f"{options['csv']} not found")
+        output = options["output"] or catalog_dir()
+        started = time.monotonic()
+
+        def progress(written):
+            self.stdout.write(f"  {written} recipes written ({time.monotonic() - started:.0f}s)")
+
+        try:
+            written = build_recipe_index(
+                options["csv"], output,
+                chunk_size=max(1, options["chunk_size"]),
+                min_df=max(1, options["min_df"]),
+                extra_files=rebuilt_manifest(output),
+                progress=progress,
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {written} recipes into {output} in {time.monotonic() - started:.1f}s"
+        ))
@@ -0,0 +1,154 @@
+import gc
+import json
+import multiprocessing
+import os
+import resource
+import sys
+
+import joblib
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.ai_recommender import (
+    AI_DATA_PATH, catalog_dir, load_catalog, load_legacy_catalog, prepare_recipe_frame,
+)
+
+MIB = 2 ** 20
+
+
+def memory_status():
+    """Rss, Pss and private bytes of this process (Linux); peak RSS elsewhere."""
+    try:
+        fields = {}
+        with open("/proc/self/smaps_rollup") as fh:
+            for line in fh:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+        return {
+            "rss": fields.get("Rss", 0),
+            "pss": fields.get("Pss", 0),
+            "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+        }
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"rss": peak if sys.platform == "darwin" else peak * 1024, "pss": None, "private": None}
+
+
+def touch(catalog, requests=200, seed=0):
+    """What a worker reads serving requests: a few rows and single columns."""
+    rng = np.random.default_rng(seed)
+    for _ in range(requests):
+        ids = rng.integers(len(catalog), size=10)
+        catalog.rows(ids)
+        catalog.take("Calories", rng.integers(len(catalog), size=80))
+
+
+def frame_bytes(frame):
+    return {name: int(size) for name, size in frame.memory_usage(deep=True, index=False).items()}
+
+
+def _scenario(name, path, pickle_path):
+    keep = []       # hold on to what was loaded until memory is measured
+    extra = {}
+    if name == "legacy_objects":
+        art = joblib.load(pickle_path)
+        df, matrix = prepare_recipe_frame(art["df"], art["tfidf_matrix"])
+        keep += [art, df, matrix]
+        extra["columns"] = frame_bytes(df)
+        return keep, extra
+    if name == "legacy_compact":
+        catalog = load_legacy_catalog(pickle_path)
+    else:
+        catalog = load_catalog(path=path)
+    keep.append(catalog)
+    touch(catalog)
+    if name == "object_frame":
+        frame = catalog.to_frame()
+        keep.append(frame)
+        extra["columns"] = frame_bytes(frame)
+    elif name == "compact_frame":
+        frame = catalog.compact_frame()
+        extra["columns"] = frame_bytes(frame)
+    return keep, extra
+
+
+def _measure(name, path, pickle_path, conn):
+    try:
+        gc.collect()
+        before = memory_status()
+        keep, extra = _scenario(name, path, pickle_path)
+        gc.collect()
+        after = memory_status()
+        conn.send({
+            "scenario": name,
+            **{k: None if after[k] is None else after[k] - before[k] for k in after},
+            **extra,
+        })
+        del keep
+    except Exception as e:
+        conn.send({"scenario": name, "error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+SCENARIOS = {
+    "catalog": "memory-mapped catalog serving requests",
+    "object_frame": "+ every column as Python objects (DF_RECIPES before)",
+    "compact_frame": "+ DF_RECIPES now (categoricals, no bulky text)",
+    "legacy_objects": "ai_data.pkl as a DataFrame (the old in-memory path)",
+    "legacy_compact": "ai_data.pkl as a compact in-memory catalog",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the memory a worker process spends on the recipe catalog, "
+        "before and after the compact representation (each case in a fresh fork)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catalog", default=None, help="Catalog directory (default: RECIPE_CATALOG_DIR)")
+        parser.add_argument("--pickle", default=AI_DATA_PATH,
+                            help="ai_data.pkl for the legacy cases (skipped when missing)")
+        parser.add_argument("--columns", action="store_true", help="Also list per-column frame sizes")
+        parser.add_argument("--output", help="Also write the report as JSON here")
+
+    def handle(self, *args, **options):
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise CommandError("Needs fork() to measure each case in a clean process.")
+        path = options["catalog"] or catalog_dir()
+        pickle_path = options["pickle"]
+        names = list(SCENARIOS)
+        if not os.path.exists(pickle_path):
+            names = [n for n in names if not n.startswith("legacy")]
+            self.stderr.write(f"{pickle_path} not found, skipping the legacy cases.")
+
+        ctx = multiprocessing.get_context("fork")
+        results = []
+        for name in names:
+            parent, child = ctx.Pipe(duplex=False)
+            process = ctx.Process(target=_measure, args=(name, path, pickle_path, child))
+            process.start()
+            child.close()
+            results.append(parent.recv())
+            process.join()
+
+        self.stdout.write(f"Catalog: {path}")
+        self.stdout.write(f"{'case':<16} {'RSS MiB':>9} {'PSS MiB':>9} {'private MiB':>12}  ")
+        for result in results:
+            if "error" in result:
+                self.stdout.write(f"{result['scenario']:<16} failed: {result['error']}")
+                continue
+            cells = [f"{result[k] / MIB:>9.1f}" if result[k] is not None else f"{'-':>9}"
+                     for k in ("rss", "pss")]
+            private = f"{result['private'] / MIB:>12.1f}" if result["private"] is not None else f"{'-':>12}"
+            self.stdout.write(f"{result['scenario']:<16} {cells[0]} {cells[1]} {private}  "
+                              f"{SCENARIOS[result['scenario']]}")
+            if options["columns"] and "columns" in result:
+                for column, size in result["columns"].items():
+                    self.stdout.write(f"{'':<18}{column:<38} {size / MIB:>9.1f}")
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump({"catalog": path, "results": results}, fh, indent=2)
+                fh.write("\n")
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.ai_recommender import DIETARY_RESTRICTIONS, catalog_dir
+from meal_plan.catalog_store import compact, read_manifest, search_indexes
+from meal_plan.recipe_catalog import is_catalog
+
+
+class Command(BaseCommand):
+    help = "Merge the catalog's delta segments back into its base (recipe ids are kept)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catalog", default=None, help="Catalog directory (default: RECIPE_CATALOG_DIR)")
+        parser.add_argument("--min-deltas", type=int, default=1,
+                            help="Only compact when at least this many deltas exist (for cron jobs)")
+
+    def handle(self, *args, **options):
+        path = options["catalog"] or catalog_dir()
+        if not is_catalog(path):
+            raise CommandError(f"{path} is not a recipe catalog")
+        deltas = len(read_manifest(path)["deltas"])
+        if deltas < max(1, options["min_deltas"]):
+            self.stdout.write(f"{deltas} delta segment(s), nothing to compact.")
+            return
+        indexes = search_indexes(path)
+        if indexes:
+            self.stdout.write(f"Rebuilding the search indexes ({', '.join(sorted(indexes))}) "
+                              "over the merged catalog")
+        version = compact(path, restrictions=DIETARY_RESTRICTIONS)
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {deltas} delta segment(s) into the base, catalog version {version}."
+        ))
@@ -0,0 +1,122 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.ai_recommender import catalog_dir
+from meal_plan.management.commands.benchmark_ann import _percentile, catalog_pantries
+from meal_plan.recipe_catalog import RecipeCatalog, is_catalog
+
+
+def sparse_nbytes(*matrices):
+    return sum(m.data.nbytes + m.indices.nbytes + m.indptr.nbytes for m in matrices)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare LSA retrieval (build_lsa_index) with exact sparse TF-IDF search: "
+        "top-k overlap, latency and memory."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--catalog", default=None, help="Catalog directory (default: RECIPE_CATALOG_DIR)")
+        parser.add_argument("--queries", type=int, default=200)
+        parser.add_argument("--top-k", default="10,50", help="Comma-separated k values to report")
+        parser.add_argument("--batch", type=int, default=32, help="Queries per search_batch call in the batched timing")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Also write the report as JSON here")
+
+    def handle(self, *args, **options):
+        path = options["catalog"] or catalog_dir()
+        if not is_catalog(path):
+            raise CommandError(f"{path} is not a recipe catalog; run export_recipe_catalog first")
+        catalog = RecipeCatalog.open(path)
+        sparse = catalog.retriever
+        lsa = catalog.load_lsa()
+        if lsa is None:
+            raise CommandError("No LSA vectors for this catalog; run build_lsa_index first.")
+        ks = sorted(int(k) for k in options["top_k"].split(",") if k.strip())
+        if not ks:
+            raise CommandError("--top-k needs at least one value.")
+        pantries = catalog_pantries(catalog, options["queries"], options["seed"])
+        top_k = ks[-1]
+
+        def run(retriever):
+            results, latencies = [], []
+            for pantry in pantries:
+                start = time.perf_counter()
+                results.append(retriever.search(pantry, top_k=top_k))
+                latencies.append(time.perf_counter() - start)
+            return results, latencies
+
+        def batched(retriever):
+            start = time.perf_counter()
+            for i in range(0, len(pantries), options["batch"]):
+                retriever.search_batch(pantries[i:i + options["batch"]], top_k=top_k)
+            return (time.perf_counter() - start) / max(1, len(pantries)) * 1000
+
+        run(sparse), run(lsa)     # warm the page cache
+        exact, exact_lat = run(sparse)
+        approx, approx_lat = run(lsa)
+
+        overlap = []
+        for k in ks:
+            shared = found = total = 0
+            for pantry, (exact_ids, exact_scores), (lsa_ids, _) in zip(pantries, exact, approx):
+                exact_ids, exact_scores, lsa_ids = exact_ids[:k], exact_scores[:k], lsa_ids[:k]
+                if not len(exact_ids):
+                    continue
+                total += len(exact_ids)
+                shared += len(np.intersect1d(exact_ids, lsa_ids))
+                # TF-IDF scores tie a lot (identical ingredient lists), so an LSA
+                # result also counts when its exact score ties the k-th best
+                scores = sparse.score(pantry, lsa_ids)
+                found += min(len(exact_ids), int(np.sum(scores >= exact_scores[-1] - 1e-6)))
+            overlap.append({
+                "k": k,
+                "overlap": round(shared / total, 4) if total else 1.0,
+                "tie_aware_recall": round(found / total, 4) if total else 1.0,
+            })
+
+        report = {
+            "catalog": path,
+            "recipes": len(catalog),
+            "features": catalog.matrix.shape[1],
+            "components": lsa.meta["n_components"],
+            "explained_variance": round(lsa.meta["explained_variance"], 4),
+            "queries": len(pantries),
+            "memory_mib": {
+                "sparse": round(sparse_nbytes(catalog.matrix, catalog.matrix_t) / 2**20, 1),
+                "lsa": round(lsa.nbytes / 2**20, 1),
+            },
+            "latency_ms": {
+                name: {
+                    "p50": round(_percentile(lat, 50), 3),
+                    "p95": round(_percentile(lat, 95), 3),
+                    "p99": round(_percentile(lat, 99), 3),
+                    "batched_mean": round(batched(retriever), 3),
+                }
+                for name, lat, retriever in (("sparse", exact_lat, sparse), ("lsa", approx_lat, lsa))
+            },
+            "overlap": overlap,
+        }
+
+        self.stdout.write(
+            f"{report['recipes']} recipes, {report['features']} terms -> {report['components']} LSA dims "
+            f"({report['explained_variance']:.0%} variance), {report['queries']} queries"
+        )
+        self.stdout.write(f"{'':>8} {'MiB':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'batch ms':>9}")
+        for name in ("sparse", "lsa"):
+            lat = report["latency_ms"][name]
+            self.stdout.write(
+                f"{name:>8} {report['memory_mib'][name]:>8.1f} {lat['p50']:>8.2f} {lat['p95']:>8.2f} "
+                f"{lat['p99']:>8.2f} {lat['batched_mean']:>9.3f}"
+            )
+        self.stdout.write(f"{'k':>8} {'overlap':>8} {'recall':>8}  (LSA top-k vs sparse top-k)")
+        for row in overlap:
+            self.stdout.write(f"{row['k']:>8} {row['overlap']:>8.3f} {row['tie_aware_recall']:>8.3f}")
+        if options["output"]:
+            with open(options["output"], "w") as fh:
+                json.dump(report, fh, indent=2)
+                fh.write("\n")
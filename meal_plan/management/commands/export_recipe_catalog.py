@@ -0,0 +1,29 @@
+import joblib
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.ai_recommender import AI_DATA_PATH, DIETARY_RESTRICTIONS, catalog_dir, prepare_recipe_frame
+from meal_plan.catalog_store import rebuilt_manifest
+from meal_plan.recipe_catalog import write_catalog
+
+
+class Command(BaseCommand):
+    help = "Convert ai_data.pkl into the memory-mapped recipe catalog directory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--source", default=AI_DATA_PATH, help="Path to ai_data.pkl")
+        parser.add_argument("--output", default=None,
+                            help="Catalog directory to (re)write (default: RECIPE_CATALOG_DIR)")
+
+    def handle(self, *args, **options):
+        try:
+            art = joblib.load(options["source"])
+        except FileNotFoundError:
+            raise CommandError(f"{options['source']} not found")
+
+        output = options["output"] or catalog_dir()
+        df, matrix = prepare_recipe_frame(art["df"], art["tfidf_matrix"])
+        write_catalog(output, art["vectorizer"], matrix, df, restrictions=DIETARY_RESTRICTIONS,
+                      extra_files=rebuilt_manifest(output))
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {len(df)} recipes to {output}"
+        ))
@@ -0,0 +1,151 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from meal_plan.models import PantryItem, PrecomputedSuggestion, Profile, Recipe
+from meal_plan.precompute import (
+    KINDS, catalog_version, compute_suggestions, init_worker, suggestion_fingerprint,
+)
+
+PROFILE_FIELDS = [f.attname for f in Profile._meta.concrete_fields]
+
+
+class Command(BaseCommand):
+    help = (
+        "Precompute meal suggestions and day plans for every user's pantry in a "
+        "process pool, so the dashboard can serve them without running the recommender."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                            help="Worker processes (default: CPU count)")
+        parser.add_argument("--chunk-size", type=int, default=200,
+                            help="Users read from the database and written back per batch")
+        parser.add_argument("--serving-size", type=int, default=2)
+        parser.add_argument("--kinds", default=",".join(KINDS),
+                            help=f"Comma-separated subset of: {', '.join(KINDS)}")
+        parser.add_argument("--force", action="store_true",
+                            help="Recompute users whose stored suggestions are still up to date")
+
+    def handle(self, *args, **options):
+        kinds = [k.strip() for k in options["kinds"].split(",") if k.strip()]
+        unknown = set(kinds) - set(KINDS)
+        if unknown or not kinds:
+            raise CommandError(f"Unknown kinds: {', '.join(sorted(unknown)) or '(none)'}")
+        chunk_size = max(1, options["chunk_size"])
+        workers = self.workers = max(1, options["workers"])
+
+        users = (
+            User.objects.filter(pantry_items__isnull=False)
+            .distinct()
+            .select_related("profile")
+            .order_by("pk")
+        )
+        total = users.count()
+        self.catalog_version = catalog_version()
+        self.stdout.write(f"Precomputing {', '.join(kinds)} for {total} users with {workers} workers")
+
+        stats = {"done": 0, "skipped": 0, "written": 0, "failed": 0}
+        started = time.monotonic()
+        # spawn rather than fork: workers never touch the DB, and must not
+        # inherit the connection the user iterator below keeps open
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker) as pool:
+            chunk = []
+            for user in users.iterator(chunk_size=chunk_size):
+                chunk.append(user)
+                if len(chunk) == chunk_size:
+                    self._run_chunk(pool, chunk, kinds, options, stats)
+                    self._progress(stats, total, started)
+                    chunk = []
+            if chunk:
+                self._run_chunk(pool, chunk, kinds, options, stats)
+                self._progress(stats, total, started)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done in {time.monotonic() - started:.1f}s: {stats['written']} suggestions written, "
+            f"{stats['skipped']} users up to date, {stats['failed']} failed"
+        ))
+
+    def _jobs(self, users, kinds, options):
+        """Plain-data jobs for the users whose stored suggestions are missing or stale."""
+        ids = [u.pk for u in users]
+        pantries, saved = {}, {}
+        for user_id, name in PantryItem.objects.filter(user_id__in=ids).values_list("user_id", "ingredient_name"):
+            pantries.setdefault(user_id, []).append(name)
+        for user_id, name in Recipe.objects.filter(user_id__in=ids).values_list("user_id", "name"):
+            saved.setdefault(user_id, set()).add(name)
+        stored = {}
+        for user_id, kind, fingerprint in (
+            PrecomputedSuggestion.objects.filter(user_id__in=ids, kind__in=kinds)
+            .values_list("user_id", "kind", "fingerprint")
+        ):
+            stored[(user_id, kind)] = fingerprint
+
+        serving_size = options["serving_size"]
+        jobs, fingerprints = [], {}
+        for user in users:
+            if not hasattr(user, "profile"):
+                continue
+            names = pantries.get(user.pk, [])
+            fingerprint = suggestion_fingerprint(user, names, serving_size, saved.get(user.pk),
+                                                 version=self.catalog_version)
+            todo = [k for k in kinds if options["force"] or stored.get((user.pk, k)) != fingerprint]
+            if not todo:
+                continue
+            fingerprints[user.pk] = fingerprint
+            jobs.append({
+                "user_id": user.pk,
+                "profile": {f: getattr(user.profile, f) for f in PROFILE_FIELDS},
+                "pantry_names": names,
+                "exclude_names": sorted(saved.get(user.pk, ())),
+                "serving_size": serving_size,
+                "kinds": todo,
+            })
+        return jobs, fingerprints
+
+    def _run_chunk(self, pool, users, kinds, options, stats):
+        jobs, fingerprints = self._jobs(users, kinds, options)
+        stats["skipped"] += len(users) - len(jobs)
+        rows = []
+        now = timezone.now()
+        # a few map chunks per worker keeps them busy without per-job IPC
+        chunksize = max(1, len(jobs) // (4 * self.workers))
+        for user_id, results, error, version in pool.map(compute_suggestions, jobs, chunksize=chunksize):
+            if error:
+                stats["failed"] += 1
+                self.stderr.write(f"User {user_id}: {error}")
+            if version != self.catalog_version:
+                # the catalog changed during the run: these would never match, the next run redoes them
+                stats["failed"] += 1
+                self.stderr.write(f"User {user_id}: ranked against catalog version {version}, "
+                                  f"not {self.catalog_version}; not stored")
+                continue
+            for kind, records in results.items():
+                rows.append(PrecomputedSuggestion(
+                    user_id=user_id, kind=kind, fingerprint=fingerprints[user_id],
+                    serving_size=options["serving_size"], recipes=records, created_at=now,
+                ))
+        if rows:
+            PrecomputedSuggestion.objects.bulk_create(
+                rows,
+                update_conflicts=True,
+                unique_fields=["user", "kind"],
+                update_fields=["fingerprint", "serving_size", "recipes", "created_at"],
+            )
+        stats["written"] += len(rows)
+        stats["done"] += len(users)
+
+    def _progress(self, stats, total, started):
+        elapsed = time.monotonic() - started
+        rate = stats["done"] / elapsed if elapsed else 0.0
+        eta = (total - stats["done"]) / rate if rate else 0.0
+        self.stdout.write(
+            f"  {stats['done']}/{total} users ({stats['skipped']} up to date, "
+            f"{stats['failed']} failed) – {rate:.1f} users/s, ETA {eta:.0f}s"
+        )
@@ -0,0 +1,82 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.image_jobs import (
+    claim_next_jobs, record_worker, requeue_interrupted, run_jobs, start_heartbeat, worker_name,
+)
+from meal_plan.models import ImageWorker
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate queued recipe images. Loads the Stable Diffusion pipeline once "
+        "and serves jobs oldest first; run one of these next to the web workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--poll", type=float, default=getattr(settings, "IMAGE_WORKER_POLL_SECONDS", 1.0),
+                            help="Seconds to wait before checking an empty queue again")
+        parser.add_argument("--batch-size", type=int, default=getattr(settings, "IMAGE_BATCH_SIZE", 4),
+                            help="Jobs claimed and rendered together in one pipeline call")
+        parser.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+        parser.add_argument("--max-jobs", type=int, default=0, help="Exit after this many jobs (0 = no limit)")
+
+    def handle(self, *args, **options):
+        from meal_plan.image_profiles import active_profile
+        from meal_plan.utils import generate_recipe_images
+        from meal_plan.warmup import readiness, warm_up
+
+        self._requeue()
+        profile = active_profile()
+        name = worker_name()
+        # web workers' ready/ endpoint reads this row
+        record_worker(name, profile=profile["name"], status=ImageWorker.LOADING, error="")
+        self.stdout.write(
+            f"⏳ Loading the image pipeline ({profile['name']}: {profile['device']}, {profile['dtype']}, "
+            f"{profile['steps']} steps, {profile['width']}x{profile['height']})..."
+        )
+        loaded = warm_up("image")
+        state = readiness()[1]["image"]
+        if not loaded:
+            record_worker(name, status=ImageWorker.FAILED, error=state["error"], load_seconds=state["seconds"])
+            raise CommandError(f"Image pipeline failed to load: {state['error']}")
+        record_worker(name, status=ImageWorker.READY, load_seconds=state["seconds"])
+        heartbeat = start_heartbeat(name)
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Image worker ready (loaded and warmed up in {state['seconds']:.1f}s)"
+        ))
+
+        done = 0
+        try:
+            while not options["max_jobs"] or done < options["max_jobs"]:
+                limit = options["batch_size"]
+                if options["max_jobs"]:
+                    limit = min(limit, options["max_jobs"] - done)
+                jobs = claim_next_jobs(limit)
+                if not jobs:
+                    if options["once"]:
+                        break
+                    # jobs of a worker that died meanwhile become claimable once stale
+                    self._requeue()
+                    time.sleep(options["poll"])
+                    continue
+                started = time.monotonic()
+                run_jobs(jobs, generate=lambda pairs, steps, profile: generate_recipe_images(
+                    pairs, steps=steps, batch_size=options["batch_size"], profile=profile))
+                done += len(jobs)
+                elapsed = time.monotonic() - started
+                for job in jobs:
+                    self.stdout.write(f"🖼️ Job {job.id} {job.status} ({len(jobs)} in {elapsed:.1f}s): {job.recipe_name}")
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping.")
+        finally:
+            heartbeat.set()
+            ImageWorker.objects.filter(name=name).delete()
+        self.stdout.write(f"Processed {done} jobs")
+
+    def _requeue(self):
+        requeued = requeue_interrupted()
+        if requeued:
+            self.stdout.write(f"🔁 Requeued {requeued} jobs left running by a stopped worker")
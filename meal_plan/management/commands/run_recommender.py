@@ -0,0 +1,42 @@
+import signal
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.ai_recommender import get_catalog
+from meal_plan.recommender_service import RecommenderServer
+
+
+class Command(BaseCommand):
+    help = "Serve pantry rankings to the Django workers over a Unix socket (RECOMMENDER_SOCKET)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--socket", default=getattr(settings, "RECOMMENDER_SOCKET", ""),
+                            help="Socket path (default: RECOMMENDER_SOCKET)")
+        parser.add_argument("--batch-window-ms", type=float,
+                            default=getattr(settings, "RECOMMENDER_BATCH_WINDOW_MS", 2))
+        parser.add_argument("--max-batch", type=int, default=getattr(settings, "RECOMMENDER_MAX_BATCH", 64))
+
+    def handle(self, *args, **options):
+        path = options["socket"]
+        if not path:
+            raise CommandError("No socket path: pass --socket or set RECOMMENDER_SOCKET.")
+        if get_catalog() is None:
+            raise CommandError("No recipe catalog could be loaded.")
+
+        server = RecommenderServer(
+            path,
+            window=max(0.0, options["batch_window_ms"]) / 1000,
+            max_batch=max(1, options["max_batch"]),
+        )
+        # process managers stop services with SIGTERM: exit through the finally below
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        self.stdout.write(self.style.SUCCESS(f"Recommender listening on {path}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Stopped. {server.batcher.stats()}")
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from meal_plan.warmup import COMPONENTS, configured_components, readiness, warm_up
+
+
+class Command(BaseCommand):
+    help = (
+        "Load the recommender catalog and/or the image pipeline and run one tiny "
+        "request through each, reporting how long it took (e.g. before a deploy switches traffic)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--components", default=None,
+                            help=f"Comma-separated subset of: {', '.join(COMPONENTS)} "
+                                 "(default: MEAL_PLAN_WARMUP, or all of them when that is empty)")
+
+    def handle(self, *args, **options):
+        if options["components"]:
+            components = [c.strip() for c in options["components"].split(",") if c.strip()]
+        else:
+            components = configured_components() or list(COMPONENTS)
+        unknown = set(components) - set(COMPONENTS)
+        if unknown or not components:
+            raise CommandError(f"Unknown components: {', '.join(sorted(unknown)) or '(none)'}")
+
+        failed = [name for name in components if not warm_up(name)]
+        _, states = readiness()
+        for name in components:
+            state = states[name]
+            line = f"{name:<12} {state['status']:<7} {state['seconds'] or 0:>7.1f}s"
+            if state["error"]:
+                line += f"  {state['error']}"
+            self.stdout.write(line)
+        if failed:
+            raise CommandError(f"Warmup failed for {', '.join(failed)}")
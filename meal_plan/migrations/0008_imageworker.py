@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal_plan', '0007_imagejob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageWorker',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('profile', models.CharField(blank=True, max_length=50)),
+                ('status', models.CharField(choices=[('loading', 'Loading'), ('ready', 'Ready'), ('failed', 'Failed')], default='loading', max_length=10)),
+                ('load_seconds', models.FloatField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('heartbeat_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meal_plan', '0008_imageworker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imagejob',
+            name='profile',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+    ]
@@ -154,3 +154,81 @@ class DayPlan(models.Model):
 
     def __str__(self):
         return f"{self.user.username} – {self.date} ({self.date.strftime('%A')})"
+
+
+class PrecomputedSuggestion(models.Model):
+    """Recommendations computed offline by `manage.py precompute_suggestions`."""
+    KIND_CHOICES = [
+        ('meal', 'Meal'),
+        ('day_plan', 'Day plan'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="precomputed_suggestions")
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    # pantry + profile + serving size + saved recipes + catalog version the result was computed for
+    fingerprint = models.CharField(max_length=40)
+    serving_size = models.PositiveIntegerField(null=True, blank=True)
+    recipes = models.JSONField(default=list, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "kind"], name="unique_precomputed_suggestion"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} – {self.kind} ({len(self.recipes)} recipes)"
+
+
+class ImageJob(models.Model):
+    """A recipe image waiting for (or produced by) `manage.py run_image_worker`."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="image_jobs")
+    recipe_name = models.CharField(max_length=255)
+    ingredients = models.TextField(blank=True)
+    profile = models.CharField(max_length=50, blank=True)    # image_profiles name, resolved when queued
+    steps = models.PositiveIntegerField(default=50)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    image = models.ImageField(upload_to='recipe_images/jobs/', blank=True, null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"], name="image_job_queue"),
+        ]
+
+    def __str__(self):
+        return f"{self.recipe_name} ({self.status})"
+
+
+class ImageWorker(models.Model):
+    """Heartbeat of a running `manage.py run_image_worker`, read by the ready/ endpoint."""
+    LOADING = 'loading'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (LOADING, 'Loading'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+    name = models.CharField(max_length=255, unique=True)    # host:pid
+    profile = models.CharField(max_length=50, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=LOADING)
+    load_seconds = models.FloatField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    heartbeat_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
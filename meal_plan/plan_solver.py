@@ -0,0 +1,238 @@
+# meal_plan/plan_solver.py
+"""
+Meal-plan optimisation: pick ``count`` recipes, at least ``min_per_type``
+of each meal type, whose total calories are as close as possible to a
+target.
+
+Small instances (a day plan over a few dozen candidates) are solved
+exactly in-process: for every feasible split of the meals over the
+meal-type buckets, all combinations are enumerated with NumPy
+broadcasting and the one with the smallest |calories - target| wins.
+Larger instances fall back to the PuLP/CBC model with a time limit; that
+model is built once per shape from NumPy coefficient vectors and reused.
+A template serves one solve at a time, so concurrent solves of the same
+shape each check out their own.
+"""
+import itertools
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import pulp
+from django.conf import settings
+
+from .instrumentation import span
+
+MEAL_SLOTS = ("Breakfast", "Lunch", "Dinner")
+OTHER = "Other"
+
+
+def _combinations(n, c):
+    if c == 0:
+        return np.zeros((1, 0), dtype=np.int64)
+    if c == 1:
+        return np.arange(n, dtype=np.int64)[:, None]
+    return np.array(list(itertools.combinations(range(n), c)), dtype=np.int64)
+
+
+def _buckets(meal_types, min_per_type):
+    """Candidate positions per constrained meal type, plus everything else."""
+    meal_types = np.asarray(meal_types, dtype=object)
+    buckets = {t: np.flatnonzero(meal_types == t) for t in min_per_type}
+    constrained = np.isin(meal_types, list(min_per_type))
+    buckets[OTHER] = np.flatnonzero(~constrained)
+    return buckets
+
+
+def _compositions(sizes, minimums, count):
+    """Every way to spread ``count`` meals over the buckets within their bounds."""
+    names = list(sizes)
+    ranges = [range(minimums.get(b, 0), min(sizes[b], count) + 1) for b in names]
+    for split in itertools.product(*ranges):
+        if sum(split) == count:
+            yield dict(zip(names, split))
+
+
+def native_combinations(meal_types, count, min_per_type):
+    """Number of candidate plans the native solver would enumerate."""
+    buckets = _buckets(meal_types, min_per_type)
+    sizes = {b: len(ids) for b, ids in buckets.items()}
+    return sum(
+        math.prod(math.comb(sizes[b], c) for b, c in split.items())
+        for split in _compositions(sizes, min_per_type, count)
+    )
+
+
+def solve_native(calories, meal_types, target, count, min_per_type, penalty=None, deadline=None):
+    """
+    Exact minimum of |sum(calories) - target| + sum(penalty) by enumeration.
+    Returns the chosen positions, or None if no plan satisfies the
+    constraints. If the ``deadline`` (time.monotonic()) passes, the best
+    plan so far is returned.
+    """
+    calories = np.asarray(calories, dtype=np.float64)
+    penalty = np.zeros(len(calories)) if penalty is None else np.asarray(penalty, dtype=np.float64)
+    buckets = _buckets(meal_types, min_per_type)
+    sizes = {b: len(ids) for b, ids in buckets.items()}
+
+    best, best_dev = None, np.inf
+    for split in _compositions(sizes, min_per_type, count):
+        parts = [(buckets[b], _combinations(sizes[b], c)) for b, c in split.items()]
+        sums = [calories[ids[combos]].sum(axis=1) for ids, combos in parts]
+        costs = [penalty[ids[combos]].sum(axis=1) for ids, combos in parts]
+
+        total = cost = np.zeros((), dtype=np.float64)
+        for axis, (s, c) in enumerate(zip(sums, costs)):
+            shape = [1] * len(sums)
+            shape[axis] = len(s)
+            total = total + s.reshape(shape)
+            cost = cost + c.reshape(shape)
+        dev = np.abs(total - target) + cost
+
+        flat = int(np.argmin(dev))
+        if dev.flat[flat] < best_dev:
+            best_dev = dev.flat[flat]
+            pick = np.unravel_index(flat, dev.shape)
+            best = np.concatenate([ids[combos[i]] for (ids, combos), i in zip(parts, pick)])
+        if deadline is not None and time.monotonic() > deadline and best is not None:
+            break
+    return None if best is None else sorted(best.tolist())
+
+
+class PlanModel:
+    """
+    Reusable CBC model for one (padded candidate count, meal types) shape.
+    Constraints are created once with placeholder coefficients; each solve
+    only rewrites the coefficient vectors and right-hand sides. Unused
+    padding variables are fixed to 0. Not thread-safe: see plan_model.
+    """
+
+    def __init__(self, size, slots):
+        self.size = size
+        self.slots = tuple(slots)
+        self.x = [pulp.LpVariable(f"x_{i}", cat="Binary") for i in range(size)]
+        self.deviation = pulp.LpVariable("deviation", lowBound=0)
+        self.prob = pulp.LpProblem("MealPlan", pulp.LpMinimize)
+        zeros = np.zeros(size)
+        # linear deviation objective (instead of quadratic) + per-meal penalties
+        self.prob += self.deviation + self._expr(zeros)
+
+        # absolute deviation constraints
+        self.prob += (self._expr(zeros) - self.deviation <= 0, "cal_upper")
+        self.prob += (self._expr(zeros) + self.deviation >= 0, "cal_lower")
+        # exact count of meals
+        self.prob += (self._expr(zeros) == 0, "count")
+        # meal-type constraints
+        for slot in self.slots:
+            self.prob += (self._expr(zeros) >= 0, f"type_{slot}")
+
+    def _expr(self, coefs):
+        return pulp.LpAffineExpression(zip(self.x, coefs.tolist()))
+
+    def _set(self, name, coefs, rhs):
+        constraint = self.prob.constraints[name]
+        constraint.expr.update(zip(self.x, coefs.tolist()))
+        constraint.changeRHS(rhs)
+
+    def solve(self, calories, masks, target, count, minimums, penalty=None, warm_start=None, time_limit=None):
+        n = len(calories)
+        pad = self.size - n
+        active = np.concatenate([np.ones(n), np.zeros(pad)])
+        penalty = np.zeros(n) if penalty is None else np.asarray(penalty, dtype=np.float64)
+        start = set(warm_start or ())
+        for i, var in enumerate(self.x):
+            var.upBound = 1 if i < n else 0
+            var.varValue = 1 if i in start else 0
+        self.deviation.varValue = None
+        self.prob.objective.update(zip(self.x, np.concatenate([penalty, np.zeros(pad)]).tolist()))
+        cal = np.concatenate([calories, np.zeros(pad)])
+        self._set("cal_upper", cal, target)
+        self._set("cal_lower", cal, target)
+        self._set("count", active, count)
+        for slot in self.slots:
+            self._set(f"type_{slot}", np.concatenate([masks[slot], np.zeros(pad)]), minimums[slot])
+
+        self.prob.solve(pulp.PULP_CBC_CMD(msg=False, timeLimit=time_limit, warmStart=bool(start)))
+        if self.prob.sol_status not in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+            return None
+        values = np.array([var.value() or 0 for var in self.x[:n]])
+        return np.flatnonzero(values > 0.5).tolist()
+
+
+_MODELS = OrderedDict()     # shape -> idle PlanModels
+_MODELS_LOCK = threading.Lock()
+MODEL_PAD = 32
+MAX_MODELS = 16
+MAX_IDLE_PER_SHAPE = 4
+
+
+@contextmanager
+def plan_model(n, slots):
+    """
+    An idle PlanModel for ``n`` candidates (rounded up to MODEL_PAD), held
+    for one solve and then returned to the cache. The lock only covers the
+    checkout and the return; a new template is built when every cached one
+    of the shape is busy.
+    """
+    key = (max(MODEL_PAD, -(-n // MODEL_PAD) * MODEL_PAD), tuple(slots))
+    with _MODELS_LOCK:
+        idle = _MODELS.get(key)
+        model = idle.pop() if idle else None
+    if model is None:
+        model = PlanModel(*key)
+    try:
+        yield model
+    finally:
+        with _MODELS_LOCK:
+            idle = _MODELS.setdefault(key, [])
+            if len(idle) < MAX_IDLE_PER_SHAPE:
+                idle.append(model)
+            _MODELS.move_to_end(key)
+            if len(_MODELS) > MAX_MODELS:
+                _MODELS.popitem(last=False)
+
+
+def solve_cbc(calories, meal_types, target, count, min_per_type, penalty=None, warm_start=None, time_limit=None):
+    """
+    The ILP formulation, solved by CBC on a reusable model template.
+    ``warm_start`` optionally gives the positions of a known feasible plan.
+    """
+    calories = np.asarray(calories, dtype=np.float64)
+    meal_types = np.asarray(meal_types, dtype=object)
+    masks = {t: (meal_types == t).astype(np.float64) for t in min_per_type}
+    with plan_model(len(calories), min_per_type) as model:
+        return model.solve(calories, masks, target, count, min_per_type,
+                           penalty=penalty, warm_start=warm_start, time_limit=time_limit)
+
+
+def solve_meal_plan(calories, meal_types, target, count, min_per_type, method=None, time_limit=None,
+                    penalty=None, warm_start=None):
+    """
+    Positions of the chosen candidates, or None when infeasible.
+    ``penalty`` adds a per-candidate cost to the calorie deviation and
+    ``warm_start`` seeds CBC with a known plan.
+
+    ``method`` is "native", "cbc" or "auto" (default: settings.MEAL_PLAN_SOLVER).
+    "auto" solves in-process when the instance has at most
+    MEAL_PLAN_NATIVE_MAX_COMBINATIONS candidate plans, otherwise with CBC.
+    ``time_limit`` (seconds) is a hard budget for either solver.
+    """
+    method = method or getattr(settings, "MEAL_PLAN_SOLVER", "auto")
+    if time_limit is None:
+        time_limit = getattr(settings, "MEAL_PLAN_SOLVE_TIME_LIMIT", 5)
+    if method == "auto":
+        limit = getattr(settings, "MEAL_PLAN_NATIVE_MAX_COMBINATIONS", 2_000_000)
+        method = "native" if native_combinations(meal_types, count, min_per_type) <= limit else "cbc"
+
+    with span("solve", method=method, candidates=len(calories)) as stage:
+        if method == "native":
+            deadline = time.monotonic() + time_limit if time_limit else None
+            chosen = solve_native(calories, meal_types, target, count, min_per_type, penalty=penalty, deadline=deadline)
+        else:
+            chosen = solve_cbc(calories, meal_types, target, count, min_per_type,
+                               penalty=penalty, warm_start=warm_start, time_limit=time_limit)
+        stage.set(feasible=chosen is not None)
+    return chosen
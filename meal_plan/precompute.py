@@ -0,0 +1,107 @@
+# meal_plan/precompute.py
+"""
+Offline suggestions for the dashboard.
+
+``manage.py precompute_suggestions`` runs generate_ai_meal and
+generate_meal_plan for every user's whole pantry in a process pool and
+stores the results as PrecomputedSuggestion rows. Each row carries a
+fingerprint of its inputs (pantry, profile, serving size, saved recipes,
+meal type and the catalog version it was ranked against), so the
+dashboard only serves it while those inputs are unchanged and falls back
+to computing live otherwise. Suggestions are precomputed without a meal
+type, so a request that filters by one is always computed live.
+
+Workers receive plain data (no model instances, no DB access): the
+profile fields, pantry names and saved recipe names of one user.
+"""
+import json
+from types import SimpleNamespace
+
+import pandas as pd
+
+from .recommendation_cache import _digest, normalize_pantry, profile_fingerprint
+
+KINDS = ("meal", "day_plan")
+
+
+def catalog_version():
+    """Manifest version of the catalog recommendations are ranked against (None without one)."""
+    from .ai_recommender import get_catalog
+
+    return getattr(get_catalog(), "version", None)
+
+
+def suggestion_fingerprint(user, pantry_names, serving_size=None, exclude_names=None,
+                           meal_type=None, version=None):
+    """Stable across processes (unlike hash()), so it can be stored."""
+    return _digest(
+        *sorted(normalize_pantry(pantry_names)),
+        profile_fingerprint(user),
+        serving_size,
+        (meal_type or "").strip().lower(),
+        version,
+        *sorted(n.lower() for n in exclude_names or ()),
+    )
+
+
+def frame_to_records(df):
+    """JSON-safe list of row dicts (NaN -> None, NumPy scalars -> Python)."""
+    return json.loads(df.to_json(orient="records"))
+
+
+def precomputed_suggestions(user, kind, pantry_names, serving_size=None, exclude_names=None, meal_type=None):
+    """Stored recommendations for exactly these inputs and the current catalog, or None."""
+    from .models import PrecomputedSuggestion
+
+    fingerprint = suggestion_fingerprint(user, pantry_names, serving_size, exclude_names,
+                                         meal_type, catalog_version())
+    row = (
+        PrecomputedSuggestion.objects
+        .filter(user=user, kind=kind, fingerprint=fingerprint)
+        .only("recipes")
+        .first()
+    )
+    if row is None or not row.recipes:
+        return None
+    return pd.DataFrame.from_records(row.recipes)
+
+
+# ------------------- Worker side -------------------
+
+def init_worker():
+    """Process-pool initializer: set Django up and load the catalog once."""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        django.setup()
+    from .ai_recommender import get_catalog
+    get_catalog()
+
+
+def compute_suggestions(job):
+    """
+    ``job`` is a dict with user_id, profile (field values), pantry_names,
+    exclude_names, serving_size and kinds. Returns (user_id, {kind: records},
+    error, catalog version the records were ranked against).
+    """
+    from .ai_recommender import generate_ai_meal, generate_meal_plan, pinned_catalog
+
+    user = SimpleNamespace(pk=job["user_id"], id=job["user_id"], profile=SimpleNamespace(**job["profile"]))
+    pantry_items = [SimpleNamespace(ingredient_name=n) for n in job["pantry_names"]]
+    results = {}
+    # one catalog version for both kinds, the one the rows are stamped with
+    with pinned_catalog() as catalog:
+        version = getattr(catalog, "version", None)
+        try:
+            if "meal" in job["kinds"]:
+                df = generate_ai_meal(user, pantry_items, top_k=10,
+                                      exclude_names=job["exclude_names"], serving_size=job["serving_size"])
+                results["meal"] = frame_to_records(df)
+            if "day_plan" in job["kinds"]:
+                df = generate_meal_plan(user, pantry_items, days=1, meals_per_day=3,
+                                        exclude_names=job["exclude_names"], serving_size=job["serving_size"])
+                results["day_plan"] = frame_to_records(df)
+        except Exception as e:
+            return job["user_id"], results, f"{type(e).__name__}: {e}", version
+    return job["user_id"], results, None, version
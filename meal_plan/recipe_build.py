@@ -0,0 +1,159 @@
+# meal_plan/recipe_build.py
+"""
+Build the recipe catalog straight from the raw recipe CSV.
+
+The CSV is read twice in chunks of ``chunk_size`` rows:
+
+1. count in how many recipes each ingredient term appears (the document
+   frequencies a TfidfVectorizer would learn in ``fit``);
+2. clean every chunk, vectorize it with the vocabulary and idf weights
+   from pass 1 and append it to an ArtifactWriter.
+
+Only one chunk and the term counts are ever in memory, so the catalog
+size is bounded by disk, not RAM. The result equals fitting a
+TfidfVectorizer on all (cleaned) recipes at once.
+"""
+import ast
+import re
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from .ai_recommender import DIETARY_RESTRICTIONS
+from .derived_columns import meal_type_codes, meal_type_names, parse_servings_array
+from .ingredient_index import INGREDIENT_COLUMN
+from .recipe_catalog import ArtifactWriter
+from .retrieval import recipe_text
+
+# Columns of the written catalog, in the order and kinds the app reads them
+SCHEMA = {
+    "Name": "text",
+    "Calories": "float64",
+    "RecipeServings": "category",
+    "Servings": "float32",
+    INGREDIENT_COLUMN: "text",
+    "RecipeIngredientQuantities_cleaned": "text",
+    "RecipeInstructions_cleaned": "text",
+    "Description": "text",
+    "Images": "text",
+    "MealType": "category",
+}
+
+# raw Food.com column -> cleaned column it is derived from
+_LIST_COLUMNS = {
+    "RecipeIngredientParts": INGREDIENT_COLUMN,
+    "RecipeIngredientQuantities": "RecipeIngredientQuantities_cleaned",
+    "RecipeInstructions": "RecipeInstructions_cleaned",
+}
+
+_R_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+
+
+def parse_list(value):
+    """Items of an R vector (``c("a", "b")``), a Python list literal or a comma list."""
+    if not isinstance(value, str):
+        return []
+    value = value.strip()
+    if value.startswith("c(") or value.startswith('"'):
+        return [v.replace('\\"', '"').strip() for v in _R_STRING.findall(value) if v.strip()]
+    if value.startswith("["):
+        try:
+            return [str(v).strip() for v in ast.literal_eval(value) if str(v).strip()]
+        except (ValueError, SyntaxError):
+            pass
+    if value == "character(0)" or value.upper() == "NA":
+        return []
+    return [value]
+
+
+def clean_chunk(df):
+    """
+    One raw CSV chunk -> catalog rows: Django-friendly column names, list
+    columns flattened, Food.com placeholder recipes dropped, MealType and
+    numeric Servings added.
+    """
+    df = df.copy()
+    df.columns = [c.replace(" ", "_") for c in df.columns]
+
+    for raw, cleaned in _LIST_COLUMNS.items():
+        if cleaned not in df.columns and raw in df.columns:
+            sep = " " if cleaned == "RecipeInstructions_cleaned" else ", "
+            df[cleaned] = [sep.join(parse_list(v)) for v in df[raw]]
+    if "Images" in df.columns:
+        df["Images"] = [str(parse_list(v)) if isinstance(v, str) and not v.startswith("[") else v
+                        for v in df["Images"]]
+
+    if "RecipeInstructions_cleaned" in df.columns:
+        placeholder = (
+            df["RecipeInstructions_cleaned"].astype(str).str.lower().str.contains("food.com", na=False)
+        )
+        df = df[~placeholder.to_numpy()]
+
+    df["Calories"] = pd.to_numeric(df["Calories"], errors="coerce")
+    df["MealType"] = meal_type_names(meal_type_codes(df["Calories"].to_numpy()))
+    servings = df["RecipeServings"] if "RecipeServings" in df.columns else pd.Series(None, index=df.index)
+    df["Servings"] = parse_servings_array(servings.to_numpy(dtype=object))
+    if "RecipeServings" in df.columns:
+        df["RecipeServings"] = [None if pd.isna(v) else str(v) for v in df["RecipeServings"]]
+    return df.reset_index(drop=True)
+
+
+def read_chunks(csv_path, chunk_size):
+    return pd.read_csv(csv_path, chunksize=chunk_size)
+
+
+def fit_vectorizer(csv_path, chunk_size=50_000, min_df=1):
+    """
+    Pass 1: a TfidfVectorizer fitted from streamed document frequencies.
+    Returns (vectorizer, number of recipes kept).
+    """
+    return fit_chunks(read_chunks(csv_path, chunk_size), min_df)
+
+
+def fit_chunks(chunks, min_df=1):
+    """fit_vectorizer over any iterable of raw recipe chunks."""
+    vectorizer = TfidfVectorizer(dtype=np.float32)
+    analyze = vectorizer.build_analyzer()
+    df_counts = Counter()
+    n_docs = 0
+    for chunk in chunks:
+        chunk = clean_chunk(chunk)
+        for text in chunk[INGREDIENT_COLUMN].map(recipe_text):
+            df_counts.update(set(analyze(text)))
+        n_docs += len(chunk)
+
+    terms = sorted(t for t, c in df_counts.items() if c >= min_df)
+    if not terms:
+        raise ValueError("No ingredient terms found in the recipes.")
+    vectorizer = TfidfVectorizer(dtype=np.float32, vocabulary={t: i for i, t in enumerate(terms)})
+    counts = np.array([df_counts[t] for t in terms], dtype=np.float64)
+    # smooth_idf, as TfidfVectorizer.fit computes it
+    vectorizer.idf_ = np.log((1 + n_docs) / (1 + counts)) + 1
+    return vectorizer, n_docs
+
+
+def build_recipe_index(csv_path, output, chunk_size=50_000, min_df=1, extra_files=None, progress=None):
+    """Pass 2: write the catalog at ``output``. Returns the number of recipes written."""
+    return build_from_chunks(lambda: read_chunks(csv_path, chunk_size), output, min_df, extra_files, progress)
+
+
+def build_from_chunks(make_chunks, output, min_df=1, extra_files=None, progress=None):
+    """
+    Both passes over the raw chunks ``make_chunks()`` yields; it is called
+    once per pass and must produce the same recipes each time.
+    """
+    vectorizer, _ = fit_chunks(make_chunks(), min_df)
+    writer = ArtifactWriter(output, vectorizer, schema=SCHEMA, restrictions=DIETARY_RESTRICTIONS)
+    written = 0
+    for chunk in make_chunks():
+        chunk = clean_chunk(chunk)
+        if not len(chunk):
+            continue
+        writer.append(chunk, vectorizer.transform(chunk[INGREDIENT_COLUMN].map(recipe_text)))
+        written += len(chunk)
+        if progress:
+            progress(written)
+    writer.close(extra_files=extra_files)
+    return written
@@ -0,0 +1,659 @@
+# meal_plan/recipe_catalog.py
+"""
+On-disk recipe catalog used by the AI recommender.
+
+The catalog is a directory of plain ``.npy`` files instead of one pickle:
+
+    meta.json                   row count, feature count and column schema
+    vectorizer.joblib           the fitted TF-IDF vectorizer (small)
+    tfidf/{data,indices,indptr}.npy
+                                TF-IDF matrix as CSR arrays, rows L2-normalized
+    tfidf_t/...                 its transpose (term -> recipes) for retrieval
+    columns/<name>.npy          numeric recipe columns
+    columns/<name>.offsets.npy  text columns: UTF-8 bytes + row offsets
+    columns/<name>.bytes.npy    (same layout Arrow uses for string arrays)
+    columns/<name>.isnull.npy
+    columns/<name>.codes.npy    category columns (few distinct strings): int32 codes
+    columns/<name>.categories.json
+                                and the strings they index
+    ingredients/                inverted ingredient index (see ingredient_index)
+    dietary/                    per-recipe restriction bitmasks (see dietary_index)
+    derived/                    typed MealType / servings and sorted indexes (see derived_columns)
+    ann/                        optional IVF retrieval index (see ann_index)
+    lsa/                        optional dense LSA vectors for retrieval (see lsa_index)
+
+Every array is opened with ``mmap_mode="r"``, so opening a catalog costs the
+same for 1k or 1M recipes and all worker processes share the pages through
+the OS page cache instead of each keeping a private unpickled copy.
+"""
+import json
+import os
+import shutil
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from .ann_index import ANN_DIR, IVFIndex
+from .derived_columns import DERIVED_DIR, DerivedColumns, save_derived
+from .dietary_index import DietaryIndex, save_dietary_bits
+from .lsa_index import LSA_DIR, LSARetriever
+from .retrieval import SparseRetriever
+from .ingredient_index import (
+    INGREDIENT_COLUMN, VOCAB_FILE, IngredientIndex, IngredientIndexBuilder,
+    build_postings, fill_postings,
+)
+
+FORMAT_VERSION = 4
+# 3 = the same layout without category columns
+READABLE_FORMATS = (3, FORMAT_VERSION)
+
+META_FILE = "meta.json"
+VECTORIZER_FILE = "vectorizer.joblib"
+
+# text columns with at most this many distinct values (each used twice on
+# average) are stored as category columns
+CATEGORY_MAX = 4096
+# long text only needed for the recipes actually shown: left out of
+# compact_frame() and fetched per recipe id with details()
+BULKY_COLUMNS = ("RecipeInstructions_cleaned", "Description", "Images")
+
+
+# ------------------- Array helpers -------------------
+
+def load_array(path):
+    """Open a ``.npy`` file memory-mapped (empty arrays can't be mapped)."""
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        return np.load(path)
+
+
+def _finalize_npy(raw_path, npy_path, dtype, count):
+    """Wrap a raw binary file written in chunks into a ``.npy`` file."""
+    with open(npy_path, "wb") as out:
+        np.lib.format.write_array_header_1_0(out, {
+            "descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+            "fortran_order": False,
+            "shape": (count,),
+        })
+        with open(raw_path, "rb") as src:
+            shutil.copyfileobj(src, out, length=1 << 20)
+    os.remove(raw_path)
+
+
+class _AppendArray:
+    """A 1-D array written to disk chunk by chunk."""
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._raw = path + ".part"
+        self._fh = open(self._raw, "wb")
+
+    def append(self, values):
+        values = np.ascontiguousarray(values, dtype=self.dtype)
+        self._fh.write(values.tobytes())
+        self.count += len(values)
+
+    def close(self):
+        self._fh.close()
+        _finalize_npy(self._raw, self.path, self.dtype, self.count)
+
+
+# ------------------- Text columns -------------------
+
+def _encode(values):
+    """(UTF-8 bytes of every value, byte lengths, null mask)."""
+    nulls = np.asarray(pd.isna(values), dtype=bool)
+    encoded = [b"" if null else str(v).encode("utf-8") for v, null in zip(values, nulls)]
+    lengths = np.fromiter((len(b) for b in encoded), dtype=np.int64, count=len(encoded))
+    return encoded, lengths, nulls
+
+
+class TextColumn:
+    """
+    Read-only string column backed by one UTF-8 byte buffer and row offsets.
+    Values are only decoded for the rows that are asked for.
+    """
+
+    def __init__(self, offsets, data, isnull):
+        self.offsets = offsets
+        self.data = data
+        self.isnull = isnull
+
+    @classmethod
+    def open(cls, prefix):
+        return cls(
+            load_array(prefix + ".offsets.npy"),
+            load_array(prefix + ".bytes.npy"),
+            load_array(prefix + ".isnull.npy"),
+        )
+
+    @classmethod
+    def from_values(cls, values):
+        """In-memory column: one byte buffer instead of a Python string per row."""
+        encoded, lengths, nulls = _encode(values)
+        offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8), nulls)
+
+    def __len__(self):
+        return len(self.isnull)
+
+    def value(self, i):
+        if self.isnull[i]:
+            return None
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return bytes(self.data[start:end]).decode("utf-8")
+
+    def take(self, ids):
+        out = np.empty(len(ids), dtype=object)
+        for pos, i in enumerate(ids):
+            out[pos] = self.value(i)
+        return out
+
+    def to_numpy(self):
+        return self.take(np.arange(len(self)))
+
+
+class _TextColumnWriter:
+
+    def __init__(self, prefix):
+        self.offsets = _AppendArray(prefix + ".offsets.npy", np.int64)
+        self.data = _AppendArray(prefix + ".bytes.npy", np.uint8)
+        self.isnull = _AppendArray(prefix + ".isnull.npy", np.bool_)
+        self.offsets.append([0])
+        self._end = 0
+
+    def append(self, values):
+        encoded, lengths, nulls = _encode(values)
+        ends = self._end + np.cumsum(lengths)
+        if len(ends):
+            self._end = int(ends[-1])
+        self.offsets.append(ends)
+        self.data.append(np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        self.isnull.append(nulls)
+
+    def close(self):
+        for arr in (self.offsets, self.data, self.isnull):
+            arr.close()
+
+
+class CategoryColumn:
+    """
+    String column with few distinct values: int32 codes (-1 = missing)
+    into a short list of categories, so every repeated string is stored
+    once and taking rows is a single array lookup.
+    """
+
+    def __init__(self, codes, categories):
+        self.codes = codes
+        self.categories = np.array(list(categories), dtype=object)
+        self._lookup = np.concatenate([np.array([None], dtype=object), self.categories])
+
+    @classmethod
+    def open(cls, prefix):
+        with open(prefix + ".categories.json") as fh:
+            categories = json.load(fh)
+        return cls(load_array(prefix + ".codes.npy"), categories)
+
+    @classmethod
+    def from_values(cls, values):
+        nulls = pd.isna(values)
+        strings = pd.Series([None if null else str(v) for v, null in zip(values, nulls)], dtype=object)
+        codes, categories = pd.factorize(strings)
+        return cls(codes.astype(np.int32), categories)
+
+    def __len__(self):
+        return len(self.codes)
+
+    def value(self, i):
+        return self._lookup[self.codes[i] + 1]
+
+    def take(self, ids):
+        return self._lookup[np.asarray(self.codes[ids]) + 1]
+
+    def to_numpy(self):
+        return self._lookup[np.asarray(self.codes) + 1]
+
+    def categorical(self):
+        return pd.Categorical.from_codes(np.asarray(self.codes), categories=self.categories)
+
+
+class _CategoryColumnWriter:
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.codes = _AppendArray(prefix + ".codes.npy", np.int32)
+        self._index = {}
+
+    def append(self, values):
+        index = self._index
+        nulls = pd.isna(values)
+        self.codes.append(np.fromiter(
+            (-1 if null else index.setdefault(str(v), len(index)) for v, null in zip(values, nulls)),
+            dtype=np.int32, count=len(values),
+        ))
+
+    def close(self):
+        self.codes.close()
+        with open(self.prefix + ".categories.json", "w") as fh:
+            json.dump(list(self._index), fh)
+
+
+def open_column(prefix, kind):
+    if kind == "text":
+        return TextColumn.open(prefix)
+    if kind == "category":
+        return CategoryColumn.open(prefix)
+    return load_array(prefix + ".npy")
+
+
+def _downcast(values):
+    """float32 / int32 copies of numeric values when nothing is lost."""
+    if values.dtype == np.float64:
+        small = values.astype(np.float32)
+        if np.array_equal(small, values, equal_nan=True):
+            return small
+    elif values.dtype == np.int64 and len(values):
+        info = np.iinfo(np.int32)
+        if info.min <= values.min() and values.max() <= info.max:
+            return values.astype(np.int32)
+    return values
+
+
+def take(column, ids):
+    """Gather ``ids`` from a numeric ndarray, :class:`TextColumn` or :class:`CategoryColumn`."""
+    return column.take(np.asarray(ids, dtype=np.int64))
+
+
+# ------------------- Writer -------------------
+
+def _column_kind(series):
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_integer_dtype(series):
+        return "int64"
+    if pd.api.types.is_numeric_dtype(series):
+        return "float64"
+    try:
+        distinct = series.nunique(dropna=True)
+    except TypeError:       # unhashable values (lists); stored as their str()
+        return "text"
+    if distinct <= min(CATEGORY_MAX, len(series) // 2):
+        return "category"
+    return "text"
+
+
+class ArtifactWriter:
+    """
+    Write a catalog directory from (DataFrame, TF-IDF rows) chunks.
+
+    Files go to a temporary sibling directory that replaces ``path`` only
+    in :meth:`close`, so readers never see a half-written catalog.
+    """
+
+    def __init__(self, path, vectorizer, schema=None, restrictions=None):
+        self.path = os.path.abspath(path)
+        self.restrictions = restrictions
+        self.tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+        os.makedirs(os.path.join(self.tmp_path, "tfidf"))
+        os.makedirs(os.path.join(self.tmp_path, "tfidf_t"))
+        os.makedirs(os.path.join(self.tmp_path, "columns"))
+        os.makedirs(os.path.join(self.tmp_path, "ingredients"))
+        joblib.dump(vectorizer, os.path.join(self.tmp_path, VECTORIZER_FILE))
+
+        self.schema = dict(schema) if schema else None
+        self.n_rows = 0
+        self.n_features = len(vectorizer.vocabulary_)
+        self._columns = {}
+        tfidf = os.path.join(self.tmp_path, "tfidf")
+        self._data = _AppendArray(os.path.join(tfidf, "data.npy"), np.float32)
+        self._indices = _AppendArray(os.path.join(tfidf, "indices.npy"), np.int32)
+        self._indptr = _AppendArray(os.path.join(tfidf, "indptr.npy"), np.int64)
+        self._indptr.append([0])
+        self._nnz = 0
+
+        ingredients = os.path.join(self.tmp_path, "ingredients")
+        self._ing_builder = IngredientIndexBuilder()
+        self._ing_indices = _AppendArray(os.path.join(ingredients, "indices.npy"), np.int32)
+        self._ing_indptr = _AppendArray(os.path.join(ingredients, "indptr.npy"), np.int64)
+        self._ing_indptr.append([0])
+        self._ing_nnz = 0
+
+    def _open_columns(self, df):
+        if self.schema is None:
+            self.schema = {c: _column_kind(df[c]) for c in df.columns}
+        for name, kind in self.schema.items():
+            prefix = os.path.join(self.tmp_path, "columns", name)
+            if kind == "text":
+                self._columns[name] = _TextColumnWriter(prefix)
+            elif kind == "category":
+                self._columns[name] = _CategoryColumnWriter(prefix)
+            else:
+                self._columns[name] = _AppendArray(prefix + ".npy", kind)
+
+    def append(self, df, matrix):
+        """Append recipe rows and their (already fitted) TF-IDF rows."""
+        if len(df) != matrix.shape[0]:
+            raise ValueError("DataFrame and TF-IDF matrix row counts differ.")
+        if not self._columns:
+            self._open_columns(df)
+
+        for name, kind in self.schema.items():
+            values = df[name] if name in df.columns else pd.Series([None] * len(df))
+            if kind in ("text", "category"):
+                self._columns[name].append(values.to_numpy(dtype=object))
+            elif kind.startswith("float"):
+                self._columns[name].append(pd.to_numeric(values, errors="coerce").to_numpy(dtype=kind))
+            else:
+                self._columns[name].append(pd.to_numeric(values, errors="coerce").fillna(0).to_numpy(dtype=kind))
+
+        matrix = normalize(sparse.csr_matrix(matrix), norm="l2")
+        matrix.sort_indices()
+        self._data.append(matrix.data)
+        self._indices.append(matrix.indices)
+        self._indptr.append(matrix.indptr[1:] + self._nnz)
+        self._nnz += matrix.nnz
+
+        values = df[INGREDIENT_COLUMN].to_numpy(dtype=object) if INGREDIENT_COLUMN in df.columns else [None] * len(df)
+        lengths, token_ids = self._ing_builder.add(values)
+        self._ing_indices.append(token_ids)
+        self._ing_indptr.append(self._ing_nnz + np.cumsum(lengths))
+        self._ing_nnz += len(token_ids)
+        self.n_rows += len(df)
+
+    def _close_transpose(self):
+        src = os.path.join(self.tmp_path, "tfidf")
+        dst = os.path.join(self.tmp_path, "tfidf_t")
+        indptr = load_array(os.path.join(src, "indptr.npy"))
+        indices = load_array(os.path.join(src, "indices.npy"))
+        data = load_array(os.path.join(src, "data.npy"))
+        t_indptr = build_postings(indptr, indices, self.n_features)
+        if self._nnz < np.iinfo(np.int32).max:
+            t_indptr = t_indptr.astype(np.int32)
+        np.save(os.path.join(dst, "indptr.npy"), t_indptr)
+        if not self._nnz:
+            np.save(os.path.join(dst, "indices.npy"), np.empty(0, dtype=np.int32))
+            np.save(os.path.join(dst, "data.npy"), np.empty(0, dtype=np.float32))
+            return
+        out = np.lib.format.open_memmap(os.path.join(dst, "indices.npy"), mode="w+",
+                                        dtype=np.int32, shape=(self._nnz,))
+        out_data = np.lib.format.open_memmap(os.path.join(dst, "data.npy"), mode="w+",
+                                             dtype=np.float32, shape=(self._nnz,))
+        fill_postings(indptr, indices, t_indptr, out, data=data, out_data=out_data)
+        out.flush()
+        out_data.flush()
+        del out, out_data
+
+    def _close_ingredient_index(self):
+        path = os.path.join(self.tmp_path, "ingredients")
+        self._ing_indices.close()
+        self._ing_indptr.close()
+        with open(os.path.join(path, VOCAB_FILE), "w") as fh:
+            json.dump(self._ing_builder.vocab, fh)
+
+        indptr = load_array(self._ing_indptr.path)
+        indices = load_array(self._ing_indices.path)
+        post_indptr = build_postings(indptr, indices, len(self._ing_builder.vocab))
+        np.save(os.path.join(path, "post_indptr.npy"), post_indptr)
+        out_path = os.path.join(path, "post_indices.npy")
+        if len(indices):
+            out = np.lib.format.open_memmap(out_path, mode="w+", dtype=np.int32, shape=(len(indices),))
+            fill_postings(indptr, indices, post_indptr, out)
+            out.flush()
+            del out
+        else:
+            np.save(out_path, np.empty(0, dtype=np.int32))
+
+    def _close_derived(self):
+        columns = {}
+        for name in ("Calories", "Servings", "RecipeServings"):
+            kind = self.schema.get(name)
+            if kind is not None:
+                columns[name] = open_column(os.path.join(self.tmp_path, "columns", name), kind)
+        save_derived(os.path.join(self.tmp_path, DERIVED_DIR), self.n_rows,
+                     columns.__contains__, lambda name, ids: take(columns[name], ids))
+
+    def close(self, extra_files=None, before_swap=None):
+        """
+        Finish every array and swap the directory in. ``extra_files`` maps
+        file names to JSON objects written alongside meta.json before the
+        swap; ``before_swap(tmp_path)`` can add more (e.g. search indexes).
+        """
+        if not self._columns:
+            raise ValueError("Refusing to write an empty recipe catalog.")
+        for col in self._columns.values():
+            col.close()
+        for arr in (self._data, self._indices, self._indptr):
+            arr.close()
+        if self._nnz < np.iinfo(np.int32).max:
+            # scipy would otherwise copy indptr down to int32 on every open
+            indptr = np.load(self._indptr.path)
+            np.save(self._indptr.path, indptr.astype(np.int32))
+        self._close_transpose()
+        self._close_ingredient_index()
+        self._close_derived()
+        if self.restrictions:
+            ingredients = IngredientIndex.open(os.path.join(self.tmp_path, "ingredients"), load_array)
+            save_dietary_bits(os.path.join(self.tmp_path, "dietary"), ingredients, self.restrictions)
+
+        meta = {
+            "format": FORMAT_VERSION,
+            "n_rows": self.n_rows,
+            "n_features": self.n_features,
+            "columns": self.schema,
+        }
+        with open(os.path.join(self.tmp_path, META_FILE), "w") as fh:
+            json.dump(meta, fh, indent=2)
+        for name, payload in (extra_files or {}).items():
+            with open(os.path.join(self.tmp_path, name), "w") as fh:
+                json.dump(payload, fh, indent=2)
+        if before_swap is not None:
+            before_swap(self.tmp_path)
+
+        old = f"{self.path}.old-{os.getpid()}"
+        if os.path.exists(self.path):
+            os.rename(self.path, old)
+        os.rename(self.tmp_path, self.path)
+        shutil.rmtree(old, ignore_errors=True)
+
+
+def write_catalog(path, vectorizer, matrix, df, restrictions=None, chunk_size=50_000, extra_files=None):
+    """Write a whole in-memory catalog to ``path``."""
+    writer = ArtifactWriter(path, vectorizer, restrictions=restrictions)
+    matrix = sparse.csr_matrix(matrix)
+    for start in range(0, max(len(df), 1), chunk_size):
+        stop = min(start + chunk_size, len(df))
+        writer.append(df.iloc[start:stop], matrix[start:stop])
+    writer.close(extra_files=extra_files)
+
+
+# ------------------- Reader -------------------
+
+def _open_csr(path, shape):
+    return sparse.csr_matrix(
+        (
+            load_array(os.path.join(path, "data.npy")),
+            load_array(os.path.join(path, "indices.npy")),
+            load_array(os.path.join(path, "indptr.npy")),
+        ),
+        shape=shape,
+        copy=False,
+    )
+
+
+def is_catalog(path):
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+class RecipeCatalog:
+    """
+    TF-IDF matrix + recipe columns, addressed by integer recipe id
+    (row position). Build one with :meth:`open` (memory-mapped) or
+    :meth:`from_frame` (in memory, e.g. for the legacy pickle).
+    """
+
+    def __init__(self, vectorizer, matrix, matrix_t, columns, ingredients, path=None):
+        self.vectorizer = vectorizer
+        self.matrix = matrix
+        self.matrix_t = matrix_t
+        self.retriever = SparseRetriever(vectorizer, matrix, matrix_t)
+        self.columns = columns
+        self.ingredients = ingredients
+        self.dietary = None
+        self.derived = None
+        self.path = path
+        self.n_rows = matrix.shape[0]
+        self.version = None     # manifest version, see catalog_store
+        self._compact_frame = None
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, META_FILE)) as fh:
+            meta = json.load(fh)
+        if meta.get("format") not in READABLE_FORMATS:
+            raise ValueError(f"Unsupported recipe catalog format: {meta.get('format')}")
+
+        matrix = _open_csr(os.path.join(path, "tfidf"), (meta["n_rows"], meta["n_features"]))
+        matrix_t = _open_csr(os.path.join(path, "tfidf_t"), (meta["n_features"], meta["n_rows"]))
+
+        columns = {name: open_column(os.path.join(path, "columns", name), kind)
+                   for name, kind in meta["columns"].items()}
+
+        ingredients = IngredientIndex.open(os.path.join(path, "ingredients"), load_array)
+        vectorizer = joblib.load(os.path.join(path, VECTORIZER_FILE))
+        return cls(vectorizer, matrix, matrix_t, columns, ingredients, path=path)
+
+    @classmethod
+    def from_frame(cls, vectorizer, matrix, df):
+        """
+        In-memory catalog with the same compact columns as on disk: text as
+        one byte buffer, few-valued text as categories, numbers downcast
+        to 32 bits where that is lossless.
+        """
+        columns = {}
+        for name in df.columns:
+            kind = _column_kind(df[name])
+            if kind == "text":
+                columns[name] = TextColumn.from_values(df[name].to_numpy(dtype=object))
+            elif kind == "category":
+                columns[name] = CategoryColumn.from_values(df[name].to_numpy(dtype=object))
+            else:
+                columns[name] = _downcast(df[name].to_numpy(dtype=kind))
+        values = df[INGREDIENT_COLUMN] if INGREDIENT_COLUMN in df.columns else [None] * len(df)
+        ingredients = IngredientIndex.from_values(values)
+        matrix = normalize(sparse.csr_matrix(matrix, dtype=np.float32), norm="l2")
+        return cls(vectorizer, matrix, matrix.T.tocsr(), columns, ingredients)
+
+    def __len__(self):
+        return self.n_rows
+
+    def load_dietary(self, restrictions):
+        """Attach restriction bitmasks (stored ones if still current)."""
+        path = os.path.join(self.path, "dietary") if self.path else ""
+        self.dietary = DietaryIndex.load(path, restrictions, self.ingredients, load_array)
+        return self.dietary
+
+    def load_derived(self):
+        """Attach typed MealType / servings columns (stored ones if still current)."""
+        path = os.path.join(self.path, DERIVED_DIR) if self.path else ""
+        self.derived = DerivedColumns.load(path, self, load_array)
+        return self.derived
+
+    def load_lsa(self):
+        """
+        Switch similarity search to the LSA vectors built for this catalog,
+        if any. Returns the new retriever or None.
+        """
+        path = os.path.join(self.path, LSA_DIR) if self.path else ""
+        if not os.path.isfile(os.path.join(path, META_FILE)):
+            print("⚠️ This catalog has no LSA vectors, using sparse TF-IDF search. "
+                  "Build them with `manage.py build_lsa_index`.")
+            return None
+        retriever = LSARetriever.open(path, self, load_array)
+        if retriever.meta.get("n_rows") != self.n_rows:
+            print("⚠️ LSA vectors are out of date for this catalog, using sparse TF-IDF search. "
+                  "Rebuild them with `manage.py build_lsa_index`.")
+            return None
+        self.retriever = retriever
+        return retriever
+
+    def load_ann(self, nprobe):
+        """
+        Attach the IVF index built for this catalog, if any, probing
+        ``nprobe`` lists per query. Returns the index or None.
+        """
+        path = os.path.join(self.path, ANN_DIR) if self.path else ""
+        if not nprobe:
+            return None
+        if not os.path.isfile(os.path.join(path, META_FILE)):
+            print("⚠️ This catalog has no ANN index, using exact search. "
+                  "Build it with `manage.py build_ann_index`.")
+            return None
+        ann = IVFIndex.open(path, load_array)
+        if ann.meta.get("n_rows") != self.n_rows:
+            print("⚠️ ANN index is out of date for this catalog, using exact search. "
+                  "Rebuild it with `manage.py build_ann_index`.")
+            return None
+        self.retriever.ann = ann
+        self.retriever.nprobe = nprobe
+        return ann
+
+    def column(self, name):
+        return self.columns[name]
+
+    def has_column(self, name):
+        return name in self.columns
+
+    def take(self, name, ids):
+        """One column's values for ``ids`` (decoded only for those rows)."""
+        return take(self.columns[name], ids)
+
+    def rows(self, ids, columns=None, extra=None):
+        """
+        Materialize a DataFrame for ``ids`` only, in the given order.
+        ``extra`` maps column names to arrays added to (or replacing) the
+        stored columns; the frame is built in one go either way.
+        """
+        ids = np.asarray(ids, dtype=np.int64)
+        names = columns or list(self.columns)
+        data = {name: take(self.columns[name], ids) for name in names}
+        data["recipe_id"] = ids
+        data.update(extra or {})
+        return pd.DataFrame(data)
+
+    def details(self, recipe_id):
+        """The BULKY_COLUMNS of one recipe, read from the catalog on demand."""
+        ids = np.array([recipe_id], dtype=np.int64)
+        return {name: take(self.columns[name], ids)[0] for name in BULKY_COLUMNS if name in self.columns}
+
+    def compact_frame(self, cache=True):
+        """
+        Every recipe without the BULKY_COLUMNS: category columns as pandas
+        categoricals and numbers in their stored dtype. Kept once built
+        (it is what ai_recommender.DF_RECIPES returns) unless ``cache`` is False.
+        """
+        if self._compact_frame is not None:
+            return self._compact_frame
+        data = {}
+        for name, column in self.columns.items():
+            if name in BULKY_COLUMNS:
+                continue
+            if isinstance(column, CategoryColumn):
+                data[name] = column.categorical()
+            elif isinstance(column, TextColumn):
+                data[name] = column.to_numpy()
+            else:
+                data[name] = np.asarray(column)
+        data["recipe_id"] = np.arange(self.n_rows)
+        frame = pd.DataFrame(data)
+        if cache:
+            self._compact_frame = frame
+        return frame
+
+    def to_frame(self):
+        return self.rows(np.arange(self.n_rows))
@@ -0,0 +1,149 @@
+# meal_plan/recommendation_cache.py
+"""
+In-process cache for recommendation results.
+
+Keys combine the normalized pantry ingredient set, a fingerprint of the
+profile fields that change results (goal, dietary_pref, allergy_info,
+plus weight, height and age for the calorie target), the serving size
+and any other call arguments. Entries expire after a TTL, the least
+recently used entry is evicted when the cache is full, and
+``meal_plan.signals`` drops a user's entries whenever their Profile,
+PantryItems or Recipes are saved or deleted.
+"""
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+def _digest(*parts):
+    return hashlib.sha1("\x1f".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+
+def normalize_pantry(pantry_names):
+    return frozenset(n.strip().lower() for n in pantry_names if n and n.strip())
+
+
+def _number(value):
+    try:
+        return repr(float(value)) if value is not None and value != "" else ""
+    except (TypeError, ValueError):
+        return ""
+
+
+def profile_fields_fingerprint(profile):
+    """Digest of the profile fields that change results: ranking filters and the calorie target inputs."""
+    return _digest(
+        (profile.goal or "").strip().lower(),
+        (profile.dietary_pref or "").strip().lower(),
+        ",".join(sorted(a.strip().lower() for a in (profile.allergy_info or "").split(",") if a.strip())),
+        # daily_calorie_target reads these, and plans are built around it
+        _number(profile.weight_kg),
+        _number(profile.height_cm),
+        _number(profile.age),
+    )
+
+
+def profile_fingerprint(user):
+    profile = getattr(user, "profile", None)
+    if not profile:
+        return None
+    return profile_fields_fingerprint(profile)
+
+
+def recommendation_key(kind, user, pantry_names, serving_size=None, exclude_names=None, **extra):
+    return (
+        kind,
+        getattr(user, "pk", None),
+        normalize_pantry(pantry_names),
+        profile_fingerprint(user),
+        serving_size,
+        _digest(*sorted(n.lower() for n in exclude_names)) if exclude_names else None,
+        tuple(sorted(extra.items())),
+    )
+
+
+class RecommendationCache:
+    """Thread-safe LRU + TTL cache with per-user invalidation and hit-rate stats."""
+
+    def __init__(self, max_entries=512, ttl=600, report_every=100):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.report_every = report_every
+        self._entries = OrderedDict()   # key -> (expires_at, user_id, value)
+        self._by_user = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] < now:
+                self._remove(key)
+                entry = _MISSING
+            if entry is _MISSING:
+                self.misses += 1
+                value = default
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                value = entry[2]
+            lookups = self.hits + self.misses
+        if self.report_every and lookups % self.report_every == 0:
+            logger.info("Recommendation cache: %s", self.stats())
+        return value
+
+    def set(self, key, value, user_id=None):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, user_id, value)
+            self._by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, user_id, _ = self._entries.pop(key)
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def invalidate_user(self, user_id):
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+RECOMMENDATION_CACHE = RecommendationCache(
+    max_entries=getattr(settings, "RECOMMENDATION_CACHE_SIZE", 512),
+    ttl=getattr(settings, "RECOMMENDATION_CACHE_TTL", 600),
+)
@@ -0,0 +1,310 @@
+# meal_plan/recommender_service.py
+"""
+Optional recommender server: one long-lived process (``manage.py
+run_recommender``) owns the catalog and its indexes, and Django workers
+ask it for ranked recipe ids over a Unix socket (RECOMMENDER_SOCKET).
+
+Messages are length-prefixed JSON (4-byte big-endian length, UTF-8
+body) on a persistent connection per worker thread:
+
+    {"op": "search" | "match", "pantry": [...], "top_k": 10,
+     "max_extra": 3, "dietary_pref": "...", "allergy_info": "..."}
+    -> {"ids": [...], "scores": [...], "n_rows": 123456, "version": 7}
+
+"search" requests arriving within RECOMMENDER_BATCH_WINDOW_MS of each
+other are scored with one sparse matrix product, each with its own
+diet/allergy mask and top_k. When the server can't be reached, or
+answers from another catalog version (manifest version, see
+catalog_store) than the worker's, the client returns None and the
+caller ranks in-process instead.
+"""
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+from .instrumentation import metrics_snapshot, span
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+MAX_MESSAGE = 64 << 20
+
+
+# ------------------- Wire protocol -------------------
+
+def send_message(sock, payload):
+    body = json.dumps(payload).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 16))
+        if not chunk:
+            raise ConnectionError("connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock):
+    (size,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    if size > MAX_MESSAGE:
+        raise ValueError(f"message too large ({size} bytes)")
+    return json.loads(_recv_exact(sock, size).decode("utf-8"))
+
+
+# ------------------- Server -------------------
+
+class _Pending:
+    __slots__ = ("pantry", "top_k", "mask_key", "done", "result", "error")
+
+    def __init__(self, pantry, top_k, mask_key):
+        self.pantry = pantry
+        self.top_k = top_k
+        self.mask_key = mask_key
+        self.done = threading.Event()
+        self.result = self.error = None
+
+
+class MicroBatcher:
+    """Collects concurrent search requests and scores them together."""
+
+    def __init__(self, window=0.002, max_batch=64, max_masks=64):
+        self.window = window
+        self.max_batch = max_batch
+        self.max_masks = max_masks
+        self._queue = queue.Queue()
+        self._masks = OrderedDict()     # (catalog version, rows, (diet, allergy)) -> allowed mask
+        self.batches = self.queries = 0
+        threading.Thread(target=self._run, name="recommender-batcher", daemon=True).start()
+
+    def search(self, pantry, top_k, dietary_pref=None, allergy_info=None, timeout=30):
+        pending = _Pending(pantry, top_k, (dietary_pref or "", allergy_info or ""))
+        self._queue.put(pending)
+        if not pending.done.wait(timeout):
+            raise TimeoutError("search batch timed out")
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _mask(self, catalog, key):
+        # the manifest version changes with every delta, compaction or rebuild; id() could be reused
+        cache_key = (getattr(catalog, "path", None), catalog.version, len(catalog), key)
+        if cache_key not in self._masks:
+            self._masks[cache_key] = catalog.dietary.allowed_mask(*key)
+            if len(self._masks) > self.max_masks:
+                self._masks.popitem(last=False)
+        self._masks.move_to_end(cache_key)
+        return self._masks[cache_key]
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._score(batch)
+
+    def _score(self, batch):
+        from .ai_recommender import get_catalog
+
+        try:
+            with span("recommender_batch", queries=len(batch)):
+                catalog = get_catalog()
+                if catalog is None:
+                    raise RuntimeError("No recipe catalog loaded.")
+                found = catalog.retriever.search_batch(
+                    [p.pantry for p in batch],
+                    top_k=[p.top_k for p in batch],
+                    allowed=[self._mask(catalog, p.mask_key) for p in batch],
+                )
+            for pending, (ids, scores) in zip(batch, found):
+                pending.result = (ids, scores, len(catalog), catalog.version)
+        except Exception as e:
+            for pending in batch:
+                pending.error = e
+        self.batches += 1
+        self.queries += len(batch)
+        for pending in batch:
+            pending.done.set()
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "queries": self.queries,
+            "mean_batch": round(self.queries / self.batches, 2) if self.batches else 0.0,
+        }
+
+
+class _Handler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, OSError, ValueError):
+                return
+            try:
+                response = self.server.dispatch(request)
+            except Exception as e:
+                logger.exception("Recommender request failed")
+                response = {"error": f"{type(e).__name__}: {e}"}
+            try:
+                send_message(self.request, response)
+            except OSError:
+                return
+
+
+class RecommenderServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    # Unix sockets refuse connects (EAGAIN) once the backlog is full, and
+    # every worker thread opens its own connection
+    request_queue_size = 256
+
+    def __init__(self, path, window=0.002, max_batch=64):
+        if os.path.exists(path):
+            os.remove(path)     # stale socket from a previous run
+        super().__init__(path, _Handler)
+        self.batcher = MicroBatcher(window=window, max_batch=max_batch)
+
+    def dispatch(self, request):
+        from .ai_recommender import get_catalog, rank_pantry
+
+        op = request.get("op")
+        if op == "stats":
+            catalog = get_catalog()
+            return {**self.batcher.stats(), "n_rows": len(catalog) if catalog is not None else 0,
+                    "metrics": metrics_snapshot()}
+        pantry = list(request.get("pantry") or [])
+        top_k = int(request.get("top_k", 10))
+        diet, allergy = request.get("dietary_pref"), request.get("allergy_info")
+        if op == "search":
+            ids, scores, n_rows, version = self.batcher.search(pantry, top_k, diet, allergy)
+        elif op == "match":
+            catalog = get_catalog()
+            ids, scores = rank_pantry(catalog, "match", pantry, top_k, int(request.get("max_extra", 3)), diet, allergy)
+            n_rows, version = len(catalog), catalog.version
+        else:
+            raise ValueError(f"unknown op {op!r}")
+        return {"ids": ids.tolist(), "scores": scores.tolist(), "n_rows": n_rows, "version": version}
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+
+# ------------------- Client -------------------
+
+class RecommenderClient:
+    """One persistent connection per thread; backs off for ``retry_after`` seconds after a failure."""
+
+    def __init__(self, path, timeout=2.0, retry_after=30.0):
+        self.path = path
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._local = threading.local()
+        self._down_until = 0.0
+
+    def _socket(self):
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _close(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            sock.close()
+
+    def request(self, payload):
+        """The server's response, or None if it is unavailable."""
+        if time.monotonic() < self._down_until:
+            return None
+        error = None
+        for _ in range(2):      # a kept-alive connection may have gone stale
+            try:
+                sock = self._socket()
+                send_message(sock, payload)
+                return recv_message(sock)
+            except (OSError, ValueError) as e:
+                self._close()
+                error = e
+        self._down_until = time.monotonic() + self.retry_after
+        logger.warning("Recommender server %s unavailable (%s); ranking in-process for %ss",
+                       self.path, error, self.retry_after)
+        return None
+
+
+_CLIENT = None
+_CLIENT_LOCK = threading.Lock()
+
+
+def get_client():
+    """Client for settings.RECOMMENDER_SOCKET, or None when server mode is off."""
+    global _CLIENT
+    path = getattr(settings, "RECOMMENDER_SOCKET", "")
+    if not path or not hasattr(socket, "AF_UNIX"):
+        return None
+    with _CLIENT_LOCK:
+        if _CLIENT is None or _CLIENT.path != path:
+            _CLIENT = RecommenderClient(path, timeout=getattr(settings, "RECOMMENDER_TIMEOUT", 2.0))
+    return _CLIENT
+
+
+def remote_rank(mode, pantry, top_k, max_extra, dietary_pref, allergy_info, n_rows, version=None):
+    """
+    Ranked (ids, scores) from the recommender server, or None to rank
+    in-process: server mode off or unreachable, an error, or a ranking of
+    another catalog than this worker's (``n_rows`` recipes at manifest
+    ``version``), whose ids would point at different recipes.
+    """
+    client = get_client()
+    if client is None:
+        return None
+    response = client.request({
+        "op": mode,
+        "pantry": list(pantry),
+        "top_k": top_k,
+        "max_extra": max_extra,
+        "dietary_pref": dietary_pref,
+        "allergy_info": allergy_info,
+    })
+    if response is None:
+        return None
+    if "error" in response:
+        logger.warning("Recommender server error: %s", response["error"])
+        return None
+    if (response.get("version"), response.get("n_rows")) != (version, n_rows):
+        logger.info("Recommender server is on catalog version %s (%s recipes), this worker on %s (%s); "
+                    "ranking in-process", response.get("version"), response.get("n_rows"), version, n_rows)
+        return None
+    return np.asarray(response["ids"], dtype=np.int64), np.asarray(response["scores"], dtype=np.float32)
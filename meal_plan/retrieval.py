@@ -0,0 +1,145 @@
+# meal_plan/retrieval.py
+"""
+Top-k pantry retrieval over the TF-IDF catalog.
+
+Catalog rows are L2-normalized when the catalog is written, so cosine
+similarity is a plain sparse dot product. Scores are computed against the
+transposed matrix (term -> recipes), which only touches recipes sharing at
+least one term with the query, and the top-k is picked with
+``np.argpartition`` over those non-zero scores. Work and allocations per
+query therefore follow the number of matching recipes and ``top_k``, not
+the catalog size. A query matching fewer than ``top_k`` recipes is filled
+up with zero-score ones, lowest id first, so it still gets ``top_k``
+results like the full ranking it replaces.
+
+When an IVF index is attached (see ``ann_index``) and ``nprobe`` is set,
+only the recipes in the probed lists are scored, still exactly, which
+bounds the work for very common pantry terms as well.
+"""
+import numpy as np
+from sklearn.preprocessing import normalize
+
+
+def pantry_text(pantry_list):
+    return " ".join([p.lower() for p in pantry_list])
+
+
+def recipe_text(ingredients):
+    """Text a recipe's TF-IDF row is computed from (its cleaned ingredient list)."""
+    return ingredients.lower() if isinstance(ingredients, str) else ""
+
+
+def per_query(value, row):
+    """``value`` shared by every query, or a list with one entry per query."""
+    return value[row] if isinstance(value, list) else value
+
+
+def top_k_scores(ids, scores, top_k):
+    """Best ``top_k`` (ids, scores), highest score first, ties by id."""
+    if top_k <= 0:
+        return ids[:0], scores[:0]
+    if len(scores) > top_k:
+        part = np.argpartition(-scores, top_k - 1)[:top_k]
+        # argpartition picks any of the recipes tied at the cut: keep the lowest ids
+        cut = scores[part].min()
+        above = np.flatnonzero(scores > cut)
+        tied = np.flatnonzero(scores == cut)
+        part = np.concatenate([above, tied[np.argsort(ids[tied], kind="stable")[:top_k - len(above)]]])
+        ids, scores = ids[part], scores[part]
+    order = np.lexsort((ids, -scores))
+    return ids[order], scores[order]
+
+
+def fill_top_k(ids, scores, top_k, n_rows, allowed=None):
+    """
+    Append zero-score recipes (lowest id first, within ``allowed``) to a
+    ranking of fewer than ``top_k``, as a full argsort of the scores would.
+    """
+    missing = min(top_k, n_rows) - len(ids)
+    if missing <= 0:
+        return ids, scores
+    extra = []
+    chunk = max(4 * missing, 1024)
+    for start in range(0, n_rows, chunk):
+        candidates = np.arange(start, min(n_rows, start + chunk), dtype=np.int64)
+        candidates = candidates[~np.isin(candidates, ids)]
+        if allowed is not None:
+            candidates = candidates[allowed[candidates]]
+        extra.append(candidates[:missing])
+        missing -= len(extra[-1])
+        if not missing:
+            break
+    extra = np.concatenate(extra)
+    return np.concatenate([ids, extra]), np.concatenate([scores, np.zeros(len(extra), dtype=scores.dtype)])
+
+
+class SparseRetriever:
+
+    def __init__(self, vectorizer, matrix, matrix_t, ann=None, nprobe=0):
+        self.vectorizer = vectorizer
+        self.matrix = matrix        # recipes x terms, rows L2-normalized
+        self.matrix_t = matrix_t    # terms x recipes
+        self.ann = ann              # optional IVFIndex
+        self.nprobe = nprobe        # lists probed per query, 0 = exact search
+
+    def encode(self, pantry_lists):
+        q = self.vectorizer.transform([pantry_text(p) for p in pantry_lists])
+        return normalize(q, norm="l2", copy=False).astype(np.float32)
+
+    def search_batch(self, pantry_lists, top_k=10, allowed=None, nprobe=None):
+        """
+        One ranked ``(recipe_ids, scores)`` pair per pantry list. All
+        queries are scored with a single sparse matrix product.
+        ``allowed`` is an optional boolean mask over recipe ids.
+        ``top_k`` and ``allowed`` may also be lists with one entry per
+        query, so requests from different users can share the product.
+        ``nprobe`` overrides the retriever's default (0 = exact).
+        """
+        if not len(pantry_lists):
+            return []
+        return self.search_queries(self.encode(pantry_lists), top_k=top_k, allowed=allowed, nprobe=nprobe)
+
+    def search_queries(self, queries, top_k=10, allowed=None, nprobe=None):
+        """:meth:`search_batch` for already encoded queries."""
+        nprobe = self.nprobe if nprobe is None else nprobe
+        if self.ann is not None and nprobe:
+            return self._search_ann(queries, top_k, allowed, nprobe)
+        scores = (queries @ self.matrix_t).tocsr()
+        results = []
+        for row in range(scores.shape[0]):
+            lo, hi = scores.indptr[row], scores.indptr[row + 1]
+            ids = scores.indices[lo:hi].astype(np.int64)
+            vals = scores.data[lo:hi]
+            keep = vals > 0
+            mask = per_query(allowed, row)
+            if mask is not None:
+                keep &= mask[ids]
+            k = per_query(top_k, row)
+            found = top_k_scores(ids[keep], vals[keep], k)
+            results.append(fill_top_k(*found, k, self.matrix.shape[0], mask))
+        return results
+
+    def _search_ann(self, queries, top_k, allowed, nprobe):
+        """Exact re-rank of the recipes in the ``nprobe`` closest IVF lists."""
+        results = []
+        for row, ids in enumerate(self.ann.probe(queries, nprobe)):
+            mask = per_query(allowed, row)
+            if mask is not None:
+                ids = ids[mask[ids]]
+            vals = np.asarray((self.matrix[ids] @ queries[row].T).todense(), dtype=np.float32).ravel()
+            keep = vals > 0
+            k = per_query(top_k, row)
+            found = top_k_scores(ids[keep], vals[keep], k)
+            results.append(fill_top_k(*found, k, self.matrix.shape[0], mask))
+        return results
+
+    def search(self, pantry_list, top_k=10, allowed=None, nprobe=None):
+        return self.search_batch([pantry_list], top_k=top_k, allowed=allowed, nprobe=nprobe)[0]
+
+    def score(self, pantry_list, ids):
+        """Similarity of one pantry query to the given recipe ids."""
+        return self.score_query(self.encode([pantry_list]), ids)
+
+    def score_query(self, query, ids):
+        ids = np.asarray(ids, dtype=np.int64)
+        return np.asarray((self.matrix[ids] @ query.T).todense(), dtype=np.float32).ravel()
@@ -1,11 +1,40 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_init, post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
-from .models import Profile
+from .models import Profile, PantryItem, Recipe, PrecomputedSuggestion
+from .recommendation_cache import RECOMMENDATION_CACHE, profile_fields_fingerprint
 
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
     if created:
         Profile.objects.create(user=instance)
-    else:
+    elif hasattr(instance, "profile"):
         instance.profile.save()
+
+
+# Cached recommendations depend on the profile, the pantry and the saved
+# recipes (they are excluded from suggestions), so drop them on any change.
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_save, sender=PantryItem)
+@receiver(post_delete, sender=PantryItem)
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def invalidate_recommendations(sender, instance, **kwargs):
+    RECOMMENDATION_CACHE.invalidate_user(instance.user_id)
+
+
+# Precomputed suggestions were built for the profile as it was then (its
+# calorie target included). Every User save also saves the profile (e.g. on
+# login), so only drop them when a field that changes results has changed.
+@receiver(post_init, sender=Profile)
+def remember_profile_fingerprint(sender, instance, **kwargs):
+    instance._loaded_fingerprint = profile_fields_fingerprint(instance)
+
+
+@receiver(post_save, sender=Profile)
+def drop_stale_precomputed_suggestions(sender, instance, created, **kwargs):
+    fingerprint = profile_fields_fingerprint(instance)
+    if not created and fingerprint != getattr(instance, "_loaded_fingerprint", None):
+        PrecomputedSuggestion.objects.filter(user_id=instance.user_id).delete()
+    instance._loaded_fingerprint = fingerprint
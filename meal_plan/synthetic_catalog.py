@@ -0,0 +1,131 @@
+# meal_plan/synthetic_catalog.py
+"""
+Synthetic recipe catalogs for benchmarking without the real dataset.
+
+Recipes are drawn to look like the Food.com data the app is built on:
+ingredients follow a Zipf-like popularity curve (salt and butter are in
+a large share of recipes, most ingredients are rare), ingredient counts
+centre around 8, calories are log-normal around 350 kcal and serving
+sizes mix numbers, ranges and blanks. Generation is deterministic in
+``seed`` and done chunk by chunk, so catalogs of millions of rows are
+written through the streaming builder in bounded memory.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from .recipe_build import build_from_chunks
+
+SYNTHETIC_FILE = "synthetic.json"
+# bump when the generator changes, so cached benchmark catalogs are rebuilt
+GENERATOR_VERSION = 1
+
+# Most common first: popularity falls off with rank
+INGREDIENTS = [
+    "salt", "butter", "sugar", "onion", "water", "egg", "olive oil", "flour", "milk",
+    "garlic", "pepper", "brown sugar", "baking powder", "baking soda", "parmesan cheese",
+    "lemon juice", "sour cream", "vanilla", "black pepper", "cinnamon", "vegetable oil",
+    "cream cheese", "cheddar cheese", "honey", "tomato", "garlic powder", "parsley",
+    "chicken broth", "carrot", "celery", "green onion", "mayonnaise", "heavy cream",
+    "chicken breast", "potato", "soy sauce", "ground beef", "paprika", "oregano",
+    "red onion", "dijon mustard", "cumin", "lime juice", "chili powder", "basil",
+    "mozzarella cheese", "bacon", "walnut", "rice", "cornstarch", "ginger", "thyme",
+    "red bell pepper", "powdered sugar", "zucchini", "spinach", "mushroom", "cilantro",
+    "worcestershire sauce", "white wine", "tomato paste", "chicken", "cayenne pepper",
+    "nutmeg", "pecan", "yogurt", "oats", "banana", "chocolate chips", "raisin",
+    "maple syrup", "balsamic vinegar", "apple", "pasta", "bread", "black beans",
+    "kidney beans", "corn", "peas", "shrimp", "salmon", "pork chop", "ham", "sausage",
+    "tofu", "lentil", "chickpeas", "coconut milk", "peanut butter", "peanut", "almond",
+    "cashew", "sesame oil", "rice vinegar", "fish sauce", "curry powder", "turmeric",
+    "broccoli", "cauliflower", "cabbage", "kale", "sweet potato", "avocado", "cucumber",
+    "lettuce", "feta cheese", "ricotta cheese", "goat cheese", "beef broth", "lamb",
+    "turkey", "duck", "crab", "scallop", "tuna", "cod", "bread crumbs", "tortilla",
+    "quinoa", "couscous", "barley", "buttermilk", "gelatin", "whipping cream",
+    "cream of mushroom soup", "salsa", "jalapeno", "green beans", "asparagus",
+    "eggplant", "leek", "shallot", "rosemary", "sage", "dill", "mint", "bay leaf",
+    "cloves", "cardamom", "allspice", "molasses", "cocoa powder", "coconut",
+    "pineapple", "mango", "strawberry", "blueberry", "orange juice", "cranberry",
+    "pumpkin", "miso", "tempeh", "edamame", "pistachio", "hazelnut", "beer",
+]
+
+_ADJECTIVES = ["Easy", "Classic", "Spicy", "Creamy", "Quick", "Grandma's", "Healthy",
+               "Roasted", "Baked", "Grilled", "Slow Cooker", "Crispy", "Hearty", "Lemon"]
+_DISHES = ["Casserole", "Salad", "Soup", "Stir Fry", "Pasta", "Bake", "Stew", "Curry",
+           "Tacos", "Muffins", "Cookies", "Bread", "Skillet", "Bowl", "Pie", "Wraps"]
+_SERVINGS = np.array(["1", "2", "4", "4", "4", "6", "6", "8", "12", "4-6", None], dtype=object)
+
+
+def ingredient_weights(exponent=0.65):
+    """Zipf-like popularity of INGREDIENTS (sums to 1)."""
+    weights = 1.0 / np.arange(1, len(INGREDIENTS) + 1) ** exponent
+    return weights / weights.sum()
+
+
+def synthetic_chunk(start, stop, seed=0):
+    """Recipes ``start`` .. ``stop - 1`` (raw catalog columns); the same rows for the same seed."""
+    n = stop - start
+    rng = np.random.default_rng([seed, start])
+    names = np.array(INGREDIENTS, dtype=object)
+    counts = np.clip(rng.poisson(7, n) + 2, 2, 25)
+    draws = rng.choice(len(INGREDIENTS), size=(n, 40), p=ingredient_weights())
+    calories = np.round(rng.lognormal(np.log(350), 0.6, n), 1)
+    calories[rng.random(n) < 0.01] = 0.0
+
+    parts, quantities, titles = [], [], []
+    adjectives = rng.integers(len(_ADJECTIVES), size=n)
+    dishes = rng.integers(len(_DISHES), size=n)
+    amounts = rng.integers(1, 5, size=(n, 25))
+    for i in range(n):
+        picked = list(dict.fromkeys(draws[i]))[:counts[i]]
+        parts.append(", ".join(names[picked]))
+        quantities.append(", ".join(str(q) for q in amounts[i, :len(picked)]))
+        # the least common ingredient makes the most distinctive title
+        titles.append(f"{_ADJECTIVES[adjectives[i]]} {names[max(picked)].title()} "
+                      f"{_DISHES[dishes[i]]} #{start + i}")
+
+    ids = np.arange(start, stop)
+    return pd.DataFrame({
+        "Name": titles,
+        "Calories": calories,
+        "RecipeServings": _SERVINGS[rng.integers(len(_SERVINGS), size=n)],
+        "RecipeIngredientParts_cleaned": parts,
+        "RecipeIngredientQuantities_cleaned": quantities,
+        "RecipeInstructions_cleaned": [f"Prepare the ingredients. Cook recipe {i} until done. Serve." for i in ids],
+        "Description": [f"A synthetic recipe ({i})." for i in ids],
+        "Images": [f"['https://example.com/recipes/{i}.jpg']" if i % 3 else "[]" for i in ids],
+    })
+
+
+def synthetic_chunks(n_rows, seed=0, chunk_size=50_000):
+    for start in range(0, n_rows, chunk_size):
+        yield synthetic_chunk(start, min(start + chunk_size, n_rows), seed)
+
+
+def synthetic_pantry(size, rng):
+    """``size`` distinct pantry ingredients, common ones more likely."""
+    size = min(size, len(INGREDIENTS))
+    picked = rng.choice(len(INGREDIENTS), size=size, replace=False, p=ingredient_weights(0.5))
+    return [INGREDIENTS[i] for i in picked]
+
+
+def _spec(n_rows, seed):
+    return {"rows": n_rows, "seed": seed, "generator": GENERATOR_VERSION}
+
+
+def write_synthetic_catalog(path, n_rows, seed=0, chunk_size=50_000, progress=None):
+    """Build a catalog of ``n_rows`` synthetic recipes at ``path``."""
+    return build_from_chunks(
+        lambda: synthetic_chunks(n_rows, seed, chunk_size), path,
+        extra_files={SYNTHETIC_FILE: _spec(n_rows, seed)}, progress=progress,
+    )
+
+
+def is_synthetic_catalog(path, n_rows, seed=0):
+    """Whether ``path`` already holds the catalog write_synthetic_catalog would build."""
+    try:
+        with open(os.path.join(path, SYNTHETIC_FILE)) as fh:
+            return json.load(fh) == _spec(n_rows, seed)
+    except (OSError, ValueError):
+        return False
@@ -1,3 +1,1334 @@
-from django.test import TestCase
+import contextlib
+import itertools
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+import pulp
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+from django.utils import timezone
+
+from . import (
+    ai_recommender, image_cache, image_jobs, instrumentation, plan_solver, recommender_service, warmup,
+)
+from .ai_recommender import rank_pantry
+from .ann_index import ANN_DIR, IVFIndex, build_ann_index, project
+from .catalog_store import SegmentedCatalog, append_segment, compact, load_vectorizer
+from .derived_columns import MEAL_TYPES, DerivedColumns, classify_meal_by_calories, parse_servings
+from .ingredient_index import INGREDIENT_COLUMN
+from .lsa_index import LSA_DIR, LSARetriever, build_lsa_index
+from .management.commands.benchmark_ann import recall as ann_recall
+from .management.commands.precompute_suggestions import Command as PrecomputeCommand
+from .models import ImageJob, ImageWorker, PantryItem, PrecomputedSuggestion, Recipe
+from .precompute import precomputed_suggestions, suggestion_fingerprint
+from .plan_solver import MEAL_SLOTS, solve_cbc, solve_meal_plan, solve_native
+from .recipe_build import build_recipe_index, clean_chunk, fit_vectorizer
+from .recipe_catalog import BULKY_COLUMNS, RecipeCatalog
+from .recommendation_cache import RECOMMENDATION_CACHE, RecommendationCache, recommendation_key
+from .recommender_service import MicroBatcher, RecommenderServer, _Pending, remote_rank
+from .retrieval import SparseRetriever, recipe_text, top_k_scores
+from .synthetic_catalog import (
+    INGREDIENTS, is_synthetic_catalog, synthetic_chunk, synthetic_chunks, write_synthetic_catalog,
+)
+
+
+class CatalogTestCase(TestCase):
+    """Runs against a small synthetic catalog, written once per class and pinned for every test."""
+    n_rows = 600
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.catalog_path = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.catalog_path, True)
+        write_synthetic_catalog(cls.catalog_path, cls.n_rows, seed=1, chunk_size=250)
+        cls.catalog = ai_recommender.load_catalog(path=cls.catalog_path)
+
+    def setUp(self):
+        RECOMMENDATION_CACHE.clear()
+        self.addCleanup(RECOMMENDATION_CACHE.clear)
+        self.enterContext(ai_recommender.pinned_catalog(self.catalog))
+
+    def make_user(self, username, pantry=("salt", "butter", "egg"), **profile):
+        user = User.objects.create_user(username, password="x")
+        for field, value in profile.items():
+            setattr(user.profile, field, value)
+        user.profile.save()
+        for name in pantry:
+            PantryItem.objects.create(user=user, ingredient_name=name, qty=1, unit="g", category="Others")
+        return User.objects.get(pk=user.pk)
+
+    def ingredient_values(self):
+        return self.catalog.column(INGREDIENT_COLUMN).to_numpy()
+
+
+# ------------------- Ingredient index -------------------
+
+def baseline_pantry_matches(ingredient_values, pantry_list, max_extra=3):
+    """The per-row loop filter_recipes_by_pantry_ingredients used to run."""
+    pantry_set = set(p.lower() for p in pantry_list)
+    matches = []
+    for recipe_id, recipe_ings in enumerate(ingredient_values):
+        if not isinstance(recipe_ings, str):
+            continue
+        recipe_set = set(i.strip().lower() for i in recipe_ings.split(",") if i.strip())
+        if pantry_set.issubset(recipe_set) and len(recipe_set - pantry_set) <= max_extra:
+            matches.append(recipe_id)
+    return matches
+
+
+class IngredientIndexTests(CatalogTestCase):
+
+    def test_match_agrees_with_the_row_loop(self):
+        values = self.ingredient_values()
+        rng = np.random.default_rng(0)
+        pantries = [["salt"], ["Salt", "BUTTER", "sugar", "egg", "onion"], ["saffron"]]
+        # pantries cut from real recipes, so some recipes match with few extras
+        for recipe_id in rng.integers(0, len(values), 8):
+            ingredients = [i.strip() for i in values[recipe_id].split(",")]
+            pantries.append(list(rng.choice(ingredients, max(1, len(ingredients) - 2), replace=False)))
+        matched = 0
+        for pantry in pantries:
+            for max_extra in (0, 3):
+                expected = baseline_pantry_matches(values, pantry, max_extra)
+                self.assertEqual(self.catalog.ingredients.match(pantry, max_extra).tolist(), expected, pantry)
+                matched += len(expected)
+        self.assertGreater(matched, 0)
+
+    def test_filter_keeps_the_frame_rows_that_match(self):
+        frame = self.catalog.rows(np.arange(len(self.catalog)))
+        pantry = ["salt"]
+        expected = frame.iloc[baseline_pantry_matches(frame[INGREDIENT_COLUMN], pantry)]
+        self.assertGreater(len(expected), 2)
+        saved = expected["Name"].iloc[:2].str.upper().tolist()
+        filtered = ai_recommender.filter_recipes_by_pantry_ingredients(frame, pantry, saved_recipe_names=saved)
+        self.assertEqual(filtered["recipe_id"].tolist(), expected["recipe_id"].iloc[2:].tolist())
+
+
+# ------------------- Retrieval -------------------
+
+class RetrievalTests(CatalogTestCase):
+
+    def full_ranking(self, pantry, allowed=None):
+        """Every recipe by cosine similarity, ties by id, the way the original argsort ranked them."""
+        retriever = self.catalog.retriever
+        sims = np.asarray((self.catalog.matrix @ retriever.encode([pantry]).T).todense()).ravel()
+        order = np.lexsort((np.arange(len(sims)), -sims))
+        if allowed is not None:
+            order = order[allowed[order]]
+        return order, sims
+
+    def test_top_k_matches_the_full_ranking(self):
+        allowed = np.random.default_rng(3).random(len(self.catalog)) < 0.7
+        for pantry in (["salt", "butter"], ["chicken breast", "rice", "soy sauce"], ["saffron"]):
+            for mask in (None, allowed):
+                order, sims = self.full_ranking(pantry, mask)
+                ids, scores = self.catalog.retriever.search(pantry, top_k=15, allowed=mask)
+                self.assertEqual(ids.tolist(), order[:15].tolist(), pantry)
+                np.testing.assert_allclose(scores, sims[order[:15]], atol=1e-6)
+
+    def test_batch_equals_single_queries(self):
+        pantries = [["salt"], ["egg", "milk", "flour"], ["tofu", "miso"]]
+        for top_k in (5, 20):
+            batch = self.catalog.retriever.search_batch(pantries, top_k=top_k)
+            for pantry, (ids, scores) in zip(pantries, batch):
+                single_ids, single_scores = self.catalog.retriever.search(pantry, top_k=top_k)
+                self.assertEqual(ids.tolist(), single_ids.tolist())
+                np.testing.assert_allclose(scores, single_scores)
+
+    def test_few_matches_are_filled_up_to_top_k(self):
+        allowed = np.zeros(len(self.catalog), dtype=bool)
+        allowed[[3, 40, 41, 500]] = True
+        ids, scores = self.catalog.retriever.search(["saffron"], top_k=10)
+        self.assertEqual(ids.tolist(), list(range(10)))
+        self.assertFalse(scores.any())
+        ids, _ = self.catalog.retriever.search(["salt"], top_k=10, allowed=allowed)
+        self.assertEqual(sorted(ids.tolist()), [3, 40, 41, 500])
+
+    def test_ties_at_the_cut_go_to_the_lowest_ids(self):
+        ids = np.array([9, 4, 7, 1, 8], dtype=np.int64)
+        scores = np.array([0.5, 0.2, 0.5, 0.2, 0.2], dtype=np.float32)
+        self.assertEqual(top_k_scores(ids, scores, 3)[0].tolist(), [7, 9, 1])
+        self.assertEqual(len(top_k_scores(ids, scores, 0)[0]), 0)
+
+
+
+# ------------------- IVF index -------------------
+
+class AnnIndexTests(CatalogTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        path = os.path.join(cls.catalog_path, ANN_DIR)
+        build_ann_index(path, cls.catalog.matrix, n_components=16, n_lists=12, sample_size=400)
+        cls.ann = IVFIndex.open(path, np.load)
+
+    def ivf_retriever(self, nprobe):
+        exact = self.catalog.retriever
+        return SparseRetriever(exact.vectorizer, exact.matrix, exact.matrix_t, ann=self.ann, nprobe=nprobe)
+
+    def pantries(self, count=40):
+        values = self.ingredient_values()
+        rng = np.random.default_rng(5)
+        return [list(rng.choice([i.strip() for i in values[recipe_id].split(",")], 2, replace=False))
+                for recipe_id in rng.integers(0, len(values), count)]
+
+    def test_probing_every_list_is_the_exact_search(self):
+        allowed = np.random.default_rng(3).random(len(self.catalog)) < 0.7
+        retriever = self.ivf_retriever(self.ann.n_lists)
+        for pantry in self.pantries(10) + [["saffron"]]:
+            for mask in (None, allowed):
+                ids, scores = retriever.search(pantry, top_k=15, allowed=mask)
+                exact_ids, exact_scores = self.catalog.retriever.search(pantry, top_k=15, allowed=mask)
+                self.assertEqual(ids.tolist(), exact_ids.tolist(), pantry)
+                np.testing.assert_allclose(scores, exact_scores, atol=1e-6)
+
+    def test_recall_against_the_exact_search(self):
+        pantries = self.pantries()
+        exact = self.catalog.retriever.search_batch(pantries, top_k=10)
+        recalls = []
+        for nprobe in (1, 3, 6):
+            found = self.ivf_retriever(nprobe).search_batch(pantries, top_k=10)
+            hits = total = 0
+            for (ids, scores), (exact_ids, exact_scores) in zip(found, exact):
+                # zero-score fillers are arbitrary, only real matches count
+                relevant = set(exact_ids[exact_scores > 0].tolist())
+                hits += len(relevant & set(ids.tolist()))
+                total += len(relevant)
+                self.assertEqual(len(ids), 10)
+                self.assertTrue(np.all(np.diff(scores) <= 0))
+            recalls.append(hits / total)
+        # more lists probed, more of the exact top-k found
+        self.assertEqual(recalls, sorted(recalls))
+        self.assertGreater(recalls[-1], 0.8)
+
+    def test_benchmark_recall_ignores_zero_score_fillers(self):
+        exact = [(np.array([1, 2, 3]), np.array([0.9, 0.5, 0.0])),
+                 (np.array([4, 5, 6]), np.array([0.0, 0.0, 0.0]))]      # no match at all: skipped
+        approx = [(np.array([1, 7, 8]), np.array([0.9, 0.0, 0.0])),
+                  (np.array([9, 10, 11]), np.array([0.0, 0.0, 0.0]))]
+        self.assertEqual(ann_recall(approx, exact), 0.5)
+        self.assertEqual(ann_recall(exact, exact), 1.0)
+
+# ------------------- LSA retrieval -------------------
+
+class LSAIndexTests(CatalogTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        build_lsa_index(os.path.join(cls.catalog_path, LSA_DIR), cls.catalog.matrix, n_components=24)
+        with override_settings(RECIPE_RETRIEVAL="lsa"):
+            cls.lsa_catalog = ai_recommender.load_catalog(path=cls.catalog_path)
+        cls.lsa = cls.lsa_catalog.retriever
+
+    def test_commands_default_to_the_configured_catalog(self):
+        path = os.path.join(tempfile.mkdtemp(), "catalog")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), True)
+        shutil.copytree(self.catalog_path, path, ignore=shutil.ignore_patterns(LSA_DIR))
+        report = StringIO()
+        with override_settings(RECIPE_CATALOG_DIR=path):
+            call_command("build_lsa_index", components=8, stdout=StringIO())
+            call_command("evaluate_lsa", queries=5, top_k="5", stdout=report)
+        self.assertEqual(RecipeCatalog.open(path).load_lsa().meta["n_components"], 8)
+        self.assertIn(f"{len(self.catalog)} recipes", report.getvalue())
+        self.assertIn("-> 8 LSA dims", report.getvalue())
+
+    def lsa_scores(self, pantry):
+        query = project(self.lsa.encode([pantry]), self.lsa.components)
+        return (query @ self.lsa.vectors.T).ravel()
+
+    def test_catalog_searches_the_lsa_vectors(self):
+        self.assertIsInstance(self.lsa, LSARetriever)
+        self.assertEqual(self.lsa.vectors.shape, (len(self.catalog), 24))
+        # strict-match scoring of known ids stays exact TF-IDF
+        ids = np.arange(0, len(self.catalog), 5)
+        np.testing.assert_allclose(self.lsa.score(["salt", "egg"], ids), self.catalog.retriever.score(["salt", "egg"], ids))
+
+    def test_search_is_the_lsa_ranking_within_the_diet_mask(self):
+        allowed = self.lsa_catalog.dietary.allowed_mask("Vegetarian", "peanut")
+        self.assertLess(allowed.sum(), len(self.catalog))
+        for pantry in (["salt", "butter"], ["chicken breast", "rice", "soy sauce"], ["tofu"]):
+            for mask in (None, allowed):
+                ids, scores = self.lsa.search(pantry, top_k=15, allowed=mask)
+                self.assertEqual(len(set(ids.tolist())), 15)
+                self.assertTrue(((ids >= 0) & (ids < len(self.catalog))).all())
+                self.assertTrue(np.all(np.diff(scores) <= 0), pantry)
+                if mask is not None:
+                    self.assertTrue(mask[ids].all())
+                expected = self.lsa_scores(pantry)
+                np.testing.assert_allclose(scores, expected[ids], atol=1e-5)
+                candidates = np.flatnonzero(mask) if mask is not None else np.arange(len(expected))
+                # nothing allowed left out scores better than the 15th
+                rest = np.setdiff1d(candidates, ids)
+                self.assertLessEqual(expected[rest].max(), scores[-1] + 1e-6)
+
+    def test_batches_and_small_masks(self):
+        pantries = [["salt"], ["egg", "milk", "flour"], ["tofu", "miso"]]
+        batch = self.lsa.search_batch(pantries, top_k=[5, 10, 20])
+        for pantry, top_k, (ids, scores) in zip(pantries, [5, 10, 20], batch):
+            single_ids, single_scores = self.lsa.search(pantry, top_k=top_k)
+            self.assertEqual(ids.tolist(), single_ids.tolist())
+            np.testing.assert_allclose(scores, single_scores, atol=1e-6)
+        allowed = np.zeros(len(self.catalog), dtype=bool)
+        allowed[[3, 40, 41, 500]] = True
+        ids, _ = self.lsa.search(["salt"], top_k=10, allowed=allowed)
+        self.assertEqual(sorted(ids.tolist()), [3, 40, 41, 500])
+
+
+# ------------------- Dietary bitmasks -------------------
+
+def baseline_allowed(ingredient_values, dietary_pref, allergy_info):
+    """The per-request string checks personalize_results used to run."""
+    keep = np.ones(len(ingredient_values), dtype=bool)
+    texts = [(v or "").lower() for v in ingredient_values]
+    if allergy_info:
+        allergies = [a.strip().lower() for a in allergy_info.split(",")]
+        keep &= [not any(a in text for a in allergies) for text in texts]
+    avoid_list = ai_recommender.DIETARY_RESTRICTIONS.get((dietary_pref or "").strip().lower(), [])
+    if avoid_list:
+        pattern = re.compile("|".join(f"\\b{a}\\b" for a in avoid_list))
+        keep &= [not pattern.search(text) for text in texts]
+    return keep
+
+
+class DietaryIndexTests(CatalogTestCase):
+
+    def test_masks_agree_with_the_string_checks(self):
+        values = self.ingredient_values()
+        for dietary_pref, allergy_info in (("Vegan", None), ("Keto", "peanut"), ("Gluten-Free", "shrimp, Cheese"),
+                                           ("low-sodium", None), ("None", "oil"), ("Vegetarian", "egg,milk")):
+            expected = baseline_allowed(values, dietary_pref, allergy_info)
+            self.assertLess(expected.sum(), len(values), dietary_pref)
+            mask = self.catalog.dietary.allowed_mask(dietary_pref, allergy_info)
+            np.testing.assert_array_equal(mask, expected, err_msg=f"{dietary_pref} / {allergy_info}")
+            ids = np.arange(0, len(values), 7)
+            np.testing.assert_array_equal(self.catalog.dietary.allowed(ids, dietary_pref, allergy_info), expected[ids])
+
+    def test_nothing_excluded_is_no_mask(self):
+        self.assertIsNone(self.catalog.dietary.allowed_mask("None", ""))
+        self.assertIsNone(self.catalog.dietary.allowed_mask("", None))
+
+
+
+# ------------------- Catalog segments -------------------
+
+class CatalogStoreTests(CatalogTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), "catalog")
+        self.addCleanup(shutil.rmtree, os.path.dirname(self.path), True)
+        shutil.copytree(self.catalog_path, self.path)
+
+    def append(self, start, stop):
+        """What `manage.py add_recipes` does with a file of new recipes."""
+        df = synthetic_chunk(start, stop, seed=2)
+        matrix = load_vectorizer(self.path).transform(df[INGREDIENT_COLUMN].map(recipe_text))
+        df, matrix = ai_recommender.prepare_recipe_frame(df, matrix)
+        return append_segment(self.path, df, matrix, restrictions=ai_recommender.DIETARY_RESTRICTIONS)
+
+    def snapshot(self, catalog):
+        frame = catalog.rows(np.arange(len(catalog)))
+        allowed = catalog.dietary.allowed_mask("Vegan", "walnut")
+        return {
+            "names": frame["Name"].tolist(),
+            "meal_types": frame["MealType"].tolist(),
+            "search": [catalog.retriever.search(p, top_k=25, allowed=allowed)[0].tolist()
+                       for p in (["salt", "butter"], ["tofu", "rice"])],
+            "match": catalog.ingredients.match(["salt", "butter", "sugar", "flour"]).tolist(),
+            "allowed": allowed.tolist(),
+            "derived_meal_types": catalog.derived.meal_types(frame["recipe_id"]).tolist(),
+            "servings": catalog.derived.serving_size_mask(4, 1).tolist(),
+            "dinner": catalog.derived.meal_type_mask("Dinner").tolist(),
+        }
+
+    def test_deltas_keep_ids_and_compaction_changes_nothing(self):
+        self.append(10_000, 10_150)
+        version = self.append(20_000, 20_100)
+        segmented = ai_recommender.load_catalog(path=self.path)
+        self.assertIsInstance(segmented, SegmentedCatalog)
+        self.assertEqual((len(segmented), segmented.version), (self.n_rows + 250, version))
+        names = segmented.rows([0, self.n_rows])["Name"].tolist()
+        self.assertEqual(names[0], self.catalog.rows([0])["Name"].iloc[0])
+        self.assertTrue(names[1].endswith("#10000"))
+        before = self.snapshot(segmented)
+        self.assertTrue(any(i >= self.n_rows for i in before["search"][0] + before["match"]))
+
+        self.assertGreater(compact(self.path, restrictions=ai_recommender.DIETARY_RESTRICTIONS), version)
+        merged = ai_recommender.load_catalog(path=self.path)
+        self.assertNotIsInstance(merged, SegmentedCatalog)
+        self.assertEqual(self.snapshot(merged), before)
+        self.assertIsNone(compact(self.path))
+
+    def test_compaction_rebuilds_the_search_indexes(self):
+        base = RecipeCatalog.open(self.path)
+        with contextlib.redirect_stdout(StringIO()) as out:
+            self.assertIsNone(base.load_ann(nprobe=2))
+        self.assertIn("no ANN index", out.getvalue())
+        build_ann_index(os.path.join(self.path, ANN_DIR), base.matrix, n_components=16, n_lists=8, sample_size=400)
+        build_lsa_index(os.path.join(self.path, LSA_DIR), base.matrix, n_components=24)
+        self.append(10_000, 10_150)
+        compact(self.path, restrictions=ai_recommender.DIETARY_RESTRICTIONS)
+
+        merged = RecipeCatalog.open(self.path)
+        ann, lsa = merged.load_ann(nprobe=2), merged.load_lsa()
+        self.assertEqual((ann.meta["n_rows"], ann.meta["n_components"]), (self.n_rows + 150, 16))
+        self.assertEqual((lsa.meta["n_rows"], lsa.meta["n_components"]), (self.n_rows + 150, 24))
+
+
+# ------------------- Streaming build -------------------
+
+class StreamingBuildTests(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.tmp = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.tmp, True)
+        cls.csv_path = os.path.join(cls.tmp, "recipes.csv")
+        df = synthetic_chunk(0, 600, seed=1)
+        df.loc[[5, 300], "RecipeInstructions_cleaned"] = "Find this recipe on Food.com"
+        df.to_csv(cls.csv_path, index=False)
+        cls.texts = clean_chunk(df)[INGREDIENT_COLUMN].map(recipe_text).tolist()
+
+    def test_streamed_vectorizer_equals_a_full_fit(self):
+        self.assertEqual(len(self.texts), 598)
+        for min_df in (1, 5):
+            streamed, n_docs = fit_vectorizer(self.csv_path, chunk_size=250, min_df=min_df)
+            full = TfidfVectorizer(dtype=np.float32, min_df=min_df).fit(self.texts)
+            self.assertEqual(n_docs, len(self.texts))
+            self.assertEqual(streamed.vocabulary_, full.vocabulary_)
+            np.testing.assert_allclose(streamed.idf_, full.idf_, rtol=1e-6)
+            np.testing.assert_allclose(streamed.transform(self.texts).toarray(),
+                                       full.transform(self.texts).toarray(), atol=1e-6)
+
+    def test_catalog_rows_are_the_full_fit_rows(self):
+        output = os.path.join(self.tmp, "catalog")
+        self.assertEqual(build_recipe_index(self.csv_path, output, chunk_size=250), len(self.texts))
+        with override_settings(RECIPE_CATALOG_DIR=output):
+            catalog = ai_recommender.load_catalog()
+        expected = normalize(TfidfVectorizer(dtype=np.float32).fit_transform(self.texts), norm="l2")
+        self.assertEqual(catalog.matrix.shape, expected.shape)
+        np.testing.assert_allclose(catalog.matrix.toarray(), expected.toarray(), atol=1e-6)
+        self.assertTrue(catalog.rows([5])["Name"].iloc[0].endswith("#6"))
+
+# ------------------- Derived columns -------------------
+
+class DerivedColumnsTests(CatalogTestCase):
+
+    def test_columns_and_masks_match_the_row_rules(self):
+        ids = np.arange(len(self.catalog))
+        derived = self.catalog.derived
+        calories = self.catalog.take("Calories", ids)
+        meal_types = np.array([classify_meal_by_calories(c) for c in calories], dtype=object)
+        servings = np.array([parse_servings(v) for v in self.catalog.take("RecipeServings", ids)], dtype=float)
+
+        self.assertEqual(derived.meal_types(ids).tolist(), meal_types.tolist())
+        np.testing.assert_array_equal(derived.servings_of(ids), servings)
+        for meal_type in MEAL_TYPES:
+            np.testing.assert_array_equal(derived.meal_type_mask(meal_type), meal_types == meal_type)
+        for size, tolerance in ((2, 0), (4, 1), (6, 4)):
+            expected = (servings >= size - tolerance) & (servings <= size + tolerance)
+            np.testing.assert_array_equal(derived.serving_size_mask(size, tolerance), expected)
+        self.assertIs(derived.serving_size_mask(4, 1), derived.serving_size_mask(4, 1))
+
+    def test_meal_type_filter_comes_before_the_top_k_cut(self):
+        user = self.make_user("fay", pantry=("salt",))
+        items = list(user.pantry_items.all())
+        overall = ai_recommender.generate_ai_meal(user, items, top_k=2)
+        gained = 0
+        for meal_type in ("Breakfast", "Lunch", "Dinner"):
+            recs = ai_recommender.generate_ai_meal(user, items, top_k=2, meal_type=meal_type)
+            self.assertLessEqual(len(recs), 2)
+            self.assertTrue((recs["MealType"] == meal_type).all())
+            # what filtering the overall top 2 afterwards gave, then more of that type
+            posthoc = overall.loc[overall["MealType"] == meal_type, "Name"].tolist()
+            self.assertEqual(recs["Name"].tolist()[:len(posthoc)], posthoc)
+            gained += len(recs) - len(posthoc)
+        self.assertGreater(gained, 0)
+
+
+
+# ------------------- Compact frame -------------------
+
+class CompactFrameTests(CatalogTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.source = pd.concat([clean_chunk(c) for c in synthetic_chunks(cls.n_rows, seed=1, chunk_size=250)],
+                               ignore_index=True)
+
+    def assert_values_equal(self, values, expected, name):
+        # missing values read back as None
+        values, expected = ([None if pd.isna(v) else v for v in column] for column in (values, expected))
+        self.assertEqual(values, expected, name)
+
+    def test_compact_frame_round_trips_everything_but_the_bulky_text(self):
+        frame = self.catalog.compact_frame()
+        self.assertIs(self.catalog.compact_frame(), frame)
+        self.assertFalse(set(BULKY_COLUMNS) & set(frame.columns))
+        self.assertEqual(frame["recipe_id"].tolist(), list(range(self.n_rows)))
+        self.assertIsInstance(frame["RecipeServings"].dtype, pd.CategoricalDtype)
+        self.assertIsInstance(frame["MealType"].dtype, pd.CategoricalDtype)
+        self.assertEqual(frame["Calories"].dtype, np.float64)
+        self.assertEqual(frame["Servings"].dtype, np.float32)
+        for name in frame.columns.drop("recipe_id"):
+            expected = self.source[name]
+            if name == "Servings":
+                expected = expected.astype(np.float32)
+            self.assert_values_equal(frame[name], expected, name)
+
+    def test_details_fetch_the_bulky_text_per_recipe(self):
+        for recipe_id in (0, 249, 250, 599):
+            self.assertEqual(self.catalog.details(recipe_id),
+                             {name: self.source[name].iloc[recipe_id] for name in BULKY_COLUMNS})
+
+    def test_legacy_pickle_frame_is_compacted_the_same_way(self):
+        legacy = RecipeCatalog.from_frame(load_vectorizer(self.catalog_path), self.catalog.matrix, self.source)
+        frame, expected = legacy.compact_frame(), self.catalog.compact_frame()
+        self.assertEqual(set(frame.columns), set(expected.columns))
+        for name in expected.columns:
+            self.assertEqual(type(frame[name].dtype), type(expected[name].dtype), name)
+            self.assert_values_equal(frame[name], expected[name], name)
+        self.assertEqual(legacy.details(42), self.catalog.details(42))
+
+    def test_segmented_catalog_keeps_categories_and_details(self):
+        path = os.path.join(tempfile.mkdtemp(), "catalog")
+        self.addCleanup(shutil.rmtree, os.path.dirname(path), True)
+        shutil.copytree(self.catalog_path, path)
+        df = clean_chunk(synthetic_chunk(10_000, 10_050, seed=2))
+        matrix = load_vectorizer(path).transform(df[INGREDIENT_COLUMN].map(recipe_text))
+        append_segment(path, df, matrix, restrictions=ai_recommender.DIETARY_RESTRICTIONS)
+        segmented = ai_recommender.load_catalog(path=path)
+
+        frame = segmented.compact_frame()
+        self.assertEqual(len(frame), self.n_rows + 50)
+        self.assertIsInstance(frame["MealType"].dtype, pd.CategoricalDtype)
+        self.assert_values_equal(frame["Name"], pd.concat([self.source["Name"], df["Name"]]), "Name")
+        self.assertEqual(segmented.details(self.n_rows + 3), {name: df[name].iloc[3] for name in BULKY_COLUMNS})
+        self.assertEqual(segmented.details(3), self.catalog.details(3))
+
+
+# ------------------- Meal-plan solver -------------------
+
+def brute_force_plan(calories, meal_types, target, count, min_per_type, penalty=None):
+    """Best objective over every combination, the way the ILP defines it (None if infeasible)."""
+    penalty = np.zeros(len(calories)) if penalty is None else penalty
+    best = None
+    for combo in itertools.combinations(range(len(calories)), count):
+        types = [meal_types[i] for i in combo]
+        if any(types.count(t) < n for t, n in min_per_type.items()):
+            continue
+        cost = abs(sum(calories[i] for i in combo) - target) + sum(penalty[i] for i in combo)
+        best = cost if best is None else min(best, cost)
+    return best
+
+
+def plan_cost(chosen, calories, target, penalty=None):
+    penalty = np.zeros(len(calories)) if penalty is None else penalty
+    return abs(calories[chosen].sum() - target) + penalty[chosen].sum()
+
+
+class PlanSolverTests(TestCase):
+
+    def instance(self, seed, n=14):
+        rng = np.random.default_rng(seed)
+        calories = rng.integers(80, 900, n).astype(np.float64)
+        # every type at least n // 4 times, so the minimums below can be met
+        meal_types = rng.permutation(np.resize(np.array(list(MEAL_SLOTS) + ["Snack"], dtype=object), n))
+        return calories, meal_types
+
+    def assert_valid(self, chosen, meal_types, count, min_per_type):
+        self.assertEqual(len(chosen), count)
+        self.assertEqual(len(set(chosen)), count)
+        for meal_type, minimum in min_per_type.items():
+            self.assertGreaterEqual(sum(meal_types[i] == meal_type for i in chosen), minimum)
+
+    def test_native_and_cbc_match_brute_force(self):
+        minimums = {meal: 1 for meal in MEAL_SLOTS}
+        for seed in range(5):
+            calories, meal_types = self.instance(seed)
+            target = 1500 + 100 * seed
+            best = brute_force_plan(calories, meal_types, target, 3, minimums)
+
+            native = solve_native(calories, meal_types, target, 3, minimums)
+            cbc = solve_cbc(calories, meal_types, target, 3, minimums, time_limit=30)
+            for chosen in (native, cbc):
+                self.assert_valid(chosen, meal_types, 3, minimums)
+                self.assertAlmostEqual(plan_cost(chosen, calories, target), best, places=4)
+
+    def test_penalty_and_multi_day_counts(self):
+        minimums = {meal: 2 for meal in MEAL_SLOTS}
+        calories, meal_types = self.instance(7, n=12)
+        penalty = np.random.default_rng(7).integers(0, 60, len(calories)).astype(np.float64)
+        best = brute_force_plan(calories, meal_types, 3600, 6, minimums, penalty)
+
+        for method in ("native", "cbc"):
+            chosen = solve_meal_plan(calories, meal_types, 3600, 6, minimums, method=method,
+                                     time_limit=30, penalty=penalty)
+            self.assert_valid(chosen, meal_types, 6, minimums)
+            self.assertAlmostEqual(plan_cost(chosen, calories, 3600, penalty), best, places=4)
+
+    def test_cbc_model_template_is_reused(self):
+        minimums = {meal: 1 for meal in MEAL_SLOTS}
+        with mock.patch.dict(plan_solver._MODELS, clear=True):
+            # another instance of the same padded shape leaves its coefficients in the template
+            solve_cbc(*self.instance(11, n=30), 2400, 3, minimums, time_limit=30)
+            calories, meal_types = self.instance(12, n=20)
+            with mock.patch.object(plan_solver, "PlanModel", wraps=plan_solver.PlanModel) as built:
+                reused = solve_cbc(calories, meal_types, 1800, 3, minimums, time_limit=30)
+            built.assert_not_called()
+            plan_solver._MODELS.clear()
+            fresh = solve_cbc(calories, meal_types, 1800, 3, minimums, time_limit=30)
+
+        best = brute_force_plan(calories, meal_types, 1800, 3, minimums)
+        for chosen in (reused, fresh):
+            self.assert_valid(chosen, meal_types, 3, minimums)
+            self.assertAlmostEqual(plan_cost(chosen, calories, 1800), best, places=4)
+
+    def test_concurrent_cbc_solves_do_not_wait_for_each_other(self):
+        minimums = {meal: 1 for meal in MEAL_SLOTS}
+        instances = [(*self.instance(seed, n=20), 1600 + 200 * seed) for seed in (21, 22)]
+        # both CBC runs must be in flight at once to get past the barrier
+        barrier = threading.Barrier(len(instances), timeout=20)
+        real_solve = pulp.LpProblem.solve
+
+        def solve_together(prob, *args, **kwargs):
+            barrier.wait()
+            return real_solve(prob, *args, **kwargs)
+
+        results = {}
+
+        def run(i, calories, meal_types, target):
+            results[i] = solve_cbc(calories, meal_types, target, 3, minimums, time_limit=30)
+
+        with mock.patch.dict(plan_solver._MODELS, clear=True):
+            with mock.patch.object(pulp.LpProblem, "solve", solve_together):
+                threads = [threading.Thread(target=run, args=(i, *inst)) for i, inst in enumerate(instances)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            (idle,) = plan_solver._MODELS.values()
+            self.assertEqual(len(idle), 2)
+            # afterwards both templates are reused, and give the same plans
+            with mock.patch.object(plan_solver, "PlanModel", wraps=plan_solver.PlanModel) as built:
+                again = [solve_cbc(calories, meal_types, target, 3, minimums, time_limit=30)
+                         for calories, meal_types, target in instances]
+            built.assert_not_called()
+
+        for i, (calories, meal_types, target) in enumerate(instances):
+            best = brute_force_plan(calories, meal_types, target, 3, minimums)
+            for chosen in (results[i], again[i]):
+                self.assert_valid(chosen, meal_types, 3, minimums)
+                self.assertAlmostEqual(plan_cost(chosen, calories, target), best, places=4)
+
+    def test_infeasible_plan_is_none(self):
+        calories = np.array([300.0, 500.0, 700.0])
+        meal_types = np.array(["Breakfast", "Breakfast", "Lunch"], dtype=object)
+        minimums = {meal: 1 for meal in MEAL_SLOTS}
+        self.assertIsNone(solve_native(calories, meal_types, 1500, 3, minimums))
+        self.assertIsNone(solve_cbc(calories, meal_types, 1500, 3, minimums, time_limit=30))
+
+class FrameCatalog:
+    """The catalog reads CandidatePool makes, over a small DataFrame."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.derived = DerivedColumns.compute(self)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def has_column(self, name):
+        return name in self.frame.columns
+
+    def take(self, name, ids):
+        return self.frame[name].to_numpy()[ids]
+
+    def rows(self, ids, columns=None, extra=None):
+        return self.frame.iloc[ids].reset_index(drop=True).assign(recipe_id=ids, **(extra or {}))
+
+
+def plan_pool(meals):
+    """A CandidatePool (what plan_candidates returns) from (name, calories, ingredients); meal types follow calories."""
+    frame = pd.DataFrame([
+        {"Name": name, "Calories": float(calories), INGREDIENT_COLUMN: ingredients}
+        for name, calories, ingredients in meals
+    ])
+    return ai_recommender.CandidatePool(FrameCatalog(frame), np.arange(len(frame)), np.zeros(len(frame)))
+
+
+class WeeklyPlanTests(TestCase):
+    target = 1500
+
+    def weekly_plan(self, pool, days, **options):
+        with mock.patch.object(ai_recommender, "plan_candidates", return_value=pool), \
+                mock.patch.object(ai_recommender, "daily_calorie_target", return_value=self.target):
+            return ai_recommender.generate_weekly_plan(None, [PantryItem(ingredient_name="salt")], days, **options)
+
+    def random_pool(self, seed, per_type=5):
+        rng = np.random.default_rng(seed)
+        meals = []
+        for meal_type, low, high in (("Breakfast", 250, 400), ("Lunch", 400, 700), ("Dinner", 700, 900)):
+            for i in range(per_type):
+                ingredients = ", ".join(rng.choice(INGREDIENTS, 4, replace=False))
+                meals.append((f"{meal_type} {i}", rng.uniform(low, high), ingredients))
+        return plan_pool(meals)
+
+    def test_recipes_do_not_repeat_within_the_window(self):
+        plan = self.weekly_plan(self.random_pool(0), 7, no_repeat_days=2, reuse_weight=0)
+        self.assertEqual(plan["day"].tolist(), [day for day in range(1, 8) for _ in range(3)])
+        for day, meals in plan.groupby("day"):
+            self.assertEqual(sorted(meals["MealType"]), sorted(MEAL_SLOTS))
+            self.assertAlmostEqual(meals["DayTotalCalories"].iloc[0], meals["Calories"].sum())
+        for name, meals in plan.groupby("Name"):
+            self.assertTrue((np.diff(meals["day"].to_numpy()) > 2).all(), name)
+
+    def test_new_ingredients_cost_reuse_weight(self):
+        pool = plan_pool([
+            ("Saffron Porridge", 300, "saffron, oats, cardamom"),    # hits the target exactly
+            ("Salted Eggs", 330, "salt, egg"),                      # 30 kcal over, nothing to buy
+            ("Lunch", 500, "salt"),
+            ("Dinner", 700, "salt"),
+        ])
+        chosen = {weight: set(self.weekly_plan(pool, 1, reuse_weight=weight)["Name"]) for weight in (0, 25)}
+        self.assertIn("Saffron Porridge", chosen[0])
+        self.assertIn("Salted Eggs", chosen[25])
+        # "egg" is new too, but only one ingredient against three
+        self.assertNotIn("Saffron Porridge", chosen[25])
+
+    def test_repeat_window_is_relaxed_when_the_pool_runs_dry(self):
+        pool = plan_pool([("Toast", 300, "bread"), ("Soup", 500, "onion"), ("Stew", 700, "beef")])
+        plan = self.weekly_plan(pool, 3, no_repeat_days=3)
+        self.assertEqual(plan["day"].tolist(), [1, 1, 1, 2, 2, 2, 3, 3, 3])
+        self.assertEqual(plan.groupby("Name")["day"].count().tolist(), [3, 3, 3])
+
+    def test_cbc_days_are_warm_started_and_agree_with_native(self):
+        pool = self.random_pool(1)
+        with override_settings(MEAL_PLAN_SOLVER="cbc"), \
+                mock.patch.object(ai_recommender, "solve_meal_plan", wraps=solve_meal_plan) as solve:
+            cbc = self.weekly_plan(pool, 4, no_repeat_days=1, reuse_weight=0)
+        with override_settings(MEAL_PLAN_SOLVER="native"):
+            native = self.weekly_plan(pool, 4, no_repeat_days=1, reuse_weight=0)
+        self.assertEqual(cbc["Name"].tolist(), native["Name"].tolist())
+
+        starts = [call.kwargs["warm_start"] for call in solve.call_args_list]
+        self.assertIsNone(starts[0])
+        for day, start in enumerate(starts[1:], start=1):
+            # the previous day's plan, matched meal for meal among today's candidates
+            previous = cbc[cbc["day"] == day]
+            fresh = ~np.isin(pool.names, previous["Name"].str.lower())
+            self.assertEqual(sorted(pool.meal_types[fresh][start]), sorted(previous["MealType"]))
+
+PLAN_PANTRY = ("salt", "butter", "sugar")
+
+
+class RegeneratePlanMealTests(CatalogTestCase):
+
+    def test_replaces_one_meal_against_the_pinned_rest(self):
+        # few strict matches, so the pool is the similarity fallback with every meal type
+        user = self.make_user("gus", pantry=PLAN_PANTRY, weight_kg=70, height_cm=170, age=30)
+        items = list(user.pantry_items.all())
+        plan = ai_recommender.generate_meal_plan(user, items)
+        current = [{"Name": row["Name"], "MealType": row["MealType"], "Calories": float(row["Calories"])}
+                   for _, row in plan.iterrows()]
+        self.assertEqual(sorted(meal["MealType"] for meal in current), sorted(MEAL_SLOTS))
+        pool = ai_recommender.plan_candidates(user, list(PLAN_PANTRY), min_count=len(current))
+        target = ai_recommender.daily_calorie_target(user)
+        in_plan = {meal["Name"].lower() for meal in current}
+
+        for meal in current:
+            new = ai_recommender.regenerate_plan_meal(user, items, current, meal["MealType"])
+            self.assertEqual(len(new), 1)
+            row = new.iloc[0]
+            self.assertEqual(row["MealType"], meal["MealType"])
+            self.assertNotIn(row["Name"].lower(), in_plan)
+            # the other meals are kept as they are, and the new one fits the day's target best
+            pinned = sum(m["Calories"] for m in current if m is not meal)
+            self.assertAlmostEqual(row["TotalCalories"], pinned + row["Calories"])
+            candidates = pool.calories[(pool.meal_types == meal["MealType"]) & ~np.isin(pool.names, list(in_plan))]
+            best = np.abs(pinned + candidates - target).min()
+            self.assertAlmostEqual(abs(row["TotalCalories"] - target), best)
+
+    def test_no_candidate_left_is_an_empty_frame(self):
+        user = self.make_user("hal", pantry=PLAN_PANTRY)
+        items = list(user.pantry_items.all())
+        pool = ai_recommender.plan_candidates(user, list(PLAN_PANTRY))
+        current = [{"Name": name, "MealType": "Lunch", "Calories": 500.0}
+                   for name in pool.names[pool.meal_types == "Lunch"]]
+        self.assertTrue(current)
+        self.assertTrue(ai_recommender.regenerate_plan_meal(user, items, current, "Lunch").empty)
+
+# ------------------- Recommendation cache -------------------
+
+class RecommendationCacheTests(CatalogTestCase):
+
+    def test_key_ignores_pantry_order_case_and_allergy_order(self):
+        user = self.make_user("ann", allergy_info="peanut, Shrimp", goal="Weight Loss")
+        key = recommendation_key("ai_meal", user, ["Egg", "salt "], 2, top_k=10)
+        user.profile.allergy_info = "shrimp,peanut"
+        self.assertEqual(key, recommendation_key("ai_meal", user, ["salt", "egg"], 2, top_k=10))
+        self.assertNotEqual(key, recommendation_key("ai_meal", user, ["salt", "egg"], 4, top_k=10))
+        self.assertNotEqual(key, recommendation_key("ai_meal", user, ["salt", "egg"], 2, top_k=5))
+
+    def test_key_follows_the_calorie_target_inputs(self):
+        user = self.make_user("ben", weight_kg=70)
+        key = recommendation_key("meal_plan", user, ["egg"])
+        user.profile.weight_kg = 82
+        self.assertNotEqual(key, recommendation_key("meal_plan", user, ["egg"]))
+
+    def test_lru_and_ttl(self):
+        cache = RecommendationCache(max_entries=2, ttl=60, report_every=0)
+        cache.set("a", 1, user_id=1)
+        cache.set("b", 2, user_id=1)
+        cache.get("a")
+        cache.set("c", 3, user_id=2)
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual((cache.get("a"), cache.get("c")), (1, 3))
+        self.assertEqual(cache.stats()["evictions"], 1)
+
+        with mock.patch("meal_plan.recommendation_cache.time.monotonic") as monotonic:
+            monotonic.return_value = 10**9
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["entries"], 1)
+
+    def test_invalidate_user_only_drops_their_entries(self):
+        cache = RecommendationCache(report_every=0)
+        cache.set("a", 1, user_id=1)
+        cache.set("b", 2, user_id=2)
+        cache.invalidate_user(1)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.get("b"), 2)
+
+    def test_generate_ai_meal_is_cached_until_the_pantry_changes(self):
+        user = self.make_user("cat")
+        items = list(user.pantry_items.all())
+        first = ai_recommender.generate_ai_meal(user, items, top_k=5)
+        hits = RECOMMENDATION_CACHE.hits
+        again = ai_recommender.generate_ai_meal(user, list(reversed(items)), top_k=5)
+        self.assertEqual(RECOMMENDATION_CACHE.hits, hits + 1)
+        self.assertTrue(first.equals(again))
+
+        items[0].qty = 3
+        items[0].save()
+        misses = RECOMMENDATION_CACHE.misses
+        ai_recommender.generate_ai_meal(user, items, top_k=5)
+        self.assertEqual(RECOMMENDATION_CACHE.misses, misses + 1)
+
+
+# ------------------- Precomputed suggestions -------------------
+
+class InlinePool:
+    """ProcessPoolExecutor.map in this process, so the test catalog is used."""
+
+    def map(self, fn, jobs, chunksize=1):
+        return map(fn, jobs)
+
+
+class PrecomputeTests(CatalogTestCase):
+
+    def precompute(self, catalog_version=None, **options):
+        command = PrecomputeCommand(stdout=StringIO(), stderr=StringIO())
+        command.workers = 1
+        command.catalog_version = self.catalog.version if catalog_version is None else catalog_version
+        stats = {"done": 0, "skipped": 0, "written": 0, "failed": 0}
+        options = {"serving_size": 2, "force": False, **options}
+        users = list(User.objects.select_related("profile").order_by("pk"))
+        command._run_chunk(InlinePool(), users, ["meal", "day_plan"], options, stats)
+        return stats
+
+    def test_fingerprint_inputs(self):
+        user = self.make_user("dan", weight_kg=70)
+        fingerprint = suggestion_fingerprint(user, ["egg", "Salt"], 2, {"Soup"})
+        self.assertEqual(fingerprint, suggestion_fingerprint(user, ["salt", "egg"], 2, {"soup"}))
+        self.assertNotEqual(fingerprint, suggestion_fingerprint(user, ["salt", "egg"], 4, {"soup"}))
+        self.assertNotEqual(fingerprint, suggestion_fingerprint(user, ["salt", "egg"], 2, set()))
+        for field, value in (("weight_kg", 90), ("height_cm", 150), ("age", 61), ("goal", "Weight Gain")):
+            user = User.objects.get(pk=user.pk)
+            setattr(user.profile, field, value)
+            self.assertNotEqual(fingerprint, suggestion_fingerprint(user, ["salt", "egg"], 2, {"soup"}), field)
+
+    def test_meal_type_and_catalog_version_bypass_stored_suggestions(self):
+        user = self.make_user("fay")
+        pantry = ["salt", "butter", "egg"]
+        self.precompute()
+        self.assertIsNotNone(precomputed_suggestions(user, "meal", pantry, 2))
+        # stored suggestions were ranked without a meal-type filter
+        self.assertIsNone(precomputed_suggestions(user, "meal", pantry, 2, meal_type="Dinner"))
+
+        with mock.patch.object(self.catalog, "version", self.catalog.version + 1):
+            self.assertIsNone(precomputed_suggestions(user, "meal", pantry, 2))
+            self.assertEqual(self.precompute()["written"], 2)
+            self.assertIsNotNone(precomputed_suggestions(user, "meal", pantry, 2))
+
+    def test_rows_ranked_against_another_catalog_version_are_not_stored(self):
+        self.make_user("gus")
+        stats = self.precompute(catalog_version=self.catalog.version + 1)
+        self.assertEqual((stats["written"], stats["failed"]), (0, 1))
+        self.assertFalse(PrecomputedSuggestion.objects.exists())
+
+    def test_rerun_only_recomputes_changed_users(self):
+        ann = self.make_user("ann")
+        self.make_user("bob", pantry=("salt", "onion"))
+        self.assertEqual(self.precompute()["written"], 4)
+        self.assertIsNotNone(precomputed_suggestions(ann, "meal", ["salt", "butter", "egg"], 2))
+
+        self.assertEqual(self.precompute()["skipped"], 2)
+        Recipe.objects.create(user=ann, name="Easy Soup")
+        stats = self.precompute()
+        self.assertEqual((stats["skipped"], stats["written"]), (1, 2))
+        self.assertEqual(self.precompute(force=True)["written"], 4)
+
+    def test_profile_changes_drop_stored_suggestions(self):
+        user = self.make_user("eve")
+        self.precompute()
+        user.save()     # e.g. a login: the profile is saved unchanged
+        self.assertEqual(PrecomputedSuggestion.objects.filter(user=user).count(), 2)
+
+        user = User.objects.get(pk=user.pk)
+        user.profile.weight_kg = 95
+        user.profile.save()
+        self.assertFalse(PrecomputedSuggestion.objects.filter(user=user).exists())
+        self.assertIsNone(precomputed_suggestions(user, "meal", ["salt", "butter", "egg"], 2))
+
+
+# ------------------- Recommender server -------------------
+
+class RecommenderServiceTests(CatalogTestCase):
+
+    queries = [
+        (["salt", "butter"], 10, None, None),
+        (["tofu", "rice"], 5, "Vegan", None),
+        (["egg", "milk", "flour"], 20, None, "walnut, Peanut"),
+        (["saffron"], 8, "Vegetarian", "shrimp"),
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.enterContext(mock.patch.object(recommender_service, "_CLIENT", None))
+        # the server's threads don't see the pinned catalog
+        self.enterContext(mock.patch.object(ai_recommender, "_CATALOG", self.catalog))
+        self.socket_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.socket_dir, True)
+
+    def assert_same_ranking(self, found, expected):
+        self.assertEqual(found[0].tolist(), expected[0].tolist())
+        np.testing.assert_allclose(found[1], expected[1], atol=1e-6)
+
+    def test_a_batch_equals_ranking_one_by_one(self):
+        batcher = MicroBatcher()
+        batch = [_Pending(pantry, top_k, (diet or "", allergy or "")) for pantry, top_k, diet, allergy in self.queries]
+        batcher._score(batch)
+        self.assertEqual(batcher.stats(), {"batches": 1, "queries": 4, "mean_batch": 4.0})
+        for pending, (pantry, top_k, diet, allergy) in zip(batch, self.queries):
+            self.assertIsNone(pending.error)
+            ids, scores, n_rows, version = pending.result
+            self.assertEqual((n_rows, version), (len(self.catalog), self.catalog.version))
+            self.assert_same_ranking((ids, scores), rank_pantry(self.catalog, "search", pantry, top_k, 3, diet, allergy))
+
+    def test_server_answers_like_the_local_ranking(self):
+        path = os.path.join(self.socket_dir, "recommender.sock")
+        server = RecommenderServer(path, window=0.01)
+        self.addCleanup(server.server_close)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        user = self.make_user("sam", dietary_pref="Vegetarian", allergy_info="walnut")
+        with override_settings(RECOMMENDER_SOCKET=path):
+            for mode in ("match", "search"):
+                found = remote_rank(mode, ["salt", "butter"], 10, 3, "Vegetarian", "walnut",
+                                    n_rows=len(self.catalog), version=self.catalog.version)
+                self.assert_same_ranking(found, rank_pantry(self.catalog, mode, ["salt", "butter"], 10, 3,
+                                                            "Vegetarian", "walnut"))
+                recs = ai_recommender.pantry_recommendations(user, ["salt", "butter"], mode, top_k=10)
+                self.assertEqual(recs["recipe_id"].tolist(), found[0].tolist())
+            # a ranking of another catalog version has ids of other recipes, even at the same size
+            self.assertIsNone(remote_rank("search", ["salt"], 10, 3, None, None,
+                                          n_rows=len(self.catalog), version=self.catalog.version + 1))
+            self.assertIsNone(remote_rank("search", ["salt"], 10, 3, None, None,
+                                          n_rows=5, version=self.catalog.version))
+            stale = {"ids": [0], "scores": [1.0], "n_rows": len(self.catalog), "version": self.catalog.version + 1}
+            with mock.patch.object(recommender_service.RecommenderClient, "request", return_value=stale):
+                recs = ai_recommender.pantry_recommendations(user, ["salt", "butter"], "search", top_k=10)
+            expected = rank_pantry(self.catalog, "search", ["salt", "butter"], 10, 3, "Vegetarian", "walnut")
+            self.assertEqual(recs["recipe_id"].tolist(), expected[0].tolist())
+
+    def test_a_dead_socket_falls_back_to_local_ranking(self):
+        path = os.path.join(self.socket_dir, "stale.sock")
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()       # the file stays, nobody listens
+        user = self.make_user("kim", allergy_info="walnut")
+        expected = rank_pantry(self.catalog, "search", ["salt", "butter"], 10, 3, None, "walnut")
+        with override_settings(RECOMMENDER_SOCKET=path), self.assertLogs(recommender_service.logger, "WARNING"):
+            recs = ai_recommender.pantry_recommendations(user, ["salt", "butter"], "search", top_k=10)
+        self.assertEqual(recs["recipe_id"].tolist(), expected[0].tolist())
+        # backs off instead of reconnecting on every request
+        client = recommender_service._CLIENT
+        with mock.patch.object(client, "_socket") as connect:
+            self.assertIsNone(client.request({"op": "stats"}))
+        connect.assert_not_called()
+
+    def test_diet_masks_are_cached_per_catalog_version(self):
+        batcher = MicroBatcher(max_masks=2)
+        key = ("Vegan", "walnut")
+        with mock.patch.object(self.catalog.dietary, "allowed_mask", wraps=self.catalog.dietary.allowed_mask) as build:
+            mask = batcher._mask(self.catalog, key)
+            self.assertIs(batcher._mask(self.catalog, key), mask)
+            self.assertEqual(build.call_count, 1)
+            with mock.patch.object(self.catalog, "version", 7):
+                batcher._mask(self.catalog, key)
+            self.assertEqual(build.call_count, 2)
+            self.assertIs(batcher._mask(self.catalog, key), mask)
+            # least recently used goes first: the version-7 mask, not this one
+            batcher._mask(self.catalog, ("", ""))
+            self.assertIs(batcher._mask(self.catalog, key), mask)
+            self.assertEqual(build.call_count, 3)
+            with mock.patch.object(self.catalog, "version", 7):
+                batcher._mask(self.catalog, key)
+            self.assertEqual(build.call_count, 4)
+
+
+# ------------------- Instrumentation -------------------
+
+class InstrumentationTests(TestCase):
+
+    def setUp(self):
+        self.sinks = self.enterContext(mock.patch.object(instrumentation, "_SINKS", []))
+
+    def test_no_sink_is_the_shared_noop_span(self):
+        self.assertFalse(instrumentation.enabled())
+        with instrumentation.span("generate_ai_meal", top_k=10) as trace:
+            trace.set(candidates=3)
+            self.assertIs(instrumentation.span("retrieve"), instrumentation.NOOP_SPAN)
+        self.assertIs(trace, instrumentation.NOOP_SPAN)
+
+    def test_histogram_sink_aggregates_nested_spans_per_path(self):
+        sink = instrumentation.add_sink(instrumentation.HistogramSink())
+        self.assertTrue(instrumentation.enabled())
+        for candidates in (10, 30):
+            with instrumentation.span("generate_ai_meal", mode="match"):
+                with instrumentation.span("retrieve") as stage:
+                    stage.set(candidates=candidates, strict=True)
+                    with instrumentation.span("score"):
+                        pass
+                with instrumentation.span("retrieve") as stage:
+                    stage.set(candidates=2)
+        with self.assertRaises(ValueError), instrumentation.span("generate_ai_meal"):
+            raise ValueError
+
+        report = sink.snapshot()
+        self.assertEqual(list(report), ["generate_ai_meal", "generate_ai_meal.retrieve",
+                                        "generate_ai_meal.retrieve.score"])
+        self.assertEqual([stats["count"] for stats in report.values()], [3, 4, 2])
+        # numeric fields only; labels and flags are not averaged
+        self.assertEqual(report["generate_ai_meal.retrieve"]["mean_candidates"], 11.0)
+        self.assertNotIn("mean_strict", report["generate_ai_meal.retrieve"])
+        self.assertNotIn("mean_mode", report["generate_ai_meal"])
+        for stats in report.values():
+            self.assertLessEqual(stats["p50_ms"], stats["p95_ms"])
+            self.assertLessEqual(stats["p99_ms"], stats["max_ms"])
+        sink.reset()
+        self.assertEqual(sink.snapshot(), {})
+
+    def test_logging_sink_writes_the_stage_tree(self):
+        instrumentation.add_sink(instrumentation.LoggingSink(slow_ms=0))
+        with self.assertLogs(instrumentation.logger, "INFO") as logs:
+            with instrumentation.span("day_plan", days=1):
+                with instrumentation.span("solve") as stage:
+                    stage.set(status="optimal")
+        lines = logs.records[0].getMessage().splitlines()
+        self.assertRegex(lines[0], r"^day_plan [\d.]+ms days=1$")
+        self.assertRegex(lines[1], r"^  solve [\d.]+ms status=optimal$")
+
+
+# ------------------- Synthetic catalogs -------------------
+
+class SyntheticCatalogTests(CatalogTestCase):
+
+    def test_chunks_are_deterministic_in_the_seed(self):
+        pd.testing.assert_frame_equal(synthetic_chunk(250, 300, seed=1), synthetic_chunk(250, 300, seed=1))
+        self.assertNotEqual(synthetic_chunk(250, 300, seed=1)[INGREDIENT_COLUMN].tolist(),
+                            synthetic_chunk(250, 300, seed=2)[INGREDIENT_COLUMN].tolist())
+        names = pd.concat(synthetic_chunks(self.n_rows, seed=1, chunk_size=250))["Name"]
+        self.assertEqual(self.catalog.rows(np.arange(self.n_rows))["Name"].tolist(), names.tolist())
+
+    def test_existing_catalog_is_recognized(self):
+        self.assertTrue(is_synthetic_catalog(self.catalog_path, self.n_rows, seed=1))
+        self.assertFalse(is_synthetic_catalog(self.catalog_path, self.n_rows, seed=2))
+        self.assertFalse(is_synthetic_catalog(self.catalog_path, 2 * self.n_rows, seed=1))
+
+
+# ------------------- Row-id pipeline -------------------
+
+def baseline_candidates(user, pantry, top_k, fallback_top_k, min_count, exclude_names, serving_size):
+    """The DataFrame pipeline generate_ai_meal and plan_candidates ran before the id arrays."""
+    exclude_names = set(n.lower() for n in exclude_names or ())
+    recs = ai_recommender.pantry_recommendations(user, pantry, "match", top_k=top_k)
+    recs = recs[~recs["Name"].str.lower().isin(exclude_names)]
+    if len(recs) < min_count:
+        recs = ai_recommender.pantry_recommendations(user, pantry, "search", top_k=fallback_top_k)
+        recs = recs[~recs["Name"].str.lower().isin(exclude_names)]
+    recs = ai_recommender.personalize_results(recs, user)
+    if serving_size:
+        recs = ai_recommender.filter_by_serving_size(recs, serving_size, tolerance=4)
+    recs["MealType"] = recs["Calories"].apply(classify_meal_by_calories)
+    return recs.reset_index(drop=True)
+
+
+class RowIdPipelineTests(CatalogTestCase):
+
+    def cases(self):
+        users = [
+            self.make_user("ida"),
+            self.make_user("joe", dietary_pref="Vegetarian", allergy_info="walnut", goal="Weight Loss"),
+            self.make_user("liv", dietary_pref="Keto", goal="Weight Gain"),
+        ]
+        for user in users:
+            for pantry in (["salt", "butter"], ["egg", "milk", "flour", "sugar"], ["tofu"]):
+                for serving_size in (None, 4):
+                    yield user, pantry, serving_size
+
+    def assert_same_frame(self, frame, expected):
+        self.assertEqual(frame["recipe_id"].tolist(), expected["recipe_id"].tolist())
+        self.assertEqual(set(frame.columns), set(expected.columns))
+        # missing strings come back as None instead of NaN
+        frame = frame[expected.columns].astype(object)
+        expected = expected.astype(object)
+        pd.testing.assert_frame_equal(frame.where(frame.notna()), expected.where(expected.notna()), check_dtype=False)
+
+    def test_generate_ai_meal_matches_the_frame_pipeline(self):
+        checked = 0
+        for user, pantry, serving_size in self.cases():
+            expected = baseline_candidates(user, pantry, 50, 10, 10, (), serving_size).head(10)
+            saved = expected["Name"].iloc[:2].tolist()
+            for exclude in (None, saved):
+                if exclude:
+                    expected = baseline_candidates(user, pantry, 50, 10, 10, exclude, serving_size).head(10)
+                frame = ai_recommender._generate_ai_meal(user, pantry, top_k=10, exclude_names=exclude,
+                                                         serving_size=serving_size)
+                self.assert_same_frame(frame, expected)
+                checked += len(frame)
+        self.assertGreater(checked, 100)
+
+    def test_plan_pool_matches_the_frame_pipeline(self):
+        for user, pantry, serving_size in self.cases():
+            expected = baseline_candidates(user, pantry, 80, 80, 6, (), serving_size)
+            expected = expected[expected["Calories"] > 0].reset_index(drop=True)
+            pool = ai_recommender.plan_candidates(user, pantry, serving_size=serving_size, min_count=6)
+            self.assertEqual(pool.ids.tolist(), expected["recipe_id"].tolist())
+            self.assertEqual(pool.meal_types.tolist(), expected["MealType"].tolist())
+            self.assert_same_frame(pool.frame(np.arange(len(pool))), expected)
+
+
+# ------------------- Image jobs -------------------
+
+class FakeImage:
+    """Stands in for a PIL image: saves a few JPEG-ish bytes naming its prompt."""
+
+    def __init__(self, label="", size=1000):
+        self.label, self.size = label, size
+
+    def save(self, buffer, format):
+        buffer.write(b"\xff\xd8" + self.label.encode().ljust(self.size, b"x"))
+
+
+class FakeGenerate:
+    """generate_recipe_images stand-in that records every call."""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.profiles = []
+        self.fail = fail
+
+    def __call__(self, pairs, steps, profile=None):
+        self.calls.append((list(pairs), steps))
+        self.profiles.append(profile)
+        if self.fail:
+            raise RuntimeError("out of memory")
+        return [FakeImage(f"{name}/{steps}") for name, _ in pairs]
+
+
+class ImageTestCase(TestCase):
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        self.enterContext(override_settings(MEDIA_ROOT=media, IMAGE_CACHE_MAX_MB=2048))
+        self.user = User.objects.create_user("cook", password="x")
+
+    def enqueue(self, *names):
+        return image_jobs.enqueue_recipe_images(self.user, [(name, "egg, salt") for name in names], steps=12)
+
+
+class ImageJobTests(ImageTestCase):
+
+    def test_claim_oldest_pending_jobs_once(self):
+        first, second, third = self.enqueue("Omelette", "Pancakes", "Soup")
+        claimed = image_jobs.claim_next_jobs(2)
+        self.assertEqual([job.pk for job in claimed], [first.pk, second.pk])
+        self.assertTrue(all(job.status == ImageJob.RUNNING and job.started_at for job in claimed))
+        self.assertEqual([job.pk for job in image_jobs.claim_next_jobs(2)], [third.pk])
+        self.assertEqual(image_jobs.claim_next_jobs(2), [])
+
+    def test_run_jobs_renders_identical_prompts_once(self):
+        self.enqueue("Omelette", "omelette ", "Soup")
+        generate = FakeGenerate()
+        jobs = image_jobs.run_jobs(image_jobs.claim_next_jobs(3), generate=generate)
+
+        self.assertEqual(len(generate.calls), 1)
+        self.assertEqual(len(generate.calls[0][0]), 2)
+        self.assertEqual(generate.calls[0][1], 12)
+        for job in ImageJob.objects.filter(pk__in=[j.pk for j in jobs]):
+            self.assertEqual(job.status, ImageJob.DONE)
+            self.assertTrue(image_jobs.job_status(job)["image_url"])
+        self.assertEqual(len({job.image.name for job in ImageJob.objects.all()}), 2)
+
+        # the same prompt again is done as soon as it is queued
+        (cached,) = self.enqueue("OMELETTE")
+        self.assertEqual(cached.status, ImageJob.DONE)
+
+    def test_batches_are_grouped_by_steps_and_match_per_job_renders(self):
+        jobs = self.enqueue("Omelette", "Soup") + image_jobs.enqueue_recipe_images(
+            self.user, [("Pancakes", "egg, milk")], steps=20)
+        generate = FakeGenerate()
+        image_jobs.run_jobs(image_jobs.claim_next_jobs(3), generate=generate)
+
+        self.assertEqual(generate.calls, [([("Omelette", "egg, salt"), ("Soup", "egg, salt")], 12),
+                                          ([("Pancakes", "egg, milk")], 20)])
+        for job in ImageJob.objects.filter(pk__in=[j.pk for j in jobs]):
+            buffer = BytesIO()
+            FakeImage(f"{job.recipe_name}/{job.steps}").save(buffer, format="JPEG")
+            with job.image.open("rb") as fh:
+                self.assertEqual(fh.read(), buffer.getvalue(), job.recipe_name)
+
+    def test_jobs_keep_the_profile_they_were_queued_with(self):
+        with override_settings(IMAGE_PROFILE="cpu_draft"):
+            (job,) = self.enqueue("Omelette")
+            key = image_jobs.job_cache_key(job)
+        self.assertEqual((job.profile, job.steps), ("cpu_draft", 12))
+
+        with override_settings(IMAGE_PROFILE="cpu_fast"):
+            (claimed,) = image_jobs.claim_next_jobs(1)
+            self.assertEqual(image_jobs.job_cache_key(claimed), key)
+            generate = FakeGenerate()
+            image_jobs.run_jobs([claimed], generate=generate)
+            self.assertEqual(generate.profiles, ["cpu_draft"])
+            # cached under the key it was queued with, so the same prompt queued as cpu_draft hits it
+            self.assertEqual(image_cache.lookup(key), ImageJob.objects.get(pk=job.pk).image.name)
+            self.assertIsNone(image_cache.lookup(image_jobs.job_cache_key(self.enqueue("Omelette")[0])))
+
+    def test_auto_profile_follows_the_live_worker(self):
+        image_jobs.record_worker("gpu-host:1", profile="gpu_fast", status=ImageWorker.READY)
+        with override_settings(IMAGE_PROFILE="auto"):
+            (job,) = image_jobs.enqueue_recipe_images(self.user, [("Omelette", "egg")])
+        self.assertEqual((job.profile, job.steps), ("gpu_fast", 20))
+
+    def test_failed_batch_marks_every_job_failed(self):
+        self.enqueue("Omelette", "Soup")
+        with mock.patch("meal_plan.image_jobs.traceback.print_exc"):
+            image_jobs.run_jobs(image_jobs.claim_next_jobs(2), generate=FakeGenerate(fail=True))
+        for job in ImageJob.objects.all():
+            status = image_jobs.job_status(job)
+            self.assertEqual(status["status"], ImageJob.FAILED)
+            self.assertIn("out of memory", status["error"])
+
+    def test_only_stale_running_jobs_are_requeued(self):
+        self.enqueue("Omelette", "Soup")
+        stale, live = image_jobs.claim_next_jobs(2)
+        ImageJob.objects.filter(pk=stale.pk).update(started_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(image_jobs.requeue_interrupted(stale_seconds=900), 1)
+        self.assertEqual(ImageJob.objects.get(pk=stale.pk).status, ImageJob.PENDING)
+        self.assertEqual(ImageJob.objects.get(pk=live.pk).status, ImageJob.RUNNING)
+
+        # the stopped worker finishing late must not overwrite the new claim
+        (reclaimed,) = image_jobs.claim_next_jobs(1)
+        with mock.patch("meal_plan.image_jobs.traceback.print_exc"):
+            image_jobs.run_jobs([stale], generate=FakeGenerate(fail=True))
+        job = ImageJob.objects.get(pk=reclaimed.pk)
+        self.assertEqual((job.status, job.started_at), (ImageJob.RUNNING, reclaimed.started_at))
+
+
+class ImageCacheTests(ImageTestCase):
+
+    def store(self, name, age_seconds):
+        key = image_cache.image_key(name, "egg", steps=12)
+        stored = image_cache.store(key, b"x" * 1000)
+        stamp = timezone.now().timestamp() - age_seconds
+        os.utime(image_cache._path(stored), (stamp, stamp))
+        return stored
+
+    def test_key_normalizes_the_prompt(self):
+        key = image_cache.image_key("Egg  Fried Rice", "rice, Egg,egg", steps=12, model="sd")
+        self.assertEqual(key, image_cache.image_key("egg fried rice", ["egg", "rice"], model="sd", steps=12))
+        self.assertNotEqual(key, image_cache.image_key("egg fried rice", ["egg", "rice"], model="sd", steps=20))
+
+    def test_evicts_least_recently_used_unreferenced_images(self):
+        oldest, saved, recent_job, newest = (self.store(n, age) for n, age in
+                                             (("a", 400), ("b", 300), ("c", 200), ("d", 100)))
+        Recipe.objects.create(user=self.user, name="B", image=saved)
+        ImageJob.objects.create(user=self.user, recipe_name="C", status=ImageJob.DONE,
+                                image=recent_job, finished_at=timezone.now())
+        image_cache.lookup(image_cache.image_key("a", "egg", steps=12))     # a hit makes "a" recent again
+
+        freed = image_cache.evict(max_bytes=3000)
+        self.assertEqual(freed, 1000)
+        remaining = {name for _, _, name in image_cache.cache_usage()}
+        self.assertEqual(remaining, {oldest, saved, recent_job})
+        self.assertNotIn(newest, remaining)
+
+    def test_batch_keeps_images_of_jobs_it_just_finished(self):
+        with override_settings(IMAGE_CACHE_MAX_MB=2500 / 2**20):    # room for two images
+            jobs = image_jobs.run_jobs(image_jobs.claim_next_jobs(len(self.enqueue("A", "B", "C", "D"))),
+                                       generate=FakeGenerate())
+        for job in ImageJob.objects.filter(pk__in=[j.pk for j in jobs]):
+            self.assertTrue(image_jobs.job_status(job)["image_url"], job.recipe_name)
+
+    def test_polling_a_job_whose_image_was_evicted_queues_it_again(self):
+        (job,) = self.enqueue("Omelette")
+        image_jobs.run_jobs(image_jobs.claim_next_jobs(1), generate=FakeGenerate())
+        job = ImageJob.objects.get(pk=job.pk)
+        os.remove(image_cache._path(job.image.name))
+
+        self.assertEqual(image_jobs.job_status(job), {"id": job.pk, "status": ImageJob.PENDING,
+                                                      "image_url": "", "error": ""})
+        self.assertEqual(ImageJob.objects.get(pk=job.pk).status, ImageJob.PENDING)
+
+
+class ImageWorkerTests(TestCase):
+
+    def test_readiness_follows_the_freshest_worker_heartbeat(self):
+        with override_settings(MEAL_PLAN_WARMUP=(), READY_REQUIRES_IMAGE_WORKER=True,
+                               IMAGE_WORKER_HEARTBEAT_SECONDS=30):
+            self.assertEqual(warmup.readiness()[1]["image_worker"]["status"], "missing")
+            self.assertFalse(warmup.readiness()[0])
+
+            image_jobs.record_worker("host:1", profile="cpu", status=ImageWorker.LOADING, error="")
+            self.assertEqual(image_jobs.worker_readiness()["status"], ImageWorker.LOADING)
+            self.assertFalse(warmup.readiness()[0])
+
+            image_jobs.record_worker("host:1", status=ImageWorker.READY, load_seconds=4.2)
+            ready, components = warmup.readiness()
+            self.assertTrue(ready)
+            self.assertEqual((components["image_worker"]["workers"], components["image_worker"]["seconds"]), (1, 4.2))
+
+            # a worker that stopped beating more than three intervals ago no longer counts
+            ImageWorker.objects.update(heartbeat_at=timezone.now() - timedelta(seconds=91))
+            self.assertEqual(image_jobs.worker_readiness()["status"], "missing")
+            with override_settings(READY_REQUIRES_IMAGE_WORKER=False):
+                self.assertTrue(warmup.readiness()[0])
@@ -15,5 +15,8 @@ urlpatterns = [
     path("dayplan/<int:plan_id>/favorite/", views.add_dayplan_favorite, name="add_dayplan_favorite"),
     path("dayplan/<int:plan_id>/unfavorite/", views.remove_dayplan_favorite, name="remove_dayplan_favorite"),
     path('delete_dayplan/<int:plan_id>/', views.delete_dayplan, name='delete_dayplan'),
+    path('metrics/recommender/', views.recommender_metrics, name='recommender_metrics'),
+    path('image-jobs/<int:job_id>/', views.image_job_status, name='image_job_status'),
+    path('ready/', views.ready, name='ready'),
 
 ]
\ No newline at end of file
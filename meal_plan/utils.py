@@ -1,23 +1,86 @@
-from diffusers import StableDiffusionPipeline
+import resource
+import sys
+import threading
+
+from diffusers import DPMSolverMultistepScheduler, StableDiffusionPipeline
 import torch
 from PIL import Image
 
-# Load model once (can be reused)
-pipe = None
-def get_pipe():
-    global pipe
-    if pipe is None:
+from .image_profiles import active_profile
+from .instrumentation import span
+
+MODEL_ID = "runwayml/stable-diffusion-v1-5"
+
+# Load model once per inference profile (can be reused)
+pipes = {}
+_pipes_lock = threading.Lock()
+def get_pipe(profile=None):
+    """The pipeline set up for ``profile`` (see image_profiles; default settings.IMAGE_PROFILE)."""
+    profile = active_profile(profile)
+    pipe = pipes.get(profile["name"])
+    if pipe is not None:
+        return pipe
+    # the warmup thread and a first request may both get here; load the model once
+    with _pipes_lock:
+        if profile["name"] in pipes:
+            return pipes[profile["name"]]
+        if profile["threads"]:
+            torch.set_num_threads(profile["threads"])
         pipe = StableDiffusionPipeline.from_pretrained(
-            "runwayml/stable-diffusion-v1-5", torch_dtype=torch.float16
+            MODEL_ID, torch_dtype=getattr(torch, profile["dtype"])
         )
-        pipe = pipe.to("cuda")  # or "cpu" if no GPU
-    return pipe
-
-def generate_recipe_image(recipe_name, ingredients, steps=50):
-    prompt = f"A high-quality, appetizing photo of {recipe_name} with {' ,'.join(ingredients)}, top-down food photography"
-    pipe = get_pipe()
-    image = pipe(prompt, guidance_scale=7.5, num_inference_steps=steps).images[0]
-    return image
+        if profile["scheduler"] == "dpm":
+            pipe.scheduler = DPMSolverMultistepScheduler.from_config(pipe.scheduler.config)
+        if profile["attention_slicing"]:
+            pipe.enable_attention_slicing()
+        pipe.set_progress_bar_config(disable=True)
+        pipes[profile["name"]] = pipe.to(profile["device"])
+        return pipes[profile["name"]]
+
+def memory_usage(device):
+    """Peak memory of this process so far in MiB: RSS, plus allocated GPU memory on CUDA."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    usage = {"peak_rss_mib": round(peak / 2**20 if sys.platform == "darwin" else peak / 2**10, 1)}
+    if device == "cuda":
+        usage["peak_cuda_mib"] = round(torch.cuda.max_memory_allocated() / 2**20, 1)
+    return usage
+
+def recipe_prompt(recipe_name, ingredients):
+    return f"A high-quality, appetizing photo of {recipe_name} with {' ,'.join(ingredients)}, top-down food photography"
+
+def generate_recipe_image(recipe_name, ingredients, steps=None, profile=None):
+    return generate_recipe_images([(recipe_name, ingredients)], steps=steps, profile=profile)[0]
+
+def generate_recipe_images(pairs, steps=None, batch_size=None, profile=None):
+    """
+    One image per (recipe_name, ingredients) pair, in order. Prompts are
+    rendered batch_size at a time (default settings.IMAGE_BATCH_SIZE) in a
+    single pipeline call, so a day plan's three meals take one pass.
+    ``steps`` defaults to the profile's. Each call is timed as the
+    "generate_images:<profile>" stage, with peak memory.
+    """
+    if batch_size is None:
+        from django.conf import settings
+        batch_size = getattr(settings, "IMAGE_BATCH_SIZE", 4)
+    batch_size = max(1, batch_size)
+    profile = active_profile(profile)
+    steps = steps or profile["steps"]
+    prompts = [recipe_prompt(name, ingredients) for name, ingredients in pairs]
+    pipe = get_pipe(profile)
+    images = []
+    with torch.inference_mode():
+        for start in range(0, len(prompts), batch_size):
+            batch = prompts[start:start + batch_size]
+            with span(f"generate_images:{profile['name']}", images=len(batch), steps=steps) as stage:
+                images.extend(pipe(
+                    batch,
+                    guidance_scale=profile["guidance_scale"],
+                    num_inference_steps=steps,
+                    width=profile["width"],
+                    height=profile["height"],
+                ).images)
+                stage.set(**memory_usage(profile["device"]))
+    return images
 
 
 
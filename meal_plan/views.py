@@ -1,10 +1,16 @@
 from django.shortcuts import render,redirect,get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User # Import User from auth
 from django.contrib import messages
-from .models import Profile ,PantryItem, Recipe, FavoriteRecipe, DayPlan
+from .models import Profile ,PantryItem, Recipe, FavoriteRecipe, DayPlan, ImageJob
 from .forms import PantryItemForm
-from .ai_recommender import generate_ai_meal, generate_meal_plan
+from .ai_recommender import generate_ai_meal, generate_meal_plan, get_catalog, regenerate_plan_meal
+from .precompute import precomputed_suggestions
+from .image_jobs import attach_job_image, enqueue_recipe_image, enqueue_recipe_images, job_status
+from .instrumentation import enabled as metrics_enabled, metrics_snapshot
+from .recommendation_cache import RECOMMENDATION_CACHE
+from .warmup import readiness
 import pandas as pd
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -13,9 +19,8 @@ import json
 import requests
 from datetime import date
 from django.utils import timezone
-from .utils import convert_to_grams, get_density, generate_recipe_image
+from .utils import convert_to_grams, get_density
 import base64
-from io import BytesIO
 
 from django.core.files.base import ContentFile
 
@@ -181,14 +186,21 @@ def dashboard(request):
             # 🔥 NEW: Pass saved recipe names into the AI generator
             # --------------------------------------------------------
             
-            ai_recipes_df = generate_ai_meal(
-                user=request.user,
-                pantry_items=pantry_items,
-                top_k=10,
-                exclude_names=saved_recipe_names,     # <--- ✨ NEW
-                serving_size=serving_size,
-                meal_type=meal_type   # <--- NEW
+            # Served from `manage.py precompute_suggestions` when the inputs match
+            ai_recipes_df = precomputed_suggestions(
+                request.user, "meal",
+                [p.ingredient_name for p in pantry_items],
+                serving_size, saved_recipe_names, meal_type,
             )
+            if ai_recipes_df is None:
+                ai_recipes_df = generate_ai_meal(
+                    user=request.user,
+                    pantry_items=pantry_items,
+                    top_k=10,
+                    exclude_names=saved_recipe_names,     # <--- ✨ NEW
+                    serving_size=serving_size,
+                    meal_type=meal_type   # <--- NEW
+                )
 
              # NEW: Filter by meal type if user selected one
             if meal_type:
@@ -228,21 +240,9 @@ def dashboard(request):
             )
 
             # ---------------------------------------
-            # 🔥 Generate AI Image (Name + Ingredients + Instructions)
+            # 🔥 Queue AI Image (run_image_worker generates it, the page polls for it)
             # ---------------------------------------
-
-            sd_image=generate_recipe_image(recipe.Name,", ".join(ingredients_with_qty), steps=50)
-            buffer = BytesIO()
-            sd_image.save(buffer, format="JPEG")
-            buffer.seek(0)
-            img_str = base64.b64encode(buffer.getvalue()).decode("utf-8")
-            image_data = f"data:image/jpeg;base64,{img_str}"
-
-            ai_image_url = generate_food_image(
-                recipe.Name,
-                ", ".join(ingredients_with_qty),
-                getattr(recipe, "RecipeInstructions_cleaned", recipe.Description)
-            )
+            image_job = enqueue_recipe_image(request.user, recipe.Name, ", ".join(ingredients_with_qty))
             # -----------------------
             # BUILD CONTEXT
             # -----------------------
@@ -251,8 +251,9 @@ def dashboard(request):
                 "Calories": recipe.Calories,
                 "MealType": recipe.MealType,  # <--- NEW
                 "RecipeInstructions": getattr(recipe, "RecipeInstructions_cleaned", recipe.Description),
-                # ⭐ Show Pollinations image instead of CSV image
-                "Images": image_data,
+                # ⭐ Filled in by the page once the image job is done
+                "Images": "",
+                "image_job": image_job.id,
                 "ingredients_with_qty": ingredients_with_qty,
 
                   # 🔥 NEW → Store in database in perfect format
@@ -350,6 +351,9 @@ def dashboard(request):
                     ContentFile(base64.b64decode(imgstr)),
                     save=True
                 )
+            else:
+                # AI image generated by the worker, if it has finished
+                attach_job_image(recipe_obj, request.POST.get("recipe_image_job"), request.user)
 
             # ---- REDUCE PANTRY ITEMS QUANTITY ----
             for ing, used_qty in ingredients_dict.items():
@@ -428,28 +432,30 @@ def dashboard(request):
                 # ---- MAIN NUTRIENTS ----
                 main_nutrients_cleaned = extract_main_nutrients(nutrition_totals)
 
+                # ---- SAVE RECIPE ----
+                recipe_obj = Recipe.objects.create(
+                    user=request.user,
+                    name=meal.get("Name") or meal.get("meal"),
+                    ingredients=ingredients_dict,
+                    instructions=meal.get("instructions") or meal.get("RecipeInstructions_cleaned"),
+                    meal_type=meal.get("MealType") or meal.get("meal_type"),        # already provided in DF
+                    nutrition_info=formatted_nutrition,
+                    main_nutrients=main_nutrients_cleaned,
+                )
+
                 # Save image from base64 to media
-                image_b64 = meal["image"]
+                image_b64 = meal.get("image", "")
                 if image_b64.startswith("data:image"):
                     format, imgstr = image_b64.split(";base64,")
                     ext = format.split("/")[-1]
 
-
-                    # ---- SAVE RECIPE ----
-                    recipe_obj = Recipe.objects.create(
-                        user=request.user,
-                        name=meal.get("Name") or meal.get("meal"),
-                        ingredients=ingredients_dict,
-                        instructions=meal.get("instructions") or meal.get("RecipeInstructions_cleaned"),
-                        meal_type=meal.get("MealType") or meal.get("meal_type"),        # already provided in DF
-                        nutrition_info=formatted_nutrition,
-                        main_nutrients=main_nutrients_cleaned,
-                    )
-
                     ## Save image using recipe ID
                     file_name = f"recipe_images/recipe_{recipe_obj.id}.{ext}"
                     content_file = ContentFile(base64.b64decode(imgstr))
                     recipe_obj.image.save(file_name, content_file, save=True)
+                else:
+                    # image from the worker; a recipe saved before it finishes stays without one
+                    attach_job_image(recipe_obj, meal.get("image_job"), request.user)
         
                 # store based on meal type
                 saved_recipes[recipe_obj.meal_type]  = recipe_obj
@@ -486,51 +492,48 @@ def dashboard(request):
                 .values_list("name", flat=True)
             )
 
-            # Call meal-plan generator with 1 day of 3 meals
-            day_df = generate_meal_plan(
-                user=request.user,
-                pantry_items=pantry_items,
-                days=1,
-                meals_per_day=3,
-                exclude_names=saved_recipe_names,     # <--- ✨ NEW
-                serving_size=serving_size
-                
+            day_df = precomputed_suggestions(
+                request.user, "day_plan",
+                [p.ingredient_name for p in pantry_items],
+                serving_size, saved_recipe_names,
             )
+            if day_df is None:
+                # Call meal-plan generator with 1 day of 3 meals
+                day_df = generate_meal_plan(
+                    user=request.user,
+                    pantry_items=pantry_items,
+                    days=1,
+                    meals_per_day=3,
+                    exclude_names=saved_recipe_names,     # <--- ✨ NEW
+                    serving_size=serving_size
 
-            day_plan_records = []
-            for _, row in day_df.iterrows():
-                ingredients_with_qty = combine_ing_qty(
+                )
+
+            rows = [row for _, row in day_df.iterrows()]
+            meal_ingredients = [
+                combine_ing_qty(
                     row.get("RecipeIngredientParts_cleaned", ""),
                     row.get("RecipeIngredientQuantities_cleaned", "")
                 )
-            
-                # Generate image
-                sd_image = generate_recipe_image(
-                    row["Name"],
-                    ", ".join(ingredients_with_qty),
-                    steps=50
-                )
-                # Convert image to base64 for display in modal
-                buffer = BytesIO()
-                sd_image.save(buffer, format="JPEG")
-                buffer.seek(0)
-                img_str = base64.b64encode(buffer.getvalue()).decode("utf-8")
-                image_data = f"data:image/jpeg;base64,{img_str}"
-
-                # Generate image
-                ai_image = generate_food_image(
-                    row["Name"],
-                    ", ".join(ingredients_with_qty),
-                    row.get("RecipeInstructions_cleaned", row.get("Description", ""))
-                )
+                for row in rows
+            ]
+            # Queue all images together so the worker renders them in one batch (the modal polls for them)
+            image_jobs = enqueue_recipe_images(
+                request.user,
+                [(row["Name"], ", ".join(ing)) for row, ing in zip(rows, meal_ingredients)],
+            )
 
+            day_plan_records = []
+            for row, ingredients_with_qty, image_job in zip(rows, meal_ingredients, image_jobs):
                 meal_dict = {
                     "Name": row.get("Name", ""),
                     "MealType": row.get("MealType", ""),
+                    "Calories": float(row.get("Calories", 0) or 0),  # used when regenerating one meal
                     "day_of_week": row.get("day_of_week", ""),  # optional
                     "RecipeInstructions_cleaned": row.get("RecipeInstructions_cleaned", row.get("Description", "")),
                     "ingredients_with_qty": ingredients_with_qty,  # ✅ Python list
-                    "image": image_data
+                    "image": "",
+                    "image_job": image_job.id,
                 }
 
                 day_plan_records.append(meal_dict)
@@ -574,12 +577,12 @@ def dashboard(request):
             )
             current_day_plan = request.session.get("day_plan", [])
 
-            # Generate only 1 meal of the specific type
-            new_meal_df = generate_meal_plan(
+            # Replace only the requested meal; the rest of the day stays fixed
+            new_meal_df = regenerate_plan_meal(
                 user=request.user,
                 pantry_items=pantry_items,
-                days=1,
-                meals_per_day=1,
+                current_plan=current_day_plan,
+                meal_type=meal_type_to_regen,
                 exclude_names=saved_recipe_names,
                 serving_size=serving_size
             )
@@ -590,32 +593,18 @@ def dashboard(request):
                     row.get("RecipeIngredientParts_cleaned", ""),
                     row.get("RecipeIngredientQuantities_cleaned", "")
                 )
-                # Generate image
-                sd_image = generate_recipe_image(
-                    row["Name"],
-                    ", ".join(ingredients_with_qty),
-                    steps=50
-                )
-                # Convert image to base64 for display in modal
-                buffer = BytesIO()
-                sd_image.save(buffer, format="JPEG")
-                buffer.seek(0)
-                img_str = base64.b64encode(buffer.getvalue()).decode("utf-8")
-                image_data = f"data:image/jpeg;base64,{img_str}"
-
-                ai_image = generate_food_image(
-                    row["Name"],
-                    ", ".join(ingredients_with_qty),
-                    row.get("RecipeInstructions_cleaned", row.get("Description", ""))
-                )
+                # Queue image (the modal polls for it)
+                image_job = enqueue_recipe_image(request.user, row["Name"], ", ".join(ingredients_with_qty))
 
                 regenerated_meal = {
                     "Name": row.get("Name", ""),
                     "MealType": row.get("MealType", ""),
+                    "Calories": float(row.get("Calories", 0) or 0),
                     "day_of_week": row.get("day_of_week", ""),
                     "RecipeInstructions_cleaned": row.get("RecipeInstructions_cleaned", row.get("Description", "")),
                     "ingredients_with_qty": ingredients_with_qty,
-                    "image": image_data
+                    "image": "",
+                    "image_job": image_job.id,
                 }
 
                 # Replace the meal in session with regenerated one
@@ -781,4 +770,35 @@ def delete_dayplan(request, plan_id):
     plan = get_object_or_404(DayPlan, id=plan_id, user=request.user)
     plan.delete()
     messages.success(request, "Day plan deleted successfully! 🗑️")
-    return redirect('dashboard')
\ No newline at end of file
+    return redirect('dashboard')
+
+
+@staff_member_required
+def recommender_metrics(request):
+    """Per-stage timings (when a HistogramSink is configured) plus cache and catalog state."""
+    catalog = get_catalog()
+    return JsonResponse({
+        "instrumentation": metrics_enabled(),
+        "stages": metrics_snapshot(),
+        "cache": RECOMMENDATION_CACHE.stats(),
+        "catalog": {
+            "version": getattr(catalog, "version", None),
+            "recipes": len(catalog) if catalog is not None else 0,
+        },
+    })
+
+
+@login_required
+def image_job_status(request, job_id):
+    """Polled by the dashboard until the image worker has finished the job."""
+    job = get_object_or_404(ImageJob, id=job_id, user=request.user)
+    return JsonResponse(job_status(job))
+
+
+def ready(request):
+    """
+    Load-balancer readiness: 200 once the models listed in MEAL_PLAN_WARMUP
+    are loaded (and an image worker is up, with READY_REQUIRES_IMAGE_WORKER), 503 before.
+    """
+    is_ready, components = readiness()
+    return JsonResponse({"ready": is_ready, "components": components}, status=200 if is_ready else 503)
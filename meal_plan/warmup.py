@@ -0,0 +1,133 @@
+# meal_plan/warmup.py
+"""
+Load models before the first request needs them.
+
+    recommender     open the recipe catalog and run one tiny search
+    image           load the diffusion pipeline and render one small image
+
+settings.MEAL_PLAN_WARMUP lists the components a web worker warms up in
+a background thread as soon as Django is ready (MealPlanConfig.ready);
+it is off by default. ``manage.py warmup`` does the same in the
+foreground, and the image worker always warms its pipeline before
+taking jobs. The ``ready/`` endpoint answers 503 until every configured
+component is loaded, so a load balancer only routes to warm workers.
+
+The image workers are separate processes; their heartbeats (see
+image_jobs.worker_readiness) are reported as "image_worker", and gate
+readiness too when settings.READY_REQUIRES_IMAGE_WORKER is set.
+"""
+import os
+import sys
+import threading
+import time
+import traceback
+
+from django.conf import settings
+
+COMPONENTS = ("recommender", "image")
+
+_STATE = {name: {"status": "cold", "seconds": None, "error": ""} for name in COMPONENTS}
+_LOCK = threading.Lock()
+_THREAD = None
+
+
+def _warm_recommender():
+    from .ai_recommender import get_catalog, recommend_by_pantry
+
+    if get_catalog() is None:
+        raise RuntimeError("No recipe catalog could be loaded")
+    recommend_by_pantry(["salt", "egg"], top_k=1)
+
+
+def _warm_image():
+    from .utils import generate_recipe_images, get_pipe
+
+    get_pipe()
+    # a couple of steps run every kernel once at the profile's resolution
+    generate_recipe_images([("Warmup", "salt")], steps=2, batch_size=1)
+
+
+_WARMERS = {"recommender": _warm_recommender, "image": _warm_image}
+
+
+def configured_components():
+    value = getattr(settings, "MEAL_PLAN_WARMUP", ())
+    if isinstance(value, str):
+        value = value.split(",")
+    return [name.strip() for name in value if name.strip() in COMPONENTS]
+
+
+def warm_up(component):
+    """Load ``component`` in this thread and record how long it took; True when it succeeded."""
+    with _LOCK:
+        state = _STATE[component]
+        if state["status"] in ("loading", "ready"):
+            return state["status"] == "ready"
+        state.update(status="loading", error="")
+    started = time.monotonic()
+    try:
+        _WARMERS[component]()
+    except Exception as e:
+        traceback.print_exc()
+        with _LOCK:
+            _STATE[component].update(status="failed", seconds=round(time.monotonic() - started, 2),
+                                     error=f"{type(e).__name__}: {e}")
+        return False
+    seconds = round(time.monotonic() - started, 2)
+    with _LOCK:
+        _STATE[component].update(status="ready", seconds=seconds)
+    print(f"🔥 {component} warmed up in {seconds:.1f}s")
+    return True
+
+
+def start_warmup(components=None):
+    """Warm ``components`` (default: the configured ones) one after another in a daemon thread."""
+    global _THREAD
+    components = list(components if components is not None else configured_components())
+    if not components or (_THREAD is not None and _THREAD.is_alive()):
+        return _THREAD
+    _THREAD = threading.Thread(
+        target=lambda: [warm_up(name) for name in components],
+        name="meal-plan-warmup", daemon=True,
+    )
+    _THREAD.start()
+    return _THREAD
+
+
+def should_warm_up_on_start(argv=None):
+    """
+    Only processes that serve requests: a WSGI/ASGI server, or the
+    ``runserver`` child that the autoreloader actually serves from.
+    Other management commands (migrate, shell, ...) skip it.
+    """
+    argv = sys.argv if argv is None else argv
+    if not configured_components():
+        return False
+    if len(argv) > 1 and os.path.basename(argv[0]) in ("manage.py", "django-admin", "django-admin.py"):
+        if argv[1] != "runserver":
+            return False
+        return "--noreload" in argv or os.environ.get("RUN_MAIN") == "true"
+    return True
+
+
+def _image_worker_state():
+    from django.db import DatabaseError
+
+    from .image_jobs import worker_readiness
+
+    try:
+        return worker_readiness()
+    except DatabaseError as e:
+        return {"status": "unknown", "seconds": None, "error": f"{type(e).__name__}: {e}", "workers": 0}
+
+
+def readiness():
+    """(every configured component is ready, per-component status plus the image workers')."""
+    with _LOCK:
+        components = {name: dict(state) for name, state in _STATE.items()}
+    components["image_worker"] = _image_worker_state()
+    required = configured_components()
+    if getattr(settings, "READY_REQUIRES_IMAGE_WORKER", False):
+        required.append("image_worker")
+    ready = all(components[name]["status"] == "ready" for name in required)
+    return ready, components
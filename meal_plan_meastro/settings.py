@@ -141,4 +141,71 @@ STATIC_ROOT=os.path.join(BASE_DIR,'assets')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
\ No newline at end of file
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# AI recommender
+# Directory written by `manage.py export_recipe_catalog` (memory-mapped at runtime)
+RECIPE_CATALOG_DIR = os.getenv("RECIPE_CATALOG_DIR", os.path.join(BASE_DIR, 'meal_plan', 'recipe_index'))
+# How often (seconds) workers check for recipes added by `manage.py add_recipes`
+# or a compaction, and swap to the new catalog version; 0 disables polling
+RECIPE_CATALOG_POLL_SECONDS = float(os.getenv("RECIPE_CATALOG_POLL_SECONDS", 30))
+# IVF lists probed per query when `manage.py build_ann_index` has been run;
+# 0 keeps exact retrieval (see `manage.py benchmark_ann` for recall/latency)
+RECIPE_ANN_NPROBE = int(os.getenv("RECIPE_ANN_NPROBE", 0))
+# Similarity search representation: "sparse" (exact TF-IDF) or "lsa" (dense vectors
+# from `manage.py build_lsa_index`; compare them with `manage.py evaluate_lsa`)
+RECIPE_RETRIEVAL = os.getenv("RECIPE_RETRIEVAL", "sparse")
+# Unix socket of `manage.py run_recommender`; empty = rank in each worker.
+# Workers fall back to in-process ranking whenever the server is unreachable.
+RECOMMENDER_SOCKET = os.getenv("RECOMMENDER_SOCKET", "")
+RECOMMENDER_TIMEOUT = float(os.getenv("RECOMMENDER_TIMEOUT", 2))
+# Server side: search requests arriving within this window share one matrix product
+RECOMMENDER_BATCH_WINDOW_MS = float(os.getenv("RECOMMENDER_BATCH_WINDOW_MS", 2))
+RECOMMENDER_MAX_BATCH = int(os.getenv("RECOMMENDER_MAX_BATCH", 64))
+# Per-process recommendation cache (LRU size, TTL in seconds)
+RECOMMENDATION_CACHE_SIZE = int(os.getenv("RECOMMENDATION_CACHE_SIZE", 512))
+RECOMMENDATION_CACHE_TTL = int(os.getenv("RECOMMENDATION_CACHE_TTL", 600))
+# Meal-plan solver: "auto" (in-process when small enough, else CBC), "native" or "cbc"
+MEAL_PLAN_SOLVER = os.getenv("MEAL_PLAN_SOLVER", "auto")
+MEAL_PLAN_NATIVE_MAX_COMBINATIONS = int(os.getenv("MEAL_PLAN_NATIVE_MAX_COMBINATIONS", 2_000_000))
+MEAL_PLAN_SOLVE_TIME_LIMIT = float(os.getenv("MEAL_PLAN_SOLVE_TIME_LIMIT", 5))
+# Multi-day plans: days before a recipe may repeat, kcal-equivalent cost of each
+# newly needed ingredient, and the total solve budget in seconds
+MEAL_PLAN_NO_REPEAT_DAYS = int(os.getenv("MEAL_PLAN_NO_REPEAT_DAYS", 3))
+MEAL_PLAN_INGREDIENT_REUSE_WEIGHT = float(os.getenv("MEAL_PLAN_INGREDIENT_REUSE_WEIGHT", 25))
+MEAL_PLAN_WEEK_TIME_BUDGET = float(os.getenv("MEAL_PLAN_WEEK_TIME_BUDGET", 10))
+# Stage timing of the recommendation / meal-plan pipelines: comma-separated
+# sink classes, e.g. "meal_plan.instrumentation.LoggingSink,meal_plan.instrumentation.HistogramSink".
+# Empty disables it. HistogramSink percentiles are served at /metrics/recommender/ (staff only);
+# LoggingSink logs to "meal_plan.instrumentation" at INFO, only traces slower than
+# MEAL_PLAN_METRICS_SLOW_MS.
+MEAL_PLAN_METRICS_SINKS = [s for s in os.getenv("MEAL_PLAN_METRICS_SINKS", "").split(",") if s.strip()]
+MEAL_PLAN_METRICS_SLOW_MS = float(os.getenv("MEAL_PLAN_METRICS_SLOW_MS", 0))
+
+# Recipe images
+# The dashboard queues ImageJobs; `manage.py run_image_worker` generates them.
+# How often (seconds) an idle worker checks the queue
+IMAGE_WORKER_POLL_SECONDS = float(os.getenv("IMAGE_WORKER_POLL_SECONDS", 1))
+# A job still running this long after it was claimed is taken to belong to a worker
+# that died, and is queued again; keep it well above the time one batch takes
+IMAGE_JOB_STALE_SECONDS = int(os.getenv("IMAGE_JOB_STALE_SECONDS", 900))
+# How often a worker records that it is alive; /ready/ counts a worker as gone after three missed beats
+IMAGE_WORKER_HEARTBEAT_SECONDS = float(os.getenv("IMAGE_WORKER_HEARTBEAT_SECONDS", 30))
+# Prompts rendered together in one pipeline call (a day plan's three meals fit in one)
+IMAGE_BATCH_SIZE = int(os.getenv("IMAGE_BATCH_SIZE", 4))
+# Inference profile (see meal_plan/image_profiles.py): "auto" = "quality" on a GPU,
+# "cpu_fast" otherwise; compare them with `manage.py benchmark_image_profiles`
+IMAGE_PROFILE = os.getenv("IMAGE_PROFILE", "auto")
+# torch intra-op threads for CPU inference; 0 keeps torch's default (all cores)
+IMAGE_TORCH_THREADS = int(os.getenv("IMAGE_TORCH_THREADS", 0))
+# Generated images are cached under MEDIA_ROOT/image_cache, one file per prompt;
+# least recently used ones are deleted above this size (files saved recipes use are kept)
+IMAGE_CACHE_MAX_MB = float(os.getenv("IMAGE_CACHE_MAX_MB", 2048))
+# Images of jobs finished this recently are never evicted (pages polling for them,
+# recipes about to be saved); older jobs whose image is gone are rendered again
+IMAGE_CACHE_JOB_GRACE_SECONDS = int(os.getenv("IMAGE_CACHE_JOB_GRACE_SECONDS", 3600))
+# Components loaded in the background when a web worker starts: "recommender" and/or
+# "image" (comma-separated; empty = load on first use). /ready/ answers 503 until they are.
+MEAL_PLAN_WARMUP = [s for s in os.getenv("MEAL_PLAN_WARMUP", "").split(",") if s.strip()]
+# Also answer 503 on /ready/ while no image worker is up and warm
+READY_REQUIRES_IMAGE_WORKER = os.getenv("READY_REQUIRES_IMAGE_WORKER", "0") == "1"